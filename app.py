@@ -3,13 +3,32 @@ from gradio.themes import Ocean
 from gradio_pdf import PDF
 
 from pathlib import Path
-from typing import AsyncGenerator, Any
+from typing import TYPE_CHECKING, AsyncGenerator, Any
+import asyncio
 import tempfile
+import hashlib
+import threading
+import time
 import json
 
+from src.config import settings
 from src.response_structures import ResponseTypes
-from src.routing_agent import RoutingAgent
-from src.audio_transcription import AudioTranscription
+from src.audio_transcription import AudioTranscription, StreamingTranscription
+from src.document_registry import DocumentRegistry
+from src.telemetry import telemetry
+from src.scheduler import scheduler
+
+# The retrieval stack is imported on first use, or by the warm up once the page is served
+if TYPE_CHECKING:
+    from src.query_engine import StreamUpdate
+    from src.session_pool import SessionPool
+
+
+# Minimum interval between the chatbot updates while a response is streamed
+STREAM_RENDER_INTERVAL = 0.05
+
+# Scope choice targeting every indexed document
+ALL_DOCUMENTS = "*"
 
 
 class GradioInterface:
@@ -31,18 +50,43 @@ class GradioInterface:
         </div>
         """
 
-        # Query Engine Parameters
-        self.routing_agent: RoutingAgent | None = None
+        # Routing Agents of every browser session and document, constructed in the background
+        self._session_pool: "SessionPool | None" = None
+        self._session_pool_lock = threading.Lock()
+        # Metadata index of the documents in the corpus
+        self.document_registry = DocumentRegistry(settings.vector_store_path / "document_registry.json")
 
-        # Audio Transcription Model
+        # Audio Transcription, the Whisper Model is loaded on the first transcription
         self.whisper_audio = AudioTranscription()
+        # Microphone streams being transcribed, keyed by the browser session
+        self.voice_streams: dict[str, StreamingTranscription] = {}
+
+        # Summary Place holders keyed by the browser session
+        self.summaries: dict[str, str] = {}
+
+    @property
+    def session_pool(self) -> "SessionPool":
+        """Provides the pool of Routing Agents, importing the retrieval stack on first use."""
+        with self._session_pool_lock:
+            if self._session_pool is None:
+                from src.session_pool import SessionPool
 
-        # Summary Place holder
-        self.summary = ""
+                self._session_pool = SessionPool()
+                telemetry.register_collector("session_pool", self._session_pool.stats)
+            return self._session_pool
+
+    def warm_up(self) -> None:
+        """Imports the retrieval stack and starts the PDF parsing workers, so the first upload doesn't wait on them."""
+        from src.ingestion import warm_up_parse_workers
+        from src.query_engine import warm_up
+
+        _ = self.session_pool
+        warm_up()
+        warm_up_parse_workers()
 
     # ==== Interface Builder ====
-    def page(self) -> None:
-        """Implements a complete Gradio Interface using the Components."""
+    def page(self) -> gr.Blocks:
+        """Implements a complete Gradio Interface using the Components and serves it without blocking."""
 
         # The main block enclosing the entire interface.
         with gr.Blocks(**self.block_params) as demo:
@@ -61,6 +105,14 @@ class GradioInterface:
                 # PDF Viewer Section
                 with gr.Column(scale=1):
                     pdf_comp = PDF(label="Upload PDF", interactive=True)
+                    index_status = gr.Markdown()
+                    scope_box = gr.Dropdown(
+                        label="Also search across", multiselect=True, choices=self.scope_choices(), value=[],
+                        info="Previously indexed documents to compare with the uploaded one"
+                    )
+
+                    # Event Listener for indexing the document as soon as it is uploaded
+                    pdf_comp.change(fn=self.start_indexing, inputs=pdf_comp, outputs=[index_status, scope_box])
 
                 # Chatbox Section
                 with gr.Column(scale=1):
@@ -72,6 +124,10 @@ class GradioInterface:
                         show_label=False, placeholder="Chat with the Research Companion",
                         sources=["microphone"], file_types=["file"], file_count="multiple"
                     )
+                    voice_input = gr.Audio(
+                        label="Speak your question", sources=["microphone"], type="numpy", streaming=True
+                    )
+                    use_cache_box = gr.Checkbox(value=True, label="Reuse answers to similar questions")
 
                     # Columns for the buttons
                     with gr.Row():
@@ -85,22 +141,61 @@ class GradioInterface:
                     gr.on(
                         triggers=[multimodal_box.submit, submit_button.click],
                         fn=self.run_query,
-                        inputs=[pdf_comp, multimodal_box, chatbot],
+                        inputs=[pdf_comp, multimodal_box, chatbot, use_cache_box, scope_box],
                         outputs=[chatbot, multimodal_box]
                     )
 
+                    # Transcribing the microphone stream into the chat box while the user speaks
+                    voice_input.stream(
+                        fn=self.stream_voice, inputs=[voice_input, multimodal_box], outputs=multimodal_box,
+                        stream_every=settings.voice_stream_seconds
+                    )
+                    voice_input.stop_recording(
+                        fn=self.finish_voice, inputs=multimodal_box, outputs=[multimodal_box, voice_input]
+                    )
+
                     # Event Listener for the Summary
                     summary_button.click(
                         fn=self.generate_summary, inputs=chatbot, outputs=chatbot
                     ).then(
                         fn=self.output_summary_file, inputs=None, outputs=download_file
                     )
+
+            # Cancelling the queued LLM requests of a session once the user leaves
+            demo.unload(fn=self.leave_session)
         
-        # Rendering the page.
-        demo.launch()
+        # Rendering the page, serving the sessions concurrently from the event loop
+        demo.queue(default_concurrency_limit=settings.max_concurrent_requests)
+        demo.launch(prevent_thread_lock=True)
+        return demo
 
     # ==== Helper Functions ====
-    async def run_query(self, pdf_path: str, multimodal_chat: dict, history: list) -> AsyncGenerator[tuple[list, dict[str, str]], Any]:
+    def scope_choices(self) -> list[tuple[str, str]]:
+        """Provides the indexed documents of the corpus that can be searched along with the uploaded one."""
+        choices = [("All indexed documents", ALL_DOCUMENTS)]
+        choices.extend((record.display_title, record.doc_hash) for record in self.document_registry.documents())
+        return choices
+
+    async def start_indexing(self, pdf_path: str | None, request: gr.Request) -> AsyncGenerator[tuple[str, dict], Any]:
+        """Indexes an uploaded document in the background and streams its progress."""
+        if not pdf_path:
+            yield "", gr.update()
+            return
+
+        pooled_session = await self.session_pool.ensure(request.session_hash, pdf_path)
+        while not pooled_session.done:
+            yield f"⏳ {pooled_session.progress}", gr.update()
+            await asyncio.wait([pooled_session.task], timeout=0.5)
+
+        if pooled_session.failed:
+            yield "⚠️ The document couldn't be indexed. Please upload it again.", gr.update()
+        else:
+            yield "✅ Document indexed, ask away.", gr.update(choices=self.scope_choices())
+
+    async def run_query(
+        self, pdf_path: str, multimodal_chat: dict, history: list, use_cache: bool, scope: list[str] | None,
+        request: gr.Request
+    ) -> AsyncGenerator[tuple[list, dict[str, str]], Any]:
         """Propagates the given query through the AI agent."""
         
         # If no multimodal_chat was sent
@@ -122,62 +217,122 @@ class GradioInterface:
             user_prompt = multimodal_chat["text"]
         # Applying Whisper for Audio Transcription
         elif self.whisper_audio.check_audio(multimodal_chat["files"]):
-            transcription = self.whisper_audio.transcribe(multimodal_chat["files"])
-            history.append({"role": "user", "content": transcription[0]["text"]})
-            user_prompt = transcription[0]["text"]
+            with telemetry.tagged(session=request.session_hash), scheduler.session(request.session_hash):
+                user_prompt = await self.whisper_audio.atranscribe(multimodal_chat["files"])
+            history.append({"role": "user", "content": user_prompt})
 
         # Begining Thinking Process
         history.append({"role": "assistant", "content": "Thinking ..."})
         yield history, {"text": ""}
 
-        # If the query engine was not created yet or the PDF has changed
-        if self.routing_agent is None or self.routing_agent.query_engine.file_path != Path(pdf_path):
-            self.routing_agent = RoutingAgent(pdf_path)
+        # Waiting on the engine of the session, started on upload unless it is already complete
+        pooled_session = await self.session_pool.ensure(request.session_hash, pdf_path)
+        while not pooled_session.done:
+            history[-1] = {"role": "assistant", "content": f"Thinking ... {pooled_session.progress}"}
+            yield history, {"text": ""}
+            await asyncio.wait([pooled_session.task], timeout=0.5)
 
-        # Generating a response
-        response_json, response_type = await self.routing_agent.resolve_route(user_prompt)
-        response_data = json.loads(str(response_json))
+        routing_agent = pooled_session.agent
+        if routing_agent is None:
+            print(f"Error during indexing: {pooled_session.error}")
+            history[-1] = {"role": "assistant", "content": "Sorry, the document couldn't be indexed. Please upload it again."}
+            yield history, {"text": ""}
+            return
+        history[-1] = {"role": "assistant", "content": "Thinking ..."}
+        yield history, {"text": ""}
+
+        # Targeting the uploaded document along with the selected documents of the corpus
+        scope = scope or []
+        query_engine = routing_agent.query_engine
+        query_engine.set_scope(None if ALL_DOCUMENTS in scope else [query_engine.doc_hash, *scope])
+
+        # Streaming the response, throttling the chatbot updates
+        last_render = 0.0
+        with telemetry.tagged(session=request.session_hash, doc=query_engine.doc_hash), \
+                scheduler.session(request.session_hash):
+            async for update, response_type in routing_agent.stream_route(user_prompt, use_cache=use_cache):
+                if not update.done and time.perf_counter() - last_render < STREAM_RENDER_INTERVAL:
+                    continue
+                last_render = time.perf_counter()
+
+                rendered_response = self.render_response(update, response_type)
+                if rendered_response is not None:
+                    history[-1] = {"role": "assistant", "content": rendered_response}
+                    yield history, {"text": ""}
+
+        # Persisting the chat memory so the session can be rehydrated once evicted
+        await self.session_pool.checkpoint(pooled_session)
+        yield history, {"text": ""}
+        return
+
+    async def stream_voice(self, chunk: tuple | None, multimodal_chat: dict, request: gr.Request) -> dict:
+        """Transcribes a chunk of the microphone stream, showing the transcript so far in the chat box."""
+        if chunk is None:
+            return multimodal_chat
+        voice_stream = self.voice_streams.setdefault(request.session_hash, StreamingTranscription(self.whisper_audio))
+        sample_rate, audio = chunk
+        transcript = await voice_stream.feed(sample_rate, audio)
+        return {"text": transcript, "files": multimodal_chat.get("files", [])}
+
+    async def finish_voice(self, multimodal_chat: dict, request: gr.Request) -> tuple[dict, None]:
+        """Completes the transcript of the microphone stream once the recording stops."""
+        voice_stream = self.voice_streams.pop(request.session_hash, None)
+        if voice_stream is None:
+            return multimodal_chat, None
+        transcript = await voice_stream.finish()
+        return {"text": transcript, "files": multimodal_chat.get("files", [])}, None
+
+    def render_response(self, update: "StreamUpdate", response_type: ResponseTypes) -> str | None:
+        """Renders a partial or final structured response as markdown.
+
+        The answer is rendered as it streams, the follow-up questions and the citations once their sections are complete."""
+        response_data = update.data
 
         if response_type == ResponseTypes.RESEARCH:
             # Primary Answer
+            if "answer" not in response_data and not update.done:
+                return "Thinking ..."
             answer = response_data.get("answer", "Sorry, I couldn't generate an answer could you please try again.")
 
             # Followup Questions
-            follow_up_questions = response_data.get("follow_up_questions", "Sorry no follow-up questions were found.")
             follow_up_questions_md = ""
-            if follow_up_questions and isinstance(follow_up_questions, list):
-                follow_up_questions_md = "\n\n---\n**Follow-Up Chain of Thought**\n"
-                for question in follow_up_questions:
-                    follow_up_questions_md += f"- {question}\n"
+            if "follow_up_questions" in update.complete_keys:
+                follow_up_questions = response_data.get("follow_up_questions", "Sorry no follow-up questions were found.")
+                if follow_up_questions and isinstance(follow_up_questions, list):
+                    follow_up_questions_md = "\n\n---\n**Follow-Up Chain of Thought**\n"
+                    for question in follow_up_questions:
+                        follow_up_questions_md += f"- {question}\n"
 
             # Citations
-            citations = response_data.get("citations", [])
             citations_markdown = ""
-            if citations:
-                citations_markdown = "\n\n---\n**Sources & Citations**\n"
-                for idx, citation in enumerate(citations):
-                    source_text = citation.get('source_text', 'N/A').replace('\n', ' ')
-                    citations_markdown += ( 
-                        f"**{idx + 1}. Source from Page {citation.get('page_number', 'N/A')}:**\n" 
-                        f"> {source_text}\n\n" 
-                        f"*Simplified Explanation:*\n{citation.get('simplification', 'N/A')}\n\n" 
-                    )
+            if "citations" in update.complete_keys:
+                citations = response_data.get("citations", [])
+                if citations:
+                    citations_markdown = "\n\n---\n**Sources & Citations**\n"
+                    for idx, citation in enumerate(citations):
+                        source_text = citation.get('source_text', 'N/A').replace('\n', ' ')
+                        document = f"{citation['document_title']}, " if citation.get('document_title') else ""
+                        citations_markdown += ( 
+                            f"**{idx + 1}. Source from {document}Page {citation.get('page_number', 'N/A')}:**\n" 
+                            f"> {source_text}\n\n" 
+                            f"*Simplified Explanation:*\n{citation.get('simplification', 'N/A')}\n\n" 
+                        )
             
-            final_response = f"{answer}{follow_up_questions_md}{citations_markdown}\n"
-            history[-1] = {"role": "assistant", "content": final_response}
+            return f"{answer}{follow_up_questions_md}{citations_markdown}\n"
 
         elif response_type == ResponseTypes.SIMPLE:
-            answer = response_data.get("answer", "Sorry, no answer was found.")
-            history[-1] = {"role": "assistant", "content": answer}
+            if "answer" not in response_data and not update.done:
+                return "Thinking ..."
+            return response_data.get("answer", "Sorry, no answer was found.")
 
-        yield history, {"text": ""}
-        return
+        return None
     
-    async def generate_summary(self, history: list) -> AsyncGenerator[list[dict[str, str]], Any]:
-        """Generates a summary by running inference on the model for the entire chat."""
+    async def generate_summary(self, history: list, request: gr.Request) -> AsyncGenerator[list[dict[str, str]], Any]:
+        """Generates the summary of the entire chat by merging the rolling summary of the session."""
+        routing_agent = self.session_pool.latest(request.session_hash)
         
         # If the summary is being generated before chatting
-        if not self.routing_agent:
+        if not routing_agent:
             history.append({
                 "role": "assistant", 
                 "content": "Failed to generate a Summary. Please begin a Conversation or Upload a document."
@@ -191,28 +346,48 @@ class GradioInterface:
         yield history
 
         # Generating a summary
-        response_json, _ = await self.routing_agent.resolve_route(
-            "Generate a concept-driven summary for our entire conversation"
-        )
+        with telemetry.tagged(session=request.session_hash, doc=routing_agent.query_engine.doc_hash), \
+                scheduler.session(request.session_hash):
+            response_json, _ = await routing_agent.resolve_route(
+                "Generate a concept-driven summary for our entire conversation"
+            )
         response_data = json.loads(str(response_json))
         
         # Storing the summary for usage in the follow-up method
-        self.summary = response_data.get("title", "Sorry the summary title couldn't be processed.")
-        self.summary += "\n\n" + response_data.get("summary", "Sorry the summary couldn't be processed.")
+        summary = response_data.get("title", "Sorry the summary title couldn't be processed.")
+        summary += "\n\n" + response_data.get("summary", "Sorry the summary couldn't be processed.")
+        self.summaries[request.session_hash] = summary
 
-        if "Sorry" in self.summary:
+        if "Sorry" in summary:
             history[-1] = {"role": "assistant", "content": "Sorry the Summary couldn't be generated. Please try again"}
         else:
             history[-1] = {"role": "assistant", "content": "Summary generated successfully. You can download the markdown file now."}
         yield history
         return
     
-    def output_summary_file(self) -> str:
+    def leave_session(self, request: gr.Request) -> None:
+        """Cancels the follow-up prefetch and the requests of a session still queued for Ollama once its page is
+        closed, and drops its microphone stream and summary."""
+        self.voice_streams.pop(request.session_hash, None)
+        self.summaries.pop(request.session_hash, None)
+
+        # A session closed before any upload never created the pool
+        if self._session_pool is not None:
+            routing_agent = self._session_pool.latest(request.session_hash)
+            if routing_agent is not None:
+                routing_agent.cancel_prefetch()
+        cancelled = scheduler.cancel_session(request.session_hash)
+        if cancelled:
+            print(f"Cancelled {cancelled} queued requests of the session {request.session_hash}")
+
+    def output_summary_file(self, request: gr.Request) -> str:
         """Utilises the generated summary and output a temporary file."""
 
-        # Creating a temporary file
-        temp_dir = Path(tempfile.gettempdir())
+        # Creating a temporary file per session
+        session_key = hashlib.sha256(request.session_hash.encode("utf-8")).hexdigest()[:16]
+        temp_dir = Path(tempfile.gettempdir()) / "research_companion" / session_key
+        temp_dir.mkdir(parents=True, exist_ok=True)
         temp_file = temp_dir / "summary.md"
-        temp_file.write_text(self.summary, encoding="utf-8")
+        temp_file.write_text(self.summaries.get(request.session_hash, ""), encoding="utf-8")
 
         return str(temp_file)
@@ -0,0 +1,66 @@
+"""Reference baselines of the regression benchmarks.
+
+A baseline is committed next to its benchmark along with a description of the machine it was recorded on. The
+fake Ollama server takes the models out of the measurement, but the latencies still scale with the CPU, so a CI
+runner records its own baseline with `--update-baseline` on the first run and commits or caches it. Until then, the
+regressions against a baseline recorded on another machine are reported without failing the run."""
+from pathlib import Path
+import json
+import os
+import platform
+import sys
+
+
+def describe_machine() -> dict[str, str | int | None]:
+    """Describes the machine the metrics are measured on."""
+    processor = platform.processor() or platform.machine()
+    cpuinfo_path = Path("/proc/cpuinfo")
+    if cpuinfo_path.exists():
+        for line in cpuinfo_path.read_text(encoding="utf-8").splitlines():
+            if line.startswith("model name"):
+                processor = line.split(":", 1)[1].strip()
+                break
+    memory_gib = None
+    if hasattr(os, "sysconf") and "SC_PHYS_PAGES" in os.sysconf_names:
+        memory_gib = round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3)
+    return {
+        "platform": platform.platform(terse=True),
+        "processor": processor,
+        "cpus": os.cpu_count(),
+        "memory_gib": memory_gib,
+        "python": platform.python_version(),
+    }
+
+
+def write_baseline(baseline_path: Path, baseline: dict) -> None:
+    """Stores the baseline along with the description of the machine."""
+    baseline_path.write_text(json.dumps({**baseline, "machine": describe_machine()}, indent=4), encoding="utf-8")
+    print(f"Baseline written to {baseline_path}")
+
+
+def recorded_here(baseline: dict) -> bool:
+    """Checks if a baseline was recorded on this machine."""
+    return baseline.get("machine") == describe_machine()
+
+
+def read_baseline(baseline_path: Path) -> dict:
+    """Reads a baseline, failing the run when there is none so a missing baseline can't pass CI."""
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}, record one with --update-baseline")
+        sys.exit(2)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if not recorded_here(baseline):
+        print(f"Warning: the baseline was recorded on another machine: {json.dumps(baseline.get('machine'))}")
+    return baseline
+
+
+def report_regressions(baseline: dict, regressions: list[str], tolerance: float) -> None:
+    """Prints the regressions against a baseline, failing the run only when the baseline was recorded on this machine."""
+    if not regressions:
+        print(f"No regression beyond {tolerance:.0%} of the baseline")
+        return
+    print(f"Regressed beyond {tolerance:.0%} of the baseline:\n  " + "\n  ".join(regressions))
+    if not recorded_here(baseline):
+        print("Not failing the run, the baseline was recorded on another machine: record one with --update-baseline")
+        return
+    sys.exit(1)
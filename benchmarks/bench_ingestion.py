@@ -0,0 +1,124 @@
+"""Benchmarks the parallel ingestion pipeline against the original `VectorStoreIndex.from_documents` path.
+
+Both paths embed a synthetic PDF through the fake Ollama server into an in-memory Chroma collection.
+
+Usage:
+    python -m benchmarks.bench_ingestion --pages 60
+"""
+import os
+
+# Defaults allowing the benchmark to run without a .env file
+os.environ.setdefault("LLM_MODEL_NAME", "fake-llm")
+os.environ.setdefault("EMBEDDING_MODEL_NAME", "fake-embed")
+os.environ.setdefault("VECTOR_STORE_PATH", "./vector_store")
+os.environ.setdefault("ASSET_PATH", "./assets")
+os.environ.setdefault("TOP_K", "5")
+
+from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.readers.file import PyMuPDFReader
+from llama_index.vector_stores.chroma import ChromaVectorStore
+
+from benchmarks.fake_ollama import FakeOllamaConfig, FakeOllamaServer
+from src.config import settings
+from src.embeddings import BatchedOllamaEmbedding
+from src.ingestion import IngestionPipeline, warm_up_parse_workers
+
+from pathlib import Path
+import argparse
+import random
+import tempfile
+import time
+import uuid
+import chromadb
+import fitz
+
+
+WORDS = (
+    "attention transformer gradient descent latent variable posterior likelihood convolution kernel "
+    "embedding retrieval benchmark dataset baseline ablation regularisation optimiser entropy"
+).split()
+
+
+def build_synthetic_pdf(path: Path, pages: int, words_per_page: int = 600) -> None:
+    """Writes a PDF with pseudo-random academic text on every page."""
+    rng = random.Random(0)
+    with fitz.open() as pdf:
+        for _ in range(pages):
+            page = pdf.new_page()
+            text = " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+            page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=7)
+        pdf.save(path)
+
+
+def new_vector_store(client: chromadb.ClientAPI) -> ChromaVectorStore:
+    collection = client.get_or_create_collection(f"bench_{uuid.uuid4().hex[:8]}")
+    return ChromaVectorStore(chroma_collection=collection)
+
+
+def run_baseline(pdf_path: Path, base_url: str, client: chromadb.ClientAPI) -> tuple[int, float]:
+    """The original path, reading with PyMuPDFReader and embedding one chunk per request."""
+    start = time.perf_counter()
+    documents = PyMuPDFReader().load_data(file_path=pdf_path)
+    storage_context = StorageContext.from_defaults(vector_store=new_vector_store(client))
+    VectorStoreIndex.from_documents(
+        documents, embed_model=OllamaEmbedding(settings.embedding_model_name, base_url=base_url),
+        storage_context=storage_context,
+        transformations=[SentenceSplitter(chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)]
+    )
+    elapsed = time.perf_counter() - start
+    return storage_context.vector_store._collection.count(), elapsed
+
+
+def run_pipeline(pdf_path: Path, base_url: str, client: chromadb.ClientAPI) -> tuple[int, float]:
+    """The parallel, batched ingestion pipeline."""
+    start = time.perf_counter()
+    pipeline = IngestionPipeline(
+        embed_model=BatchedOllamaEmbedding(
+            settings.embedding_model_name, base_url=base_url, embed_batch_size=settings.embed_batch_size
+        ),
+        vector_store=new_vector_store(client),
+        splitter=SentenceSplitter(chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+    )
+    report = pipeline.run(pdf_path)
+    elapsed = time.perf_counter() - start
+    print(f"  {report.summary()}")
+    return report.chunks, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks document ingestion against a fake Ollama server.")
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--request-latency", type=float, default=0.05)
+    parser.add_argument("--item-latency", type=float, default=0.005)
+    parser.add_argument("--max-parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        request_latency=args.request_latency, item_latency=args.item_latency, max_parallel=args.max_parallel
+    )
+    client = chromadb.EphemeralClient()
+
+    with tempfile.TemporaryDirectory() as temp_dir, FakeOllamaServer(config=config) as server:
+        pdf_path = Path(temp_dir) / "synthetic.pdf"
+        build_synthetic_pdf(pdf_path, args.pages)
+
+        print("Baseline (from_documents, one request per chunk)")
+        baseline_chunks, baseline_seconds = run_baseline(pdf_path, server.base_url, client)
+        print(f"  {baseline_chunks} chunks in {baseline_seconds:.2f}s ({baseline_chunks / baseline_seconds:.1f} chunks/sec)")
+
+        # The parsing workers are started once per process, in the application at startup
+        warm_up_start = time.perf_counter()
+        warm_up_parse_workers()
+        print(f"Parsing workers started in {time.perf_counter() - warm_up_start:.2f}s (once per process, excluded)")
+
+        print("Pipeline (parallel parsing, batched concurrent embedding, bulk write)")
+        pipeline_chunks, pipeline_seconds = run_pipeline(pdf_path, server.base_url, client)
+        print(f"  {pipeline_chunks} chunks in {pipeline_seconds:.2f}s ({pipeline_chunks / pipeline_seconds:.1f} chunks/sec)")
+
+        print(f"Speedup: {baseline_seconds / pipeline_seconds:.1f}x | requests served: {server.request_counts}")
+
+
+if __name__ == "__main__":
+    main()
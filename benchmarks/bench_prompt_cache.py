@@ -0,0 +1,122 @@
+"""Benchmarks the prompt prefix reused across the turns of a conversation by the stable prompt layout.
+
+A conversation runs over a synthetic PDF through the Query Engine, and every turn is sent to two fake Ollama
+servers counting the prompt prefix shared with the previous turn. One receives the stable layout of the Query
+Engine (instructions and schema, history, then the context and the question) and the other the former layout
+with the retrieved context ahead of the history.
+
+Usage:
+    python -m benchmarks.bench_prompt_cache --turns 12
+"""
+import os
+import tempfile
+
+# Defaults allowing the benchmark to run without a .env file
+os.environ.setdefault("LLM_MODEL_NAME", "fake-llm")
+os.environ.setdefault("EMBEDDING_MODEL_NAME", "fake-embed")
+os.environ.setdefault("VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="bench_prompt_cache_"))
+os.environ.setdefault("ASSET_PATH", "./assets")
+os.environ.setdefault("TOP_K", "5")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.llms.ollama import Ollama
+
+from benchmarks.bench_ingestion import build_synthetic_pdf
+from benchmarks.fake_ollama import FakeOllamaConfig, FakeOllamaServer
+from src.application import create_application
+from src.config import settings
+from src.query_engine import QueryEngine
+from src.response_structures import ResponseTypes
+
+from pathlib import Path
+import argparse
+import time
+
+
+QUESTIONS = [
+    "What is the main contribution of the paper?",
+    "How does the attention mechanism work?",
+    "Which datasets are used for the benchmark?",
+    "How is the gradient descent regularised?",
+    "What does the ablation show about the kernel?",
+    "How is the posterior likelihood estimated?",
+    "Which baseline is the model compared to?",
+    "What is the role of the latent variable?",
+    "How is the entropy of the optimiser measured?",
+    "What are the limitations of the retrieval?",
+]
+
+
+def legacy_messages(messages: list[ChatMessage], context_str: str, question: str) -> list[ChatMessage]:
+    """Rearranges the messages of a turn into the former layout, the context following the system instructions."""
+    return [
+        ChatMessage(role="system", content=f"{messages[0].content}\nContext from the document:\n{context_str}"),
+        *messages[1:-1],
+        ChatMessage(role="user", content=question)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the prompt prefix reuse against fake Ollama servers.")
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--prefill-latency", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        request_latency=0.0, item_latency=0.0, first_token_latency=0.0, token_latency=0.0,
+        prefill_latency=args.prefill_latency
+    )
+    with FakeOllamaServer(config=config) as stable_server, FakeOllamaServer(config=config) as legacy_server:
+        create_application(settings.model_copy(
+            update={"ollama_base_url": stable_server.base_url, "embedding_cache_enabled": False}
+        ))
+        stable_llm = Ollama(
+            model=settings.llm_model_name, base_url=stable_server.base_url, request_timeout=60.0, context_window=30000
+        )
+        legacy_llm = Ollama(
+            model=settings.llm_model_name, base_url=legacy_server.base_url, request_timeout=60.0, context_window=30000
+        )
+
+        pdf_path = Path(settings.vector_store_path) / "synthetic.pdf"
+        build_synthetic_pdf(pdf_path, args.pages, args.words_per_page)
+        query_engine = QueryEngine(str(pdf_path))
+
+        timings = {"stable": 0.0, "legacy": 0.0}
+        response_schema = query_engine.generation_model(ResponseTypes.RESEARCH).model_json_schema()
+        for turn in range(args.turns):
+            question = QUESTIONS[turn % len(QUESTIONS)]
+            retrieved_nodes = query_engine.custom_retriever.retrieve(question)
+            messages, citation_context, context_report = query_engine.build_messages(
+                question, ResponseTypes.RESEARCH, retrieved_nodes
+            )
+
+            start = time.perf_counter()
+            response = stable_llm.chat(messages, format=response_schema)
+            timings["stable"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            legacy_llm.chat(legacy_messages(messages, citation_context.context_str(), question), format=response_schema)
+            timings["legacy"] += time.perf_counter() - start
+
+            generated_output = query_engine.generation_model(ResponseTypes.RESEARCH).model_validate_json(
+                response.message.content
+            )
+            query_engine.record_turn(question, query_engine.finalize_response(
+                ResponseTypes.RESEARCH, generated_output, citation_context
+            ), context_report)
+
+        print(f"{args.turns} turns, prefill latency {args.prefill_latency * 1000:.2f}ms per uncached token")
+        print(f"  Last turn: {query_engine.last_context_report.summary()}")
+        for name, server in (("stable", stable_server), ("legacy", legacy_server)):
+            print(
+                f"  {name.title()} layout: {server.reused_prompt_tokens}/{server.prompt_tokens} prompt tokens reused "
+                f"({server.prompt_reuse:.0%}) | {(server.prompt_tokens - server.reused_prompt_tokens) / args.turns:.0f} "
+                f"prefilled per turn | {timings[name]:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
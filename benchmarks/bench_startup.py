@@ -0,0 +1,162 @@
+"""Benchmarks the startup of the application: the import time of the interface and the time to its first page.
+
+The import time of `app` is read from `python -X importtime` in a fresh interpreter, along with its slowest
+imports and any of the heavy modules deferred to the first session that crept back into the startup. The time to
+first page launches `main.py` on a free port and polls it until the page is served. Both are the median over the
+runs, and the run fails when a metric regresses beyond the tolerance of the stored baseline or when there is none.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5 --update-baseline
+    python -m benchmarks.bench_startup --runs 5
+"""
+import os
+import tempfile
+
+# Defaults allowing the benchmark to run without a .env file
+os.environ.setdefault("LLM_MODEL_NAME", "fake-llm")
+os.environ.setdefault("EMBEDDING_MODEL_NAME", "fake-embed")
+os.environ.setdefault("VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="bench_startup_"))
+os.environ.setdefault("ASSET_PATH", "./assets")
+os.environ.setdefault("TOP_K", "5")
+os.environ.setdefault("GRADIO_ANALYTICS_ENABLED", "False")
+
+from benchmarks.baselines import read_baseline, report_regressions, write_baseline
+
+from pathlib import Path
+import argparse
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+# Root of the repository the application is launched from
+ROOT_PATH = Path(__file__).parent.parent
+# Modules deferred to the first session, which serving the interface must not import
+DEFERRED_MODULES = ("llama_index.core", "llama_index.llms.ollama", "chromadb", "faster_whisper")
+# Metrics compared against the baseline, lower is better for all of them
+BASELINE_METRICS = ("import_ms", "first_page_ms", "deferred_imports")
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "startup_baseline.json"
+
+
+def parse_importtime(output: str) -> list[tuple[int, str, float]]:
+    """Provides the depth, the name and the cumulative milliseconds of every import in `-X importtime` output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative) / 1000))
+    return imports
+
+
+def measure_import(module: str) -> list[tuple[int, str, float]]:
+    """Imports a module in a fresh interpreter, providing its import tree."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT_PATH, capture_output=True, text=True,
+        check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_page(timeout: float) -> float:
+    """Launches the application, providing the milliseconds until its page is served."""
+    port = free_port()
+    start = time.perf_counter()
+    # A session of its own, so the PDF parsing workers are stopped along with the application
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=ROOT_PATH, env={**os.environ, "GRADIO_SERVER_PORT": str(port)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"main.py exited with code {process.returncode} before serving its page")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1.0) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"The page wasn't served within {timeout:.0f}s")
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def run_benchmark(args: argparse.Namespace) -> tuple[dict[str, float], list[tuple[str, float]], list[str]]:
+    """Provides the median metrics over the runs, the slowest imports of the last run and the deferred modules it
+    imported."""
+    import_times, first_page_times = [], []
+    for _ in range(args.runs):
+        imports = measure_import("app")
+        import_times.append(next(ms for depth, name, ms in imports if depth == 0 and name == "app"))
+        first_page_times.append(measure_first_page(args.timeout))
+
+    slowest = sorted(((name, ms) for depth, name, ms in imports if depth == 1), key=lambda item: -item[1])
+    imported = {name for _, name, _ in imports}
+    deferred = [module for module in DEFERRED_MODULES if module in imported]
+    metrics = {
+        "import_ms": statistics.median(import_times),
+        "first_page_ms": statistics.median(first_page_times),
+        "deferred_imports": len(deferred),
+    }
+    return metrics, slowest[:args.top], deferred
+
+
+def find_regressions(metrics: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Lists the metrics worse than the baseline by more than the tolerance, and any deferred module imported."""
+    regressions = []
+    for metric in BASELINE_METRICS:
+        if metric not in baseline:
+            continue
+        limit = baseline[metric] * (1 + tolerance)
+        if metrics[metric] > limit or (metric == "deferred_imports" and metrics[metric] > baseline[metric]):
+            regressions.append(f"{metric}: {metrics[metric]:.0f} against a baseline of {baseline[metric]:.0f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the import time and the time to first page.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the first page.")
+    parser.add_argument("--top", type=int, default=10, help="Number of the slowest imports listed.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction a metric may regress by.")
+    parser.add_argument("--update-baseline", action="store_true", help="Stores the results as the new baseline.")
+    args = parser.parse_args()
+
+    metrics, slowest, deferred = run_benchmark(args)
+    print(
+        f"Startup over {args.runs} runs\n"
+        f"  Import of app  {metrics['import_ms']:.0f}ms\n"
+        f"  First page     {metrics['first_page_ms']:.0f}ms\n"
+        f"  Deferred modules imported: {', '.join(deferred) or 'none'}\n"
+        f"  Slowest imports:\n" + "\n".join(f"    {name:<32} {ms:8.0f}ms" for name, ms in slowest)
+    )
+
+    if args.update_baseline:
+        write_baseline(args.baseline, {"metrics": metrics})
+        return
+
+    baseline = read_baseline(args.baseline)
+    report_regressions(baseline, find_regressions(metrics, baseline["metrics"], args.tolerance), args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Benchmarks the quantized vector store against the Chroma baseline.
+
+Synthetic clustered embeddings of the dimension of bge-m3 are written to a Chroma collection and to the int8 and
+float16 quantized stores. Every backend is then opened in a fresh process, which runs the queries and reports the
+time to open the store, the query latency, the recall@k against an exact float32 search and the resident memory it
+grew by.
+
+Usage:
+    python -m benchmarks.bench_vector_store --chunks 20000 --queries 200
+"""
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery
+from llama_index.vector_stores.chroma import ChromaVectorStore
+
+from src.quantized_store import QuantizedVectorStore
+
+from pathlib import Path
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import chromadb
+import numpy as np
+
+
+# Backends measured, the quantized ones with and without the exact rescoring
+BACKENDS = {
+    "chroma": None,
+    "int8": ("int8", 4),
+    "int8 (no rescoring)": ("int8", 1),
+    "float16": ("float16", 4),
+}
+# Chunks written to Chroma per call, below its maximum batch size
+CHROMA_BATCH_SIZE = 4000
+
+
+def build_dataset(chunks: int, queries: int, dimension: int, top_k: int) -> dict[str, np.ndarray]:
+    """Generates unit embeddings clustered around topics, queries near stored chunks and their exact neighbours."""
+    rng = np.random.default_rng(0)
+    centroids = rng.normal(size=(max(chunks // 100, 1), dimension)).astype(np.float32)
+    vectors = centroids[rng.integers(len(centroids), size=chunks)] + 0.6 * rng.normal(size=(chunks, dimension))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+    query_vectors = vectors[rng.integers(chunks, size=queries)] + 0.3 * rng.normal(size=(queries, dimension))
+    query_vectors = (query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)).astype(np.float32)
+    neighbours = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :top_k]
+    return {"vectors": vectors, "queries": query_vectors, "neighbours": neighbours}
+
+
+def new_nodes(vectors: np.ndarray, start: int, stop: int) -> list[TextNode]:
+    return [
+        TextNode(id_=f"chunk-{idx}", text=f"Synthetic chunk {idx}", metadata={"doc_hash": f"doc-{idx % 50}"},
+                 embedding=vectors[idx].tolist())
+        for idx in range(start, stop)
+    ]
+
+
+def open_store(backend: str, store_path: Path) -> BasePydanticVectorStore:
+    if BACKENDS[backend] is None:
+        client = chromadb.PersistentClient(path=str(store_path / "chroma"))
+        return ChromaVectorStore(chroma_collection=client.get_or_create_collection("corpus"))
+    quantization, rescore_multiplier = BACKENDS[backend]
+    return QuantizedVectorStore(store_path / quantization, quantization, rescore_multiplier)
+
+
+def write_stores(store_path: Path, vectors: np.ndarray) -> dict[str, float]:
+    """Writes the embeddings to every backend, provides the seconds each write took."""
+    timings = {}
+    for backend in ("chroma", "int8", "float16"):
+        vector_store = open_store(backend, store_path)
+        start = time.perf_counter()
+        for batch_start in range(0, len(vectors), CHROMA_BATCH_SIZE):
+            vector_store.add(new_nodes(vectors, batch_start, min(batch_start + CHROMA_BATCH_SIZE, len(vectors))))
+        timings[backend] = time.perf_counter() - start
+    return timings
+
+
+def disk_bytes(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def rss_bytes() -> int:
+    """Provides the resident memory of the process, including the pages of the memory-mapped files it touched."""
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(backend: str, store_path: Path, top_k: int) -> dict:
+    """Opens a backend and runs the queries, run in a fresh process so its memory is measured in isolation."""
+    query_vectors = np.load(store_path / "queries.npy")
+    neighbours = np.load(store_path / "neighbours.npy")
+    baseline_rss = rss_bytes()
+
+    start = time.perf_counter()
+    vector_store = open_store(backend, store_path)
+    open_seconds = time.perf_counter() - start
+
+    latencies, recalls = [], []
+    for query_vector, expected in zip(query_vectors, neighbours):
+        start = time.perf_counter()
+        result = vector_store.query(VectorStoreQuery(query_embedding=query_vector.tolist(), similarity_top_k=top_k))
+        latencies.append(time.perf_counter() - start)
+        retrieved = {int(node_id.rsplit("-", 1)[1]) for node_id in result.ids}
+        recalls.append(len(retrieved.intersection(expected.tolist())) / top_k)
+
+    return {
+        "open_seconds": open_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "recall": float(np.mean(recalls)),
+        "rss_bytes": rss_bytes() - baseline_rss,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the quantized vector store against Chroma.")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--measure", choices=list(BACKENDS), help=argparse.SUPPRESS)
+    parser.add_argument("--store-path", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.store_path, args.top_k)))
+        return
+
+    store_path = Path(tempfile.mkdtemp(prefix="bench_vector_store_"))
+    dataset = build_dataset(args.chunks, args.queries, args.dimension, args.top_k)
+    np.save(store_path / "queries.npy", dataset["queries"])
+    np.save(store_path / "neighbours.npy", dataset["neighbours"])
+    write_timings = write_stores(store_path, dataset["vectors"])
+
+    print(f"{args.chunks} chunks of {args.dimension} dimensions, {args.queries} queries, recall@{args.top_k}")
+    for backend in BACKENDS:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_vector_store", "--measure", backend,
+             "--store-path", str(store_path), "--top-k", str(args.top_k)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        disk_path = store_path / ("chroma" if BACKENDS[backend] is None else BACKENDS[backend][0])
+        write_seconds = write_timings["chroma" if BACKENDS[backend] is None else BACKENDS[backend][0]]
+        print(
+            f"  {backend:<20} recall {result['recall']:.3f} | p50 {result['p50_ms']:.2f}ms p95 {result['p95_ms']:.2f}ms | "
+            f"open {result['open_seconds']:.2f}s | RSS +{result['rss_bytes'] / 2**20:.0f}MiB | "
+            f"disk {disk_bytes(disk_path) / 2**20:.0f}MiB | write {write_seconds:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""A local stand-in for the Ollama server used by the benchmarks.
+
+It serves deterministic embeddings with a configurable per-request and per-input latency, and streams
+canned structured chat responses matching the requested JSON schema at a configurable token rate, so the
+ingestion and the query pipelines can be benchmarked without a running Ollama or a GPU. Like the prompt cache
+of Ollama, the prefix a chat prompt shares with the previous prompt of the same model is not prefilled again,
+and the reused prefix tokens are counted.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11555 --request-latency 0.05 --item-latency 0.005
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dataclasses import dataclass
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+
+
+@dataclass
+class FakeOllamaConfig:
+    """Latency and shape parameters of the fake server."""
+    embedding_dim: int = 1024
+    request_latency: float = 0.05
+    item_latency: float = 0.005
+    max_parallel: int = 4
+    first_token_latency: float = 0.2
+    token_latency: float = 0.01
+    # Prefill latency per prompt token not served from the prompt cache
+    prefill_latency: float = 0.0005
+    # Characters per streamed and prompt token
+    token_size: int = 4
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """Provides a deterministic unit-length embedding derived from the hash of the text."""
+    values: list[float] = []
+    counter = 0
+    while len(values) < dim:
+        block = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(value / 2**31 - 1.0 for value in struct.unpack("<8I", block))
+        counter += 1
+    norm = sum(value * value for value in values[:dim]) ** 0.5 or 1.0
+    return [value / norm for value in values[:dim]]
+
+
+FILLER_WORDS = "the model attends to every token of the sequence using scaled dot product attention".split()
+
+
+def fake_structured_response(schema: dict, seed: str, definitions: dict | None = None) -> object:
+    """Provides a deterministic value matching a JSON schema, filling the strings with filler text."""
+    definitions = definitions if definitions is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        schema = definitions[schema["$ref"].split("/")[-1]]
+    if "anyOf" in schema:
+        schema = schema["anyOf"][0]
+
+    schema_type = schema.get("type", "string")
+    if schema_type == "object":
+        return {
+            name: fake_structured_response(property_schema, f"{seed}.{name}", definitions)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [fake_structured_response(schema.get("items", {}), f"{seed}.{idx}", definitions) for idx in range(2)]
+    if schema_type in ("integer", "number"):
+        return int(hashlib.sha256(seed.encode("utf-8")).hexdigest(), 16) % 9 + 1
+    if schema_type == "boolean":
+        return True
+    word_count = 8 + len(seed) % 24
+    return " ".join(FILLER_WORDS[idx % len(FILLER_WORDS)] for idx in range(len(seed), len(seed) + word_count))
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the subset of the Ollama API used by the application."""
+    server: "FakeOllamaServer"
+
+    def log_message(self, format: str, *args) -> None:
+        """Silences the per-request logging."""
+
+    def send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self) -> None:
+        routes = {
+            "/api/embed": self.handle_embed,
+            "/api/embeddings": self.handle_embeddings,
+            "/api/chat": self.handle_chat,
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self.send_json({"error": f"unknown route {self.path}"}, status=404)
+            return
+        self.server.count_request(self.path)
+        route(self.read_json())
+
+    def handle_embed(self, request: dict) -> None:
+        """Batched embedding endpoint, one request for a list of inputs."""
+        inputs = request.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        config = self.server.config
+        with self.server.parallel_slots:
+            time.sleep(config.request_latency + config.item_latency * len(inputs))
+        self.send_json({
+            "model": request.get("model", ""),
+            "embeddings": [fake_embedding(text, config.embedding_dim) for text in inputs]
+        })
+
+    def handle_embeddings(self, request: dict) -> None:
+        """Legacy single-text embedding endpoint."""
+        config = self.server.config
+        with self.server.parallel_slots:
+            time.sleep(config.request_latency + config.item_latency)
+        self.send_json({"embedding": fake_embedding(request.get("prompt", ""), config.embedding_dim)})
+
+    def handle_chat(self, request: dict) -> None:
+        """Chat endpoint, streams a canned response as newline-delimited JSON chunks."""
+        config = self.server.config
+        messages = request.get("messages", [])
+        response_format = request.get("format")
+        seed = messages[-1].get("content", "") if messages else ""
+        if isinstance(response_format, dict):
+            content = json.dumps(fake_structured_response(response_format, seed))
+        elif response_format == "json":
+            content = json.dumps({"answer": fake_structured_response({"type": "string"}, seed)})
+        else:
+            content = fake_structured_response({"type": "string"}, seed)
+        tokens = [content[idx:idx + config.token_size] for idx in range(0, len(content), config.token_size)]
+        prompt = "".join(f"<{message.get('role', '')}>{message.get('content', '')}" for message in messages)
+        prompt_tokens, reused_tokens = self.server.count_prompt(request.get("model", ""), prompt)
+
+        def chunk(delta: str, done: bool) -> dict:
+            payload = {
+                "model": request.get("model", ""), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "message": {"role": "assistant", "content": delta}, "done": done
+            }
+            if done:
+                payload.update({
+                    "done_reason": "stop", "prompt_eval_count": prompt_tokens - reused_tokens, "eval_count": len(tokens)
+                })
+            return payload
+
+        with self.server.parallel_slots:
+            time.sleep(config.first_token_latency + config.prefill_latency * (prompt_tokens - reused_tokens))
+            if not request.get("stream", True):
+                time.sleep(config.token_latency * len(tokens))
+                self.send_json(chunk(content, done=True))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for token in tokens:
+                self.wfile.write(json.dumps(chunk(token, done=False)).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                time.sleep(config.token_latency)
+            self.wfile.write(json.dumps(chunk("", done=True)).encode("utf-8") + b"\n")
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Threaded fake Ollama server that can be used as a context manager."""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, config: FakeOllamaConfig | None = None) -> None:
+        super().__init__(("127.0.0.1", port), FakeOllamaHandler)
+        self.config = config or FakeOllamaConfig()
+        # Mirrors OLLAMA_NUM_PARALLEL, requests beyond it queue up like on the real server
+        self.parallel_slots = threading.BoundedSemaphore(self.config.max_parallel)
+        self.request_counts: dict[str, int] = {}
+        self._counts_lock = threading.Lock()
+
+        # Previous prompt of every model along with the prompt token totals
+        self.cached_prompts: dict[str, str] = {}
+        self.prompt_tokens = 0
+        self.reused_prompt_tokens = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count_request(self, path: str) -> None:
+        with self._counts_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def count_prompt(self, model: str, prompt: str) -> tuple[int, int]:
+        """Provides the prompt tokens and the ones of the prefix shared with the previous prompt of the model."""
+        with self._counts_lock:
+            shared = len(os.path.commonprefix([prompt, self.cached_prompts.get(model, "")]))
+            self.cached_prompts[model] = prompt
+
+            prompt_tokens = len(prompt) // self.config.token_size
+            reused_tokens = shared // self.config.token_size
+            self.prompt_tokens += prompt_tokens
+            self.reused_prompt_tokens += reused_tokens
+            return prompt_tokens, reused_tokens
+
+    @property
+    def prompt_reuse(self) -> float:
+        return self.reused_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def __enter__(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs a fake Ollama server for benchmarking.")
+    parser.add_argument("--port", type=int, default=11555)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--request-latency", type=float, default=0.05)
+    parser.add_argument("--item-latency", type=float, default=0.005)
+    parser.add_argument("--max-parallel", type=int, default=4)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--prefill-latency", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        embedding_dim=args.embedding_dim, request_latency=args.request_latency,
+        item_latency=args.item_latency, max_parallel=args.max_parallel,
+        first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+        prefill_latency=args.prefill_latency
+    )
+    server = FakeOllamaServer(args.port, config)
+    print(f"Fake Ollama listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Load-tests the chat interface by replaying a query log from concurrent simulated users.
+
+A fake Ollama server with a configurable latency and token rate stands in for the models. Every simulated user
+uploads one of the synthetic PDFs through the session pool of the Gradio interface and then replays the JSONL
+query log through `GradioInterface.run_query`, pausing for the think time of every entry. The run reports the
+p50/p95/p99 turn latency and time-to-first-token, the ingestion throughput of the uploads and the peak resident
+memory, and fails when a metric regresses beyond the tolerance of the stored baseline or when there is no baseline.
+
+The time-to-first-token only covers the streamed turns. The responses rendered at once, the agent's answers and the
+summaries, are counted separately, as their first token is their whole turn. Every run is repeated in fresh
+processes, each with its own vector store, and the median of every metric is compared, as the latencies of a single
+run vary by about 20% on a small machine.
+
+Every line of the query log is a JSON object with a `prompt`, an optional `think_seconds` pause before it is sent
+and an optional `use_cache` flag for the Answer Cache.
+
+Usage:
+    python -m benchmarks.load_test --users 8 --documents 2 --log benchmarks/query_log.jsonl
+    python -m benchmarks.load_test --users 8 --documents 2 --runs 5 --update-baseline
+"""
+import os
+import tempfile
+
+# Defaults allowing the load test to run without a .env file
+os.environ.setdefault("LLM_MODEL_NAME", "fake-llm")
+os.environ.setdefault("EMBEDDING_MODEL_NAME", "fake-embed")
+os.environ.setdefault("VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="load_test_"))
+os.environ.setdefault("ASSET_PATH", "./assets")
+os.environ.setdefault("TOP_K", "5")
+
+import gradio as gr
+
+from app import GradioInterface
+from benchmarks.baselines import read_baseline, report_regressions, write_baseline
+from benchmarks.bench_ingestion import build_synthetic_pdf
+from benchmarks.fake_ollama import FakeOllamaConfig, FakeOllamaServer
+from src.config import settings
+from src.application import create_application
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+
+
+# Metrics compared against the baseline, along with whether lower or higher values are better
+BASELINE_METRICS = {
+    "turn_p50_ms": "lower",
+    "turn_p95_ms": "lower",
+    "turn_p99_ms": "lower",
+    "ttft_p50_ms": "lower",
+    "ttft_p95_ms": "lower",
+    "ttft_p99_ms": "lower",
+    "ingestion_pages_per_second": "higher",
+    "peak_rss_mib": "lower",
+}
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "load_test_baseline.json"
+
+# Placeholder shown by the chat while a response has not started streaming
+THINKING_PLACEHOLDER = "Thinking ..."
+
+
+@dataclass
+class TurnResult:
+    """Latencies of a single replayed turn."""
+    user: int
+    prompt: str
+    seconds: float
+    # None for the responses rendered at once
+    first_token_seconds: float | None
+    failed: bool = False
+
+
+def load_query_log(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as log_file:
+        return [json.loads(line) for line in log_file if line.strip()]
+
+
+def peak_rss_bytes() -> int:
+    """Provides the peak resident memory of the process."""
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def use_fake_models(base_url: str) -> None:
+    """Points the models of the application at the fake server."""
+    create_application(settings.model_copy(update={"ollama_base_url": base_url}))
+
+
+async def upload(interface: GradioInterface, user: int, pdf_path: Path) -> int:
+    """Uploads a document for a user and waits for its session, provides the pages ingested."""
+    pooled_session = await interface.session_pool.ensure(f"user-{user}", str(pdf_path))
+    await pooled_session.task
+    if pooled_session.failed:
+        raise RuntimeError(f"Indexing failed for user {user}: {pooled_session.error}")
+    ingestion_report = pooled_session.agent.query_engine.last_ingestion_report
+    return ingestion_report.pages if ingestion_report is not None else 0
+
+
+async def replay(
+    interface: GradioInterface, user: int, pdf_path: Path, query_log: list[dict], think_scale: float,
+    start_delay: float
+) -> list[TurnResult]:
+    """Replays the query log as a single user, timing every turn up to its first rendered token and completion."""
+    await asyncio.sleep(start_delay)
+    request = gr.Request(session_hash=f"user-{user}")
+    history: list[dict] = []
+    results = []
+    for entry in query_log:
+        await asyncio.sleep(entry.get("think_seconds", 0.0) * think_scale)
+
+        multimodal_chat = {"text": entry["prompt"], "files": []}
+        start = time.perf_counter()
+        first_token_seconds, first_content, streamed, failed = None, None, False, False
+        try:
+            async for history, _ in interface.run_query(
+                str(pdf_path), multimodal_chat, history, entry.get("use_cache", True), [], request
+            ):
+                content = history[-1]["content"] if history else ""
+                if first_token_seconds is None and not content.startswith(THINKING_PLACEHOLDER):
+                    first_token_seconds, first_content = time.perf_counter() - start, content
+                # A response is streamed when it keeps changing after its first token
+                streamed = streamed or (first_content is not None and content != first_content)
+        except Exception as e:
+            print(f"User {user} failed on {entry['prompt']!r}: {type(e).__name__}: {e}")
+            failed = True
+        seconds = time.perf_counter() - start
+        results.append(TurnResult(user, entry["prompt"], seconds, first_token_seconds if streamed else None, failed))
+    return results
+
+
+async def run_load_test(args: argparse.Namespace, query_log: list[dict]) -> dict[str, float]:
+    documents_path = Path(tempfile.mkdtemp(prefix="load_test_documents_"))
+    pdf_paths = []
+    for idx in range(args.documents):
+        # Varying the words per page so every document has its own content hash
+        pdf_paths.append(documents_path / f"paper_{idx}.pdf")
+        build_synthetic_pdf(pdf_paths[-1], args.pages, args.words_per_page + idx)
+
+    interface = GradioInterface()
+    # Warming up as the application does once its page is served
+    await asyncio.to_thread(interface.warm_up)
+
+    # Ingesting every document once through the first users, the others reattach to the indexed documents
+    start = time.perf_counter()
+    pages = await asyncio.gather(*(upload(interface, idx, pdf_paths[idx]) for idx in range(args.documents)))
+    ingestion_seconds = time.perf_counter() - start
+    await asyncio.gather(*(
+        upload(interface, user, pdf_paths[user % args.documents]) for user in range(args.documents, args.users)
+    ))
+
+    # Replaying the query log from every user concurrently, staggering their starts over the ramp up
+    start = time.perf_counter()
+    user_results = await asyncio.gather(*(
+        replay(
+            interface, user, pdf_paths[user % args.documents], query_log, args.think_scale,
+            args.ramp_up * user / args.users
+        )
+        for user in range(args.users)
+    ))
+    replay_seconds = time.perf_counter() - start
+
+    turns = [result for results in user_results for result in results]
+    if args.turns_path:
+        args.turns_path.write_text("\n".join(json.dumps(asdict(turn)) for turn in turns) + "\n", encoding="utf-8")
+    turn_ms = np.array([turn.seconds for turn in turns]) * 1000
+    ttft_ms = np.array([turn.first_token_seconds for turn in turns if turn.first_token_seconds is not None]) * 1000
+    if not len(ttft_ms):
+        ttft_ms = np.full(1, np.nan)
+    return {
+        "turns": len(turns),
+        "failed_turns": sum(turn.failed for turn in turns),
+        "streamed_turns": sum(turn.first_token_seconds is not None for turn in turns),
+        "turns_per_second": len(turns) / replay_seconds,
+        "turn_p50_ms": float(np.percentile(turn_ms, 50)),
+        "turn_p95_ms": float(np.percentile(turn_ms, 95)),
+        "turn_p99_ms": float(np.percentile(turn_ms, 99)),
+        "ttft_p50_ms": float(np.percentile(ttft_ms, 50)),
+        "ttft_p95_ms": float(np.percentile(ttft_ms, 95)),
+        "ttft_p99_ms": float(np.percentile(ttft_ms, 99)),
+        "ingestion_pages": sum(pages),
+        "ingestion_pages_per_second": sum(pages) / ingestion_seconds,
+        "peak_rss_mib": peak_rss_bytes() / 2**20,
+    }
+
+
+def run_repeated(args: argparse.Namespace) -> dict[str, float]:
+    """Repeats the load test in fresh processes, each with its own vector store, and provides the median of every
+    metric over the runs, but the most failed turns of any run."""
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="load_test_runs_") as runs_path:
+        for run in range(args.runs):
+            metrics_path = Path(runs_path) / f"run_{run}.json"
+            subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.load_test", *sys.argv[1:],
+                    "--runs", "1", "--metrics-path", str(metrics_path)
+                ],
+                cwd=Path(__file__).parent.parent, check=True,
+                env={**os.environ, "VECTOR_STORE_PATH": tempfile.mkdtemp(prefix="load_test_")}
+            )
+            runs.append(json.loads(metrics_path.read_text(encoding="utf-8")))
+    metrics = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+    metrics["failed_turns"] = max(run["failed_turns"] for run in runs)
+    return metrics
+
+
+def find_regressions(metrics: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Lists the metrics worse than the baseline by more than the tolerance, and any new failed turns."""
+    regressions = []
+    for metric, better in BASELINE_METRICS.items():
+        if metric not in baseline:
+            continue
+        limit = baseline[metric] * (1 + tolerance if better == "lower" else 1 - tolerance)
+        if (metrics[metric] > limit) if better == "lower" else (metrics[metric] < limit):
+            regressions.append(f"{metric}: {metrics[metric]:.1f} against a baseline of {baseline[metric]:.1f}")
+    if metrics["failed_turns"] > baseline.get("failed_turns", 0):
+        regressions.append(f"failed_turns: {metrics['failed_turns']} against a baseline of {baseline.get('failed_turns', 0)}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replays a query log against the application and a fake Ollama.")
+    parser.add_argument("--log", type=Path, default=Path(__file__).parent / "query_log.jsonl")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--think-scale", type=float, default=1.0, help="Multiplier of the think times of the log.")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Seconds over which the users start.")
+    parser.add_argument("--request-latency", type=float, default=0.02)
+    parser.add_argument("--item-latency", type=float, default=0.002)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--prefill-latency", type=float, default=0.0005)
+    parser.add_argument("--max-parallel", type=int, default=4)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction a metric may regress by.")
+    parser.add_argument("--update-baseline", action="store_true", help="Stores the results as the new baseline.")
+    parser.add_argument("--turns-path", type=Path, default=None, help="Path of the JSONL latencies of every turn.")
+    parser.add_argument("--runs", type=int, default=3, help="Runs in fresh processes the median metrics are taken of.")
+    parser.add_argument("--metrics-path", type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.users = max(args.users, args.documents)
+
+    if args.runs > 1:
+        metrics = run_repeated(args)
+    else:
+        config = FakeOllamaConfig(
+            request_latency=args.request_latency, item_latency=args.item_latency, max_parallel=args.max_parallel,
+            first_token_latency=args.first_token_latency, token_latency=1.0 / args.tokens_per_second,
+            prefill_latency=args.prefill_latency
+        )
+        query_log = load_query_log(args.log)
+        with FakeOllamaServer(config=config) as server:
+            use_fake_models(server.base_url)
+            metrics = asyncio.run(run_load_test(args, query_log))
+        # A single run of a repeated load test only hands its metrics over
+        if args.metrics_path is not None:
+            args.metrics_path.write_text(json.dumps(metrics), encoding="utf-8")
+            return
+
+    print(
+        f"{args.users} users over {args.documents} documents, median of {args.runs} runs, {metrics['turns']:.0f} turns "
+        f"({metrics['failed_turns']} failed, {metrics['streamed_turns']:.0f} streamed) at "
+        f"{metrics['turns_per_second']:.2f} turns/sec\n"
+        f"  Turn latency   p50 {metrics['turn_p50_ms']:.0f}ms | p95 {metrics['turn_p95_ms']:.0f}ms | "
+        f"p99 {metrics['turn_p99_ms']:.0f}ms\n"
+        f"  First token    p50 {metrics['ttft_p50_ms']:.0f}ms | p95 {metrics['ttft_p95_ms']:.0f}ms | "
+        f"p99 {metrics['ttft_p99_ms']:.0f}ms (streamed turns)\n"
+        f"  Ingestion      {metrics['ingestion_pages']} pages at {metrics['ingestion_pages_per_second']:.1f} pages/sec\n"
+        f"  Peak RSS       {metrics['peak_rss_mib']:.0f}MiB"
+    )
+
+    # The baseline only holds for the same load and fake server latencies
+    run_config = {
+        key: value for key, value in vars(args).items()
+        if key not in ("baseline", "tolerance", "update_baseline", "turns_path", "runs", "metrics_path")
+    }
+    run_config["log"] = os.path.relpath(args.log, Path(__file__).parent.parent)
+    if args.update_baseline:
+        write_baseline(args.baseline, {"config": run_config, "metrics": metrics})
+        return
+
+    baseline = read_baseline(args.baseline)
+    if baseline["config"] != run_config:
+        print("Warning: the baseline was recorded with a different configuration")
+    report_regressions(baseline, find_regressions(metrics, baseline["metrics"], args.tolerance), args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,78 @@
-from app import GradioInterface
+from dataclasses import asdict
+from pathlib import Path
+import argparse
+import json
+import threading
 
 
-def main():
-    """Main function to launch the Application."""
+def launch_interface() -> None:
+    """Launches the Gradio Application."""
+    # Imported here so the spawned PDF parsing workers do not re-import the whole application
+    from app import GradioInterface
+    from src.application import create_application
+    from src.config import settings
+    from src.telemetry import telemetry
+
+    # The models are constructed from the settings on first use
+    create_application(settings)
+    # Serving the stage latencies and the cache counters, when the telemetry is enabled
+    telemetry.start(settings.metrics_port)
+
     interface = GradioInterface()
-    interface.page()
+    demo = interface.page()
+    # Importing the retrieval stack and starting the PDF parsing workers once the page is served
+    threading.Thread(target=interface.warm_up, daemon=True).start()
+    demo.block_thread()
+
+
+def ingest_directory(args: argparse.Namespace) -> None:
+    """Ingests every PDF of a directory into the corpus and writes the JSON report of the run."""
+    from src.bulk_ingestion import BulkIngestion
+    from src.config import settings
+    from src.telemetry import telemetry
+
+    bulk_ingestion = BulkIngestion(
+        args.directory, checkpoint_path=args.checkpoint, workers=args.workers,
+        replace_previous_versions=args.replace_previous_versions
+    )
+    if args.restart:
+        bulk_ingestion.checkpoints = {}
+    # Tracing the ingestion spans of every document, when the telemetry is enabled
+    telemetry.start()
+    try:
+        report = bulk_ingestion.run()
+    finally:
+        telemetry.stop()
+
+    report_path = Path(args.report or settings.vector_store_path / "bulk_ingestion_report.json")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(asdict(report), indent=4), encoding="utf-8")
+    print(
+        f"Indexed {report.indexed}/{report.documents} documents ({report.already_indexed} already indexed, "
+        f"{report.failed} failed) at {report.pages_per_second:.1f} pages/sec, report written to {report_path}"
+    )
+
+
+def main():
+    """Main function to launch the Application, or the offline ingestion of a directory of PDFs."""
+    parser = argparse.ArgumentParser(description="Research Companion")
+    subparsers = parser.add_subparsers(dest="command")
+    ingest_parser = subparsers.add_parser("ingest", help="Indexes every PDF of a directory into the corpus.")
+    ingest_parser.add_argument("directory", type=Path)
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Worker processes parsing the PDFs.")
+    ingest_parser.add_argument("--report", type=Path, default=None, help="Path of the JSON report.")
+    ingest_parser.add_argument("--checkpoint", type=Path, default=None, help="Path of the resumable checkpoints.")
+    ingest_parser.add_argument("--restart", action="store_true", help="Ignores the checkpoints of a previous run.")
+    ingest_parser.add_argument(
+        "--replace-previous-versions", action="store_true",
+        help="Removes the older explicit versions of the papers, such as paper_v1.pdf once paper_v2.pdf is indexed."
+    )
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest_directory(args)
+    else:
+        launch_interface()
 
 
 if __name__ == "__main__":
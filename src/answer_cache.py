@@ -0,0 +1,103 @@
+from src.response_structures import ResponseTypes
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    """A validated structured response along with the normalised embedding of the question it answered."""
+    doc_hash: str
+    response_type: ResponseTypes
+    query: str
+    embedding: np.ndarray
+    response_json: str
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """This class implements a cache of validated answers for repeated and near-duplicate questions.
+
+    Answers are scoped by the document hash and the response type, and a question is served from the cache
+    when its embedding is similar enough to a previously answered question. Only answers grounded in the documents
+    belong in the cache, as nothing in the key distinguishes the chat histories of the sessions. Entries expire
+    after a TTL and the least recently used entries are evicted beyond the size bound."""
+
+    def __init__(self, similarity_threshold: float, ttl_seconds: float, max_entries: int) -> None:
+        """Class Constructor."""
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self.entries: OrderedDict[tuple[str, ResponseTypes, str], CachedAnswer] = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalise(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def expire(self, now: float) -> None:
+        """Drops the entries older than the TTL. Callers must hold the lock."""
+        expired = [key for key, entry in self.entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self.entries[key]
+        self.expirations += len(expired)
+
+    def lookup(self, doc_hash: str, response_type: ResponseTypes, query_embedding: list[float]) -> str | None:
+        """Provides the cached response for the most similar question above the threshold, otherwise None."""
+        query_vector = self.normalise(query_embedding)
+        with self._lock:
+            self.expire(time.time())
+
+            best_key, best_similarity = None, self.similarity_threshold
+            for key, entry in self.entries.items():
+                if entry.doc_hash != doc_hash or entry.response_type != response_type:
+                    continue
+                similarity = float(query_vector @ entry.embedding)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(best_key)
+            return self.entries[best_key].response_json
+
+    def store(
+        self, doc_hash: str, response_type: ResponseTypes, query: str, query_embedding: list[float], response_json: str
+    ) -> None:
+        """Caches a validated response and evicts the least recently used entries beyond the size bound."""
+        key = (doc_hash, response_type, query.strip().lower())
+        with self._lock:
+            self.entries[key] = CachedAnswer(
+                doc_hash=doc_hash, response_type=response_type, query=query,
+                embedding=self.normalise(query_embedding), response_json=response_json, created_at=time.time()
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict[str, float]:
+        """Provides the counters of the cache for exporting."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,110 @@
+from src.config import Settings, settings
+from src.telemetry import telemetry
+
+from enum import Enum
+from typing import Any
+import threading
+
+
+class LLMRole(str, Enum):
+    """Enumeration of the named LLM configurations."""
+    ANSWER = "answer"
+    ROUTING = "routing"
+
+
+class Application:
+    """This class implements the models and clients of the application, constructed from the Settings on first use.
+
+    Neither the clients are constructed nor their modules imported until a session needs them, so the interface is
+    served without waiting on them. Every role of the LLM gets its own client from its named configuration, the
+    answering LLM generating the responses and the routing LLM driving the agent. The answering LLM and the
+    embedding model are also installed as the LlamaIndex defaults for the components falling back on them."""
+
+    def __init__(self, app_settings: Settings) -> None:
+        """Class Constructor."""
+        self.settings = app_settings
+
+        self._lock = threading.RLock()
+        self._llms: dict[LLMRole, Any] = {}
+        self._embed_model: Any = None
+        self._splitter: Any = None
+
+    def llm(self, role: LLMRole = LLMRole.ANSWER):
+        """Provides the scheduled Ollama client of a role, constructed from its named configuration."""
+        with self._lock:
+            if role not in self._llms:
+                from llama_index.core import Settings as LlamaSettings
+                from src.llms import ScheduledOllama
+
+                config = self.settings.llm_config(role.value)
+                self._llms[role] = ScheduledOllama(
+                    model=config.model_name, base_url=self.settings.ollama_base_url,
+                    request_timeout=config.request_timeout, keep_alive=self.settings.llm_keep_alive,
+                    context_window=config.context_window, additional_kwargs={"num_predict": config.num_predict}
+                )
+                if role == LLMRole.ANSWER:
+                    LlamaSettings.llm = self._llms[role]
+            return self._llms[role]
+
+    @property
+    def embed_model(self):
+        """Provides the batched Ollama embedding model, behind the Embedding Cache when it is enabled."""
+        with self._lock:
+            if self._embed_model is None:
+                from llama_index.core import Settings as LlamaSettings
+                from src.embeddings import BatchedOllamaEmbedding, CachedEmbedding
+                from src.embedding_cache import EmbeddingCache
+
+                embed_model = BatchedOllamaEmbedding(
+                    self.settings.embedding_model_name, base_url=self.settings.ollama_base_url,
+                    embed_batch_size=self.settings.embed_batch_size, keep_alive=self.settings.llm_keep_alive
+                )
+                if self.settings.embedding_cache_enabled:
+                    embed_model = CachedEmbedding(embed_model, EmbeddingCache(
+                        self.settings.vector_store_path / "embedding_cache.sqlite3",
+                        self.settings.embedding_cache_max_entries
+                    ))
+                    # Cache counters exported with the metrics
+                    telemetry.register_collector("embedding_cache", embed_model.cache.stats)
+                LlamaSettings.embed_model = self._embed_model = embed_model
+            return self._embed_model
+
+    @property
+    def splitter(self):
+        """Provides the sentence splitter chunking the documents."""
+        with self._lock:
+            if self._splitter is None:
+                from llama_index.core.node_parser import SentenceSplitter
+
+                self._splitter = SentenceSplitter(
+                    chunk_size=self.settings.chunk_size, chunk_overlap=self.settings.chunk_overlap
+                )
+            return self._splitter
+
+    def warm_up(self) -> None:
+        """Constructs every model client ahead of the first session."""
+        for role in LLMRole:
+            self.llm(role)
+        _ = self.embed_model, self.splitter
+
+
+# Application of the running process, created from the Settings on first use unless created explicitly
+_application: Application | None = None
+_application_lock = threading.Lock()
+
+
+def create_application(app_settings: Settings | None = None) -> Application:
+    """Creates the application from the given Settings and makes it the application of the process."""
+    global _application
+    with _application_lock:
+        _application = Application(app_settings or settings)
+        return _application
+
+
+def get_application() -> Application:
+    """Provides the application of the process."""
+    global _application
+    with _application_lock:
+        if _application is None:
+            _application = Application(settings)
+        return _application
@@ -1,27 +1,177 @@
-from faster_whisper import WhisperModel
+from src.config import settings
+from src.executors import ExecutorKind, run_blocking
+from src.telemetry import telemetry
+
 from pathlib import Path
+from typing import TYPE_CHECKING
+import asyncio
+import threading
+import numpy as np
+
+# Faster-Whisper is imported on the first transcription, keeping it off the startup of the interface
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+
+# Sample rate expected by Whisper and the VAD
+SAMPLE_RATE = 16000
+
+# Audio formats recorded or uploaded through Gradio
+AUDIO_EXTENSIONS = {".wav", ".webm", ".mp3", ".m4a", ".mp4", ".ogg", ".opus", ".flac", ".aac"}
+
+
+# Whisper Model shared by all the sessions, loaded on the first transcription
+_whisper_model: "WhisperModel | None" = None
+_whisper_model_lock = threading.Lock()
+
+
+def get_whisper_model() -> "WhisperModel":
+    """Provides the shared Whisper Model, one worker per thread of the transcription executor."""
+    global _whisper_model
+    with _whisper_model_lock:
+        if _whisper_model is None:
+            from faster_whisper import WhisperModel
+
+            _whisper_model = WhisperModel(
+                settings.whisper_model_size, device="auto", compute_type=settings.whisper_compute_type,
+                num_workers=settings.transcription_workers
+            )
+        return _whisper_model
+
+
+def to_whisper_audio(sample_rate: int, audio: np.ndarray) -> np.ndarray:
+    """Converts a recorded chunk into mono float samples at the sample rate of Whisper."""
+    audio = np.asarray(audio)
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio / float(np.iinfo(audio.dtype).max)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    audio = audio.astype(np.float32)
+    if sample_rate != SAMPLE_RATE and len(audio):
+        positions = np.arange(0, len(audio), sample_rate / SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
 
 
 class AudioTranscription:
-    """Class provides the API for Audio Transcription using Whisper."""
+    """Class provides the API for Audio Transcription using Whisper.
+
+    The model is loaded on first use and shared by the sessions, the transcriptions are queued on the bounded
+    transcription executor. The audio is split on the pauses by the VAD so silence is never decoded."""
 
     def __init__(self) -> None:
-        self.model = WhisperModel("base", device="auto", compute_type="int8")
-
-    def transcribe(self, file_path: list):
-        segments, _ = self.model.transcribe(file_path[0])
-        transcript = [
-            {
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment.text
-            } 
-            for segment in segments
-        ]
+        self.vad_parameters = {"min_silence_duration_ms": settings.vad_min_silence_ms}
+
+    @property
+    def model(self) -> "WhisperModel":
+        return get_whisper_model()
+
+    def transcribe(self, audio: str | np.ndarray) -> list[dict]:
+        """Transcribes an audio file or 16kHz samples into its timed segments."""
+        with telemetry.span("transcribe") as span:
+            segments, info = self.model.transcribe(audio, vad_filter=True, vad_parameters=self.vad_parameters)
+            transcript = [
+                {
+                    "start": segment.start,
+                    "end": segment.end,
+                    "text": segment.text
+                }
+                for segment in segments
+            ]
+            if span is not None:
+                span["audio_seconds"] = round(info.duration, 3)
         return transcript
-    
+
+    @staticmethod
+    def join_segments(transcript: list[dict]) -> str:
+        return " ".join(segment["text"].strip() for segment in transcript if segment["text"].strip())
+
+    async def atranscribe(self, files: list) -> str:
+        """Transcribes every audio file on the transcription executor, joining all of their segments."""
+        texts = []
+        for file in self.audio_files(files):
+            transcript = await run_blocking(ExecutorKind.TRANSCRIPTION, self.transcribe, file)
+            texts.append(self.join_segments(transcript))
+        return " ".join(text for text in texts if text)
+
+    @staticmethod
+    def audio_files(files: list) -> list[str]:
+        return [str(file) for file in files if Path(file).suffix.lower() in AUDIO_EXTENSIONS]
+
     def check_audio(self, files: list) -> bool:
-        for file in files:
-            if Path(file).suffix == ".wav":
-                return True
-        return False
\ No newline at end of file
+        return bool(self.audio_files(files))
+
+
+class StreamingTranscription:
+    """This class implements the transcription of a microphone stream while the user is still speaking.
+
+    The chunks are buffered at the sample rate of Whisper and the VAD runs over the audio not transcribed yet.
+    Every speech segment closed by a pause is transcribed in the background, and the open tail once the
+    recording stops, so only the last phrase is left to decode when the user is done."""
+
+    def __init__(self, transcription: AudioTranscription) -> None:
+        """Class Constructor."""
+        from faster_whisper.vad import VadOptions
+
+        self.transcription = transcription
+        self.vad_options = VadOptions(
+            min_silence_duration_ms=settings.vad_min_silence_ms, max_speech_duration_s=settings.vad_max_speech_seconds
+        )
+
+        self.silence_samples = settings.vad_min_silence_ms * SAMPLE_RATE // 1000
+        self.buffer = np.zeros(0, dtype=np.float32)
+        # Transcriptions of the closed segments, in the order they were spoken
+        self.segments: list[asyncio.Task] = []
+        self.lock = asyncio.Lock()
+
+    def split_point(self, audio: np.ndarray) -> tuple[int, bool]:
+        """Provides the sample where the last speech segment closed by a pause ends, 0 when none is closed,
+        and whether the audio holds any speech."""
+        from faster_whisper.vad import get_speech_timestamps
+
+        speech = get_speech_timestamps(audio, self.vad_options)
+        closed = [
+            segment for idx, segment in enumerate(speech)
+            if idx < len(speech) - 1 or segment["end"] <= len(audio) - self.silence_samples
+        ]
+        return (closed[-1]["end"] if closed else 0), bool(speech)
+
+    def schedule(self, audio: np.ndarray) -> None:
+        self.segments.append(asyncio.create_task(
+            run_blocking(ExecutorKind.TRANSCRIPTION, self.transcription.transcribe, audio)
+        ))
+
+    def text(self) -> str:
+        """Provides the text transcribed so far, up to the first segment still being transcribed."""
+        texts = []
+        for segment in self.segments:
+            if not segment.done():
+                break
+            if not segment.cancelled() and segment.exception() is None:
+                texts.append(self.transcription.join_segments(segment.result()))
+        return " ".join(text for text in texts if text)
+
+    async def feed(self, sample_rate: int, chunk: np.ndarray) -> str:
+        """Buffers a chunk of the stream and transcribes the segments closed by a pause."""
+        async with self.lock:
+            self.buffer = np.concatenate([self.buffer, to_whisper_audio(sample_rate, chunk)])
+            cut, has_speech = await run_blocking(ExecutorKind.RETRIEVAL, self.split_point, self.buffer)
+            if cut:
+                self.schedule(self.buffer[:cut])
+                self.buffer = self.buffer[cut:]
+            elif not has_speech:
+                # Dropping the silence before the user starts speaking
+                self.buffer = self.buffer[-self.silence_samples:]
+        return self.text()
+
+    async def finish(self) -> str:
+        """Transcribes the rest of the stream and provides the complete transcript."""
+        async with self.lock:
+            if len(self.buffer):
+                self.schedule(self.buffer)
+                self.buffer = np.zeros(0, dtype=np.float32)
+        if self.segments:
+            await asyncio.wait(self.segments)
+        transcript = self.text()
+        self.segments = []
+        return transcript
@@ -0,0 +1,227 @@
+from src.config import settings
+from src.document_registry import DocumentRegistry
+from src.ingestion import PreparedDocument, get_parse_executor, prepare_document
+from src.pdf_parsing import read_title
+
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import json
+import sqlite3
+import time
+
+
+@dataclass
+class DocumentCheckpoint:
+    """Outcome of the bulk ingestion of a single document."""
+    file_path: str
+    doc_hash: str = ""
+    status: str = "pending"
+    pages: int = 0
+    chunks: int = 0
+    reused_pages: int = 0
+    parse_seconds: float = 0.0
+    seconds: float = 0.0
+    error: str = ""
+
+
+@dataclass
+class BulkIngestionReport:
+    """Throughput, failures and index sizes of a bulk ingestion run."""
+    directory: str
+    started_at: float
+    finished_at: float = 0.0
+    seconds: float = 0.0
+    documents: int = 0
+    indexed: int = 0
+    already_indexed: int = 0
+    failed: int = 0
+    pages: int = 0
+    chunks: int = 0
+    reused_pages: int = 0
+    pages_per_second: float = 0.0
+    chunks_per_second: float = 0.0
+    failures: list[dict] = field(default_factory=list)
+    index_sizes: dict[str, int] = field(default_factory=dict)
+
+
+class BulkIngestion:
+    """This class implements the offline ingestion of entire directories of PDFs into the corpus.
+
+    Documents are parsed and split in the pool of worker processes a few documents ahead of the one being
+    embedded, so the parsing of the next documents overlaps the embedding requests of the current one. Every
+    document then goes through the ingestion of the Query Engine and is checkpointed once it is registered, so an
+    interrupted run resumes with the documents it had not finished."""
+
+    def __init__(
+        self, directory: str | Path, checkpoint_path: str | Path | None = None, workers: int | None = None,
+        lookahead: int | None = None, replace_previous_versions: bool = False
+    ) -> None:
+        """Class Constructor."""
+        self.directory = Path(directory)
+        # Whether the explicitly newer versions of the papers remove their older versions from the corpus
+        self.replace_previous_versions = replace_previous_versions
+        self.checkpoint_path = Path(checkpoint_path or settings.vector_store_path / "bulk_ingestion_checkpoint.json")
+        self.workers = workers or settings.parse_workers
+        # Documents parsed ahead of the one being embedded
+        self.lookahead = lookahead or 2 * self.workers
+
+        self.document_registry = DocumentRegistry(settings.vector_store_path / "document_registry.json")
+        self.checkpoints: dict[str, DocumentCheckpoint] = {}
+        self.load()
+
+    # ==== Checkpoints ====
+    def load(self) -> None:
+        if self.checkpoint_path.exists():
+            checkpoints = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))
+            self.checkpoints = {path: DocumentCheckpoint(**checkpoint) for path, checkpoint in checkpoints.items()}
+
+    def persist(self) -> None:
+        """Atomically writes the checkpoints."""
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.checkpoint_path.with_suffix(".tmp")
+        temp_path.write_text(
+            json.dumps({path: asdict(checkpoint) for path, checkpoint in self.checkpoints.items()}, indent=4),
+            encoding="utf-8"
+        )
+        temp_path.replace(self.checkpoint_path)
+
+    def pending_files(self) -> list[Path]:
+        """Provides the PDFs of the directory not ingested yet, failed documents are retried."""
+        files = sorted(path.resolve() for path in self.directory.rglob("*") if path.suffix.lower() == ".pdf")
+        return [
+            file_path for file_path in files
+            if str(file_path) not in self.checkpoints
+            or self.checkpoints[str(file_path)].status not in ("indexed", "already_indexed")
+        ]
+
+    def is_indexed(self, doc_hash: str) -> bool:
+        record = self.document_registry.lookup(
+            doc_hash, settings.embedding_model_name, settings.chunk_size, settings.chunk_overlap
+        )
+        return record is not None
+
+    # ==== Ingestion ====
+    def submit(self, file_path: Path, checkpoint: DocumentCheckpoint) -> Future:
+        """Queues the parsing and the splitting of a document in the worker pool."""
+        title = read_title(str(file_path)) or file_path.stem
+        return get_parse_executor(self.workers).submit(
+            prepare_document, str(file_path), {"doc_hash": checkpoint.doc_hash, "title": title},
+            settings.chunk_size, settings.chunk_overlap
+        )
+
+    def ingest(self, file_path: Path, prepared: PreparedDocument, checkpoint: DocumentCheckpoint) -> None:
+        """Embeds and writes a prepared document through the Query Engine."""
+        # Imported here so the worker processes never import the LLM and vector store setup
+        from src.query_engine import QueryEngine
+
+        start = time.perf_counter()
+        ingestion_report = QueryEngine(
+            str(file_path), prepared_document=prepared, replace_previous_version=self.replace_previous_versions
+        ).last_ingestion_report
+        checkpoint.status = "indexed"
+        checkpoint.pages = prepared.total_pages
+        checkpoint.chunks = ingestion_report.chunks if ingestion_report is not None else 0
+        checkpoint.reused_pages = ingestion_report.reused_pages if ingestion_report is not None else 0
+        checkpoint.parse_seconds = prepared.parse_seconds
+        checkpoint.seconds = time.perf_counter() - start
+
+    def run(self) -> BulkIngestionReport:
+        """Ingests the pending documents of the directory and provides the report of the run."""
+        report = BulkIngestionReport(directory=str(self.directory), started_at=time.time())
+        files = self.pending_files()
+        report.documents = len(files)
+
+        queued: list[tuple[Path, DocumentCheckpoint, Future | None]] = []
+        next_file, completed = 0, 0
+        while queued or next_file < len(files):
+            # Keeping the worker pool busy with the documents ahead
+            while next_file < len(files) and len(queued) < self.lookahead:
+                file_path = files[next_file]
+                next_file += 1
+                checkpoint, future = DocumentCheckpoint(str(file_path)), None
+                try:
+                    checkpoint.doc_hash = DocumentRegistry.hash_file(file_path)
+                    if self.is_indexed(checkpoint.doc_hash):
+                        checkpoint.status = "already_indexed"
+                    else:
+                        future = self.submit(file_path, checkpoint)
+                except Exception as e:
+                    checkpoint.status, checkpoint.error = "failed", f"{type(e).__name__}: {e}"
+                queued.append((file_path, checkpoint, future))
+
+            file_path, checkpoint, future = queued.pop(0)
+            if future is not None:
+                try:
+                    self.ingest(file_path, future.result(), checkpoint)
+                except Exception as e:
+                    checkpoint.status, checkpoint.error = "failed", f"{type(e).__name__}: {e}"
+            self.checkpoints[str(file_path)] = checkpoint
+            self.persist()
+            self.count(report, checkpoint)
+
+            completed += 1
+            print(f"[{completed}/{len(files)}] {file_path.name}: {checkpoint.status} {checkpoint.error}".rstrip())
+
+        report.finished_at = time.time()
+        report.seconds = report.finished_at - report.started_at
+        report.pages_per_second = report.pages / report.seconds if report.seconds > 0 else 0.0
+        report.chunks_per_second = report.chunks / report.seconds if report.seconds > 0 else 0.0
+        report.index_sizes = self.index_sizes()
+        return report
+
+    @staticmethod
+    def count(report: BulkIngestionReport, checkpoint: DocumentCheckpoint) -> None:
+        if checkpoint.status == "indexed":
+            report.indexed += 1
+            report.pages += checkpoint.pages
+            report.chunks += checkpoint.chunks
+            report.reused_pages += checkpoint.reused_pages
+        elif checkpoint.status == "already_indexed":
+            report.already_indexed += 1
+        else:
+            report.failed += 1
+            report.failures.append({"file_path": checkpoint.file_path, "error": checkpoint.error})
+
+    @staticmethod
+    def chroma_segment_paths(store_path: Path) -> list[Path]:
+        """Provides the directories of the Chroma collection segments, as listed in the Chroma database."""
+        database_path = store_path / "chroma.sqlite3"
+        if not database_path.exists():
+            return []
+        try:
+            with sqlite3.connect(f"file:{database_path}?mode=ro", uri=True) as connection:
+                segment_ids = [segment_id for segment_id, in connection.execute("SELECT id FROM segments")]
+        except sqlite3.Error:
+            return []
+        return [store_path / segment_id for segment_id in segment_ids if (store_path / segment_id).is_dir()]
+
+    def index_sizes(self) -> dict[str, int]:
+        """Provides the documents and chunks of the corpus and the bytes on disk of every part of the index, along
+        with the chat memories of the sessions and anything else stored next to it."""
+        def directory_bytes(path: Path) -> int:
+            if path.is_file():
+                return path.stat().st_size
+            return sum(file.stat().st_size for file in path.rglob("*") if file.is_file()) if path.exists() else 0
+
+        store_path = settings.vector_store_path
+        records = self.document_registry.documents()
+        if settings.vector_backend == "quantized":
+            vector_store_paths = [store_path / "quantized"]
+        else:
+            # The Chroma database and the directories of its collection segments
+            vector_store_paths = [store_path / "chroma.sqlite3", *self.chroma_segment_paths(store_path)]
+        sizes = {
+            "vector_store_bytes": sum(directory_bytes(path) for path in vector_store_paths),
+            "sparse_index_bytes": directory_bytes(store_path / "sparse"),
+            "embedding_cache_bytes": sum(directory_bytes(path) for path in store_path.glob("embedding_cache.sqlite3*")),
+            "session_memory_bytes": directory_bytes(store_path / "sessions"),
+        }
+        total_bytes = directory_bytes(store_path)
+        return {
+            "documents": len(records),
+            "chunks": sum(record.chunk_count for record in records),
+            **sizes,
+            "other_bytes": total_bytes - sum(sizes.values()),
+            "total_bytes": total_bytes,
+        }
@@ -0,0 +1,105 @@
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore
+
+from src.config import settings
+from src.response_structures import Citation
+from src.sparse_index import tokenize
+
+import re
+
+
+# Sentences of a chunk, including their trailing whitespace so the excerpts stay verbatim
+SENTENCE_PATTERN = re.compile(r".+?(?:[.!?](?=\s)|\n|$)\s*", re.DOTALL)
+CHUNK_ID_PATTERN = re.compile(r"C\d+", re.IGNORECASE)
+
+
+class CitationContext:
+    """This class implements the retrieved context of a turn with every chunk tagged by a short ID.
+
+    The model cites the chunks by their IDs instead of regenerating their text, and the citations are resolved
+    server-side to a verbatim excerpt of the stored chunk and its page number."""
+
+    def __init__(self, retrieved_nodes: list[NodeWithScore], excerpt_chars: int | None = None) -> None:
+        """Class Constructor."""
+        self.excerpt_chars = excerpt_chars or settings.citation_excerpt_chars
+        self.chunks: dict[str, BaseNode] = {
+            f"C{idx + 1}": result.node for idx, result in enumerate(retrieved_nodes)
+        }
+        # Chunks from several documents of the corpus are also labelled with their document
+        self.across_documents = len({node.metadata.get("doc_hash") for node in self.chunks.values()}) > 1
+
+    @staticmethod
+    def page_number(node: BaseNode) -> int:
+        try:
+            return int(node.metadata.get("page_number", node.metadata.get("source", 0)))
+        except (TypeError, ValueError):
+            return 0
+
+    def document_title(self, node: BaseNode) -> str:
+        return str(node.metadata.get("title", "")) if self.across_documents else ""
+
+    def context_str(self) -> str:
+        """Provides the context for the prompt with every chunk headed by its ID and page, and its document title
+        when the chunks come from several documents."""
+        headers = {
+            chunk_id: f"{self.document_title(node)}, page {self.page_number(node)}" if self.across_documents
+            else f"page {self.page_number(node)}"
+            for chunk_id, node in self.chunks.items()
+        }
+        return "\n\n".join(
+            f"[{chunk_id}] ({headers[chunk_id]})\n{node.get_content(metadata_mode=MetadataMode.NONE)}"
+            for chunk_id, node in self.chunks.items()
+        )
+
+    def excerpt(self, text: str, hint: str) -> str:
+        """Provides the verbatim passage of a chunk sharing the most terms with the hint, within the excerpt length."""
+        text = text.strip()
+        if len(text) <= self.excerpt_chars:
+            return text
+
+        sentences = [match.span() for match in SENTENCE_PATTERN.finditer(text) if match.group().strip()]
+        hint_terms = set(tokenize(hint))
+        scores = [len(hint_terms.intersection(tokenize(text[start:stop]))) for start, stop in sentences]
+        best = max(range(len(sentences)), key=scores.__getitem__)
+
+        # Growing the passage around the best sentence while it fits
+        first, last = best, best
+        while True:
+            grown = False
+            for candidate_first, candidate_last in ((first, last + 1), (first - 1, last)):
+                if 0 <= candidate_first and candidate_last < len(sentences):
+                    if sentences[candidate_last][1] - sentences[candidate_first][0] <= self.excerpt_chars:
+                        first, last, grown = candidate_first, candidate_last, True
+            if not grown:
+                break
+
+        start, stop = sentences[first][0], sentences[last][1]
+        return text[start:stop][:self.excerpt_chars].strip()
+
+    def resolve(self, citations: list[dict]) -> list[dict]:
+        """Resolves the citations by chunk ID into citations with the verbatim text and the page number.
+
+        Unknown IDs are dropped and every chunk is cited at most once."""
+        resolved: dict[str, dict] = {}
+        for citation in citations:
+            if not isinstance(citation, dict):
+                continue
+            match = CHUNK_ID_PATTERN.search(str(citation.get("chunk_id", "")))
+            chunk_id = match.group().upper() if match else None
+            if chunk_id not in self.chunks or chunk_id in resolved:
+                continue
+
+            node = self.chunks[chunk_id]
+            simplification = str(citation.get("simplification", ""))
+            resolved[chunk_id] = Citation(
+                page_number=self.page_number(node),
+                source_text=self.excerpt(node.get_content(metadata_mode=MetadataMode.NONE), simplification),
+                simplification=simplification,
+                document_title=self.document_title(node)
+            ).model_dump()
+        return list(resolved.values())
+
+    def resolve_response(self, response_data: dict) -> dict:
+        """Provides the response with its citations by chunk ID resolved."""
+        if not isinstance(response_data.get("citations"), list):
+            return response_data
+        return {**response_data, "citations": self.resolve(response_data["citations"])}
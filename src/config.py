@@ -1,12 +1,33 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from pathlib import Path
 
 
+class LLMConfig(BaseModel):
+    """This class holds the parameters of a named LLM client."""
+    model_name: str
+    request_timeout: float
+    num_predict: int
+    context_window: int
+
+
 class Settings(BaseSettings):
     """This class automates the configuration of the Project from its Environment Variables."""
     # Model Configurations
     llm_model_name: str
     embedding_model_name: str
+    ollama_base_url: str = "http://localhost:11434"
+    llm_context_window: int = 30000
+
+    # Answering LLM Configurations, generating the responses and the summaries
+    answer_llm_model_name: str | None = None
+    answer_llm_request_timeout: float = 300.0
+    answer_llm_num_predict: int = 3072
+
+    # Routing LLM Configurations, driving the ReAct agent
+    routing_llm_model_name: str | None = None
+    routing_llm_request_timeout: float = 600.0
+    routing_llm_num_predict: int = 4096
 
     # Vector Store Paths
     vector_store_path: Path
@@ -14,6 +35,99 @@ class Settings(BaseSettings):
 
     # Vector Store Configurations
     top_k: int
+    hybrid_alpha: float = 0.5
+
+    # Chunking Configurations
+    chunk_size: int = 1024
+    chunk_overlap: int = 120
+
+    # Ingestion Configurations
+    parse_workers: int = 4
+    embed_batch_size: int = 32
+    embed_concurrency: int = 4
+
+    # Embedding Cache Configurations
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 200000
+
+    # Routing Configurations
+    fast_router_enabled: bool = True
+    router_min_similarity: float = 0.5
+    router_margin: float = 0.05
+
+    # Answer Cache Configurations
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.92
+    answer_cache_ttl_seconds: float = 86400.0
+    answer_cache_max_entries: int = 1024
+
+    # Concurrency Configurations
+    indexing_workers: int = 2
+    retrieval_workers: int = 8
+    transcription_workers: int = 1
+    max_concurrent_requests: int = 16
+
+    # Session Pool Configurations
+    session_pool_max_sessions: int = 32
+    session_pool_max_memory_mb: int = 1024
+    session_idle_timeout_seconds: float = 1800.0
+
+    # Citation Configurations
+    citation_excerpt_chars: int = 600
+
+    # Context Assembly Configurations
+    retrieval_candidates: int = 10
+    research_token_budget: int = 6000
+    simple_token_budget: int = 2000
+    history_token_fraction: float = 0.25
+    rerank_weight: float = 0.3
+    agent_memory_token_limit: int = 4000
+
+    # Prompt Cache Configurations
+    llm_keep_alive: str = "30m"
+
+    # Rolling Summary Configurations
+    summary_batch_exchanges: int = 4
+    summary_exchange_chars: int = 2000
+
+    # Voice Input Configurations
+    whisper_model_size: str = "base"
+    whisper_compute_type: str = "int8"
+    vad_min_silence_ms: int = 500
+    vad_max_speech_seconds: float = 30.0
+    voice_stream_seconds: float = 0.5
+
+    # Corpus Configurations
+    corpus_candidate_multiplier: int = 4
+    corpus_document_weight: float = 0.5
+
+    # Vector Store Configurations
+    vector_backend: str = "chroma"
+    vector_quantization: str = "int8"
+    vector_rescore_multiplier: int = 4
+
+    # Scheduler Configurations
+    ollama_parallel_requests: int = 4
+    ollama_max_queue: int = 64
+    ollama_reserved_slots: int = 1
+
+    # Follow-Up Prefetch Configurations
+    prefetch_follow_ups: bool = False
+    prefetch_max_questions: int = 3
+
+    # Telemetry Configurations
+    telemetry_enabled: bool = False
+    metrics_port: int = 9464
+    trace_path: Path | None = None
+
+    def llm_config(self, name: str) -> LLMConfig:
+        """Provides the named LLM configuration, answer or routing, the model defaults to the LLM_MODEL_NAME."""
+        return LLMConfig(
+            model_name=getattr(self, f"{name}_llm_model_name") or self.llm_model_name,
+            request_timeout=getattr(self, f"{name}_llm_request_timeout"),
+            num_predict=getattr(self, f"{name}_llm_num_predict"),
+            context_window=self.llm_context_window
+        )
 
     class Config:
         """This class provides access to the environments variables for configuration."""
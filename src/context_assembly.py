@@ -0,0 +1,204 @@
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+from llama_index.core.utils import get_tokenizer
+
+from src.config import settings
+from src.response_structures import ResponseTypes
+from src.sparse_index import tokenize
+
+from dataclasses import dataclass
+from typing import Callable
+import json
+
+
+# Words per shingle when comparing the chunks for near-duplicates
+SHINGLE_SIZE = 5
+# Fraction of a chunk's shingles already in the context above which it is dropped as a duplicate
+DUPLICATE_CONTAINMENT = 0.9
+# Characters probed when looking for the overlap between two chunks
+OVERLAP_PROBE_CHARS = 64
+
+
+@dataclass
+class ContextReport:
+    """Prompt size of a single turn before and after the context assembly."""
+    candidate_chunks: int = 0
+    packed_chunks: int = 0
+    duplicates_dropped: int = 0
+    overlaps_trimmed: int = 0
+    history_messages: int = 0
+    packed_history_messages: int = 0
+    # Index of the oldest message of the history window
+    history_start: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    def summary(self) -> str:
+        """Provides a one line summary of the assembly."""
+        saved = 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0
+        return (
+            f"Prompt tokens {self.tokens_before} -> {self.tokens_after} ({saved:.0%} saved | "
+            f"chunks {self.packed_chunks}/{self.candidate_chunks}, {self.duplicates_dropped} duplicates dropped, "
+            f"{self.overlaps_trimmed} overlaps trimmed | history {self.packed_history_messages}/{self.history_messages} messages)"
+        )
+
+
+class ContextAssembler:
+    """This class implements the context assembly between the retrieval and the prompt.
+
+    Duplicate chunks are dropped and the spans two chunks share from the splitter overlap are trimmed, the chunks
+    are reranked locally by combining their retrieval score with their coverage of the query terms, and the chunks
+    and the chat history are packed into the token budget of the response type. Token counts use the default
+    tokenizer of Llama-Index as an approximation of the model's tokenizer."""
+
+    def __init__(
+        self, token_budgets: dict[ResponseTypes, int] | None = None, history_fraction: float | None = None,
+        max_chunks: int | None = None, rerank_weight: float | None = None, tokenizer: Callable[[str], list] | None = None
+    ) -> None:
+        """Class Constructor."""
+        self.token_budgets = token_budgets or {
+            ResponseTypes.RESEARCH: settings.research_token_budget,
+            ResponseTypes.SIMPLE: settings.simple_token_budget,
+        }
+        self.history_fraction = history_fraction if history_fraction is not None else settings.history_token_fraction
+        self.max_chunks = max_chunks or settings.top_k
+        self.rerank_weight = rerank_weight if rerank_weight is not None else settings.rerank_weight
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def count_message_tokens(self, messages: list[ChatMessage]) -> int:
+        return sum(self.count_tokens(message.content or "") for message in messages)
+
+    # ==== Deduplication ====
+    @staticmethod
+    def shingles(text: str) -> set[tuple[str, ...]]:
+        words = text.lower().split()
+        return {tuple(words[idx:idx + SHINGLE_SIZE]) for idx in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+
+    @staticmethod
+    def trim_overlap(text: str, other: str) -> str:
+        """Removes the span of a chunk shared with the start or the end of another chunk."""
+        # The chunk starts with the end of the other chunk
+        position = other.rfind(text[:OVERLAP_PROBE_CHARS])
+        if position >= 0 and text.startswith(other[position:]):
+            return text[len(other) - position:]
+        # The chunk ends with the start of the other chunk
+        position = text.rfind(other[:OVERLAP_PROBE_CHARS])
+        if position >= 0 and other.startswith(text[position:]):
+            return text[:position]
+        return text
+
+    def deduplicate(self, retrieved_nodes: list[NodeWithScore], report: ContextReport) -> list[NodeWithScore]:
+        """Drops the duplicate chunks and trims the overlapping spans, keeping the higher scored chunks intact."""
+        kept: list[NodeWithScore] = []
+        kept_texts: list[str] = []
+        covered: set[tuple[str, ...]] = set()
+        for result in retrieved_nodes:
+            text = result.node.get_content(metadata_mode=MetadataMode.NONE)
+            text_shingles = self.shingles(text)
+            if len(text_shingles.intersection(covered)) >= DUPLICATE_CONTAINMENT * len(text_shingles):
+                report.duplicates_dropped += 1
+                continue
+
+            trimmed = text
+            for other in kept_texts:
+                if len(trimmed) > OVERLAP_PROBE_CHARS:
+                    trimmed = self.trim_overlap(trimmed, other)
+            if not trimmed.strip():
+                report.duplicates_dropped += 1
+                continue
+            if trimmed != text:
+                report.overlaps_trimmed += 1
+                node = TextNode(id_=result.node.node_id, text=trimmed.strip(), metadata=dict(result.node.metadata))
+                result = NodeWithScore(node=node, score=result.score)
+
+            kept.append(result)
+            kept_texts.append(text)
+            covered.update(text_shingles)
+        return kept
+
+    # ==== Reranking ====
+    def rerank(self, query: str, retrieved_nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        """Reorders the chunks by their retrieval score blended with the fraction of the query terms they contain."""
+        query_terms = set(tokenize(query))
+        if not query_terms or not retrieved_nodes:
+            return retrieved_nodes
+
+        scores = [result.score or 0.0 for result in retrieved_nodes]
+        low, high = min(scores), max(scores)
+        reranked = []
+        for result, score in zip(retrieved_nodes, scores):
+            retrieval_score = (score - low) / (high - low) if high > low else 1.0
+            coverage = len(query_terms.intersection(tokenize(result.node.get_content(metadata_mode=MetadataMode.NONE))))
+            blended = (1 - self.rerank_weight) * retrieval_score + self.rerank_weight * coverage / len(query_terms)
+            reranked.append(NodeWithScore(node=result.node, score=blended))
+        return sorted(reranked, key=lambda result: result.score, reverse=True)
+
+    # ==== Packing ====
+    def pack_chunks(self, retrieved_nodes: list[NodeWithScore], budget: int) -> list[NodeWithScore]:
+        """Greedily packs the best chunks fitting the budget, up to the maximum number of chunks."""
+        packed: list[NodeWithScore] = []
+        for result in retrieved_nodes:
+            tokens = self.count_tokens(result.node.get_content(metadata_mode=MetadataMode.NONE))
+            if tokens <= budget:
+                packed.append(result)
+                budget -= tokens
+            if len(packed) >= self.max_chunks:
+                break
+        return packed
+
+    @staticmethod
+    def compact_message(message: ChatMessage) -> ChatMessage:
+        """Reduces a structured assistant response in the history to its answer."""
+        if message.role != "assistant" or not message.content:
+            return message
+        try:
+            answer = json.loads(message.content).get("answer")
+        except (ValueError, AttributeError):
+            return message
+        return ChatMessage(role="assistant", content=answer) if isinstance(answer, str) else message
+
+    def pack_history(self, history: list[ChatMessage], budget: int, start: int = 0) -> tuple[list[ChatMessage], int]:
+        """Keeps the compacted messages of the history window starting at a user message.
+
+        Once the window no longer fits the budget its start moves past the oldest messages until it fits half the
+        budget, so the start of the window, and with it the cached prompt prefix, only moves every few turns."""
+        compacted = [self.compact_message(message) for message in history]
+        tokens = [self.count_tokens(message.content or "") for message in compacted]
+
+        start = min(start, len(compacted))
+        if sum(tokens[start:]) > budget:
+            while start < len(compacted) and (sum(tokens[start:]) > budget // 2 or compacted[start].role != "user"):
+                start += 1
+        return compacted[start:], start
+
+    def assemble(
+        self, query: str, response_type: ResponseTypes, retrieved_nodes: list[NodeWithScore],
+        history: list[ChatMessage], fixed_tokens: int, history_start: int = 0
+    ) -> tuple[list[NodeWithScore], list[ChatMessage], ContextReport]:
+        """Assembles the chunks and the history of a turn within the token budget of its response type.
+
+        The fixed tokens are the ones of the prompt templates and the question, which are always sent. The history
+        window starts at the given message and the report carries the start of the window for the next turn."""
+        report = ContextReport(candidate_chunks=len(retrieved_nodes), history_messages=len(history))
+        report.tokens_before = fixed_tokens + self.count_message_tokens(history) + sum(
+            self.count_tokens(result.node.get_content(metadata_mode=MetadataMode.NONE)) for result in retrieved_nodes
+        )
+
+        budget = max(self.token_budgets.get(response_type, max(self.token_budgets.values())) - fixed_tokens, 0)
+        packed_history, report.history_start = self.pack_history(
+            history, int(budget * self.history_fraction), history_start
+        )
+        history_tokens = self.count_message_tokens(packed_history)
+
+        candidates = self.rerank(query, self.deduplicate(retrieved_nodes, report))
+        packed_nodes = self.pack_chunks(candidates, budget - history_tokens)
+
+        report.packed_chunks = len(packed_nodes)
+        report.packed_history_messages = len(packed_history)
+        report.tokens_after = fixed_tokens + history_tokens + sum(
+            self.count_tokens(result.node.get_content(metadata_mode=MetadataMode.NONE)) for result in packed_nodes
+        )
+        return packed_nodes, packed_history, report
@@ -0,0 +1,201 @@
+from pydantic import BaseModel
+
+from pathlib import Path
+import hashlib
+import json
+import re
+import threading
+import time
+
+
+# Collection shared by all the documents of the corpus
+CORPUS_COLLECTION_NAME = "corpus"
+# File names carrying an explicit version, the arXiv downloads such as 2401.01234v2.pdf and the names with a
+# separated version suffix such as paper_v2.pdf, but not model names such as mobilenetv2.pdf
+VERSIONED_NAME_PATTERNS = (
+    re.compile(r"(\d{4}\.\d{4,5})v(\d+)"),
+    re.compile(r"(.+?)[_-]v(\d+)", re.IGNORECASE),
+)
+# Placeholder titles written by the authoring tools, which unrelated documents share
+GENERIC_TITLE_PATTERN = re.compile(
+    r"untitled.*|microsoft (word|powerpoint) - .*|(document|paper|title|draft|main|slides|article)\s*\d*|"
+    r".*\.(pdf|docx?|tex|dvi)",
+    re.IGNORECASE
+)
+
+
+class DocumentRecord(BaseModel):
+    """Class implements a single entry of the Document Registry describing an indexed document."""
+    doc_hash: str
+    collection_name: str
+    file_name: str
+    chunk_count: int
+    embedding_model: str
+    chunk_size: int
+    chunk_overlap: int
+    indexed_at: float
+    title: str = ""
+    pages: int = 0
+
+    @property
+    def display_title(self) -> str:
+        return self.title or Path(self.file_name).stem
+
+    def is_compatible(self, embedding_model: str, chunk_size: int, chunk_overlap: int) -> bool:
+        """Checks if the record was indexed with the same embedding model and splitter settings."""
+        return (
+            self.embedding_model == embedding_model
+            and self.chunk_size == chunk_size
+            and self.chunk_overlap == chunk_overlap
+        )
+
+
+class DocumentRegistry:
+    """This class implements a content-addressed registry of all the indexed documents.
+
+    Documents are keyed by the SHA-256 hash of their bytes instead of their file path, so the same PDF
+    uploaded from any temporary path reattaches to its existing chunks without being parsed or embedded again.
+    The registry is also the metadata index of the corpus, holding the title and the page count of every document."""
+
+    def __init__(self, registry_path: Path) -> None:
+        """Class Constructor."""
+        self.registry_path: Path = Path(registry_path)
+        self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Guards the in-memory records and the registry file
+        self._lock = threading.Lock()
+        self._loaded_mtime: float | None = None
+        self.records: dict[str, DocumentRecord] = {}
+        self.reload()
+
+    @staticmethod
+    def hash_file(file_path: str | Path, block_size: int = 1 << 20) -> str:
+        """Calculates the SHA-256 content hash of a file."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            while block := file.read(block_size):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def collection_name_for(vector_backend: str = "chroma") -> str:
+        """Provides the collection name of the corpus of a vector backend, shared by all the documents."""
+        if vector_backend == "chroma":
+            return CORPUS_COLLECTION_NAME
+        return f"{CORPUS_COLLECTION_NAME}_{vector_backend}"
+
+    @staticmethod
+    def legacy_collection_name_for(doc_hash: str) -> str:
+        """Provides the per-document collection name used before the documents shared the corpus."""
+        return f"doc_{doc_hash[:16]}"
+
+    def reload(self) -> None:
+        """Loads the registry from disk if it has been modified since the last read."""
+        with self._lock:
+            if not self.registry_path.exists():
+                return
+            mtime = self.registry_path.stat().st_mtime
+            if self._loaded_mtime == mtime:
+                return
+            raw_records = json.loads(self.registry_path.read_text(encoding="utf-8"))
+            self.records = {
+                doc_hash: DocumentRecord.model_validate(record) for doc_hash, record in raw_records.items()
+            }
+            self._loaded_mtime = mtime
+
+    def lookup(self, doc_hash: str, embedding_model: str, chunk_size: int, chunk_overlap: int) -> DocumentRecord | None:
+        """Provides the record for a document if it was indexed with the same settings, otherwise None."""
+        self.reload()
+        record = self.records.get(doc_hash)
+        if record is None or not record.is_compatible(embedding_model, chunk_size, chunk_overlap):
+            return None
+        return record
+
+    @staticmethod
+    def file_version(file_name: str) -> tuple[str, int] | None:
+        """Provides the name and the number of an explicitly versioned file name, otherwise None."""
+        stem = Path(file_name).stem
+        for pattern in VERSIONED_NAME_PATTERNS:
+            match = pattern.fullmatch(stem)
+            if match:
+                return match.group(1).lower(), int(match.group(2))
+        return None
+
+    @staticmethod
+    def is_generic_title(title: str, file_name: str) -> bool:
+        """Checks if a title is missing, only repeats the file name or is a placeholder of an authoring tool."""
+        title = " ".join(title.split())
+        return not title or title == Path(file_name).stem or GENERIC_TITLE_PATTERN.fullmatch(title) is not None
+
+    @classmethod
+    def version_key(cls, title: str, file_name: str) -> str | None:
+        """Provides the key shared by the versions of a paper, its title when the PDF has a distinctive one,
+        otherwise its versioned file name without the version. Documents without either have no known versions."""
+        if not cls.is_generic_title(title, file_name):
+            return "title:" + " ".join(title.lower().split())
+        file_version = cls.file_version(file_name)
+        return f"file:{file_version[0]}" if file_version is not None else None
+
+    @classmethod
+    def supersedes(cls, file_name: str, record: DocumentRecord) -> bool:
+        """Checks if a file explicitly supersedes an indexed document, both file names carrying a version of the same
+        name and the indexed one the older. A shared title alone only allows reusing the embeddings."""
+        version, previous_version = cls.file_version(file_name), cls.file_version(record.file_name)
+        return (
+            version is not None and previous_version is not None
+            and version[0] == previous_version[0] and previous_version[1] < version[1]
+        )
+
+    def previous_version(
+        self, doc_hash: str, title: str, file_name: str, embedding_model: str, chunk_size: int, chunk_overlap: int
+    ) -> DocumentRecord | None:
+        """Provides the most recently indexed other version of a document, if it was indexed with the same settings.
+        The version is only a candidate for reusing the embeddings of its unchanged pages."""
+        version_key = self.version_key(title, file_name)
+        if version_key is None:
+            return None
+        for record in self.documents():
+            if (
+                record.doc_hash != doc_hash and record.is_compatible(embedding_model, chunk_size, chunk_overlap)
+                and self.version_key(record.title, record.file_name) == version_key
+            ):
+                return record
+        return None
+
+    def documents(self) -> list[DocumentRecord]:
+        """Provides the records of all the indexed documents, most recently indexed first."""
+        self.reload()
+        return sorted(self.records.values(), key=lambda record: record.indexed_at, reverse=True)
+
+    def register(
+        self, doc_hash: str, collection_name: str, file_name: str, chunk_count: int,
+        embedding_model: str, chunk_size: int, chunk_overlap: int, title: str = "", pages: int = 0
+    ) -> DocumentRecord:
+        """Adds or replaces the record for a document and persists the registry."""
+        record = DocumentRecord(
+            doc_hash=doc_hash, collection_name=collection_name, file_name=file_name,
+            chunk_count=chunk_count, embedding_model=embedding_model, chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap, indexed_at=time.time(), title=title, pages=pages
+        )
+        self.reload()
+        with self._lock:
+            self.records[doc_hash] = record
+            self.persist()
+        return record
+
+    def remove(self, doc_hash: str) -> None:
+        """Removes the record for a document and persists the registry."""
+        self.reload()
+        with self._lock:
+            if self.records.pop(doc_hash, None) is not None:
+                self.persist()
+
+    def persist(self) -> None:
+        """Atomically writes the registry to disk. Callers must hold the lock."""
+        temp_path = self.registry_path.with_suffix(".tmp")
+        temp_path.write_text(
+            json.dumps({doc_hash: record.model_dump() for doc_hash, record in self.records.items()}, indent=4),
+            encoding="utf-8"
+        )
+        temp_path.replace(self.registry_path)
+        self._loaded_mtime = self.registry_path.stat().st_mtime
@@ -0,0 +1,101 @@
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+class EmbeddingCache:
+    """This class implements a persistent, size capped embedding cache on top of SQLite.
+
+    Vectors are keyed by the hash of the embedding model name and the chunk text, so identical chunks shared across
+    papers or produced again on re-ingestion are only embedded once. The least recently used entries are evicted
+    once the cache grows beyond its maximum number of entries."""
+
+    def __init__(self, cache_path: Path, max_entries: int) -> None:
+        """Class Constructor."""
+        self.cache_path: Path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        # A single connection shared across the ingestion threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self._connection.commit()
+        self.entries: int = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Provides the cache key for a chunk of text embedded by a given model."""
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: list[str]) -> list[list[float] | None]:
+        """Looks up the vectors for a batch of texts, with None for every cache miss."""
+        keys = [self.make_key(model_name, text) for text in texts]
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+            found = {key: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows}
+
+            # Refreshing the recency of the hits for the LRU eviction
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._connection.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_name: str, texts: list[str], vectors: list[list[float]]) -> None:
+        """Stores the vectors for a batch of texts and evicts the least recently used entries beyond the size cap."""
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), model_name, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self.entries += self._connection.total_changes - before
+
+            overflow = self.entries - self.max_entries
+            if overflow > 0:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+                self.entries -= overflow
+                self.evictions += overflow
+            self._connection.commit()
+
+    def stats(self) -> dict[str, float]:
+        """Provides the counters of the cache for exporting."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,138 @@
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+
+from src.embedding_cache import EmbeddingCache
+from src.scheduler import scheduler
+from src.telemetry import telemetry
+
+from collections import OrderedDict
+import threading
+
+
+# Number of recent query embeddings kept in memory, so routing and retrieval of a turn embed the prompt once
+QUERY_CACHE_SIZE = 256
+
+
+class BatchedOllamaEmbedding(OllamaEmbedding):
+    """This class extends the Ollama Embedding to embed a batch of texts in a single request.
+
+    The stock client sends one `/api/embeddings` request per text, the batched variant uses `/api/embed`
+    which accepts a list of inputs and lets Ollama process the whole batch at once. Every request carries the
+    keep alive duration, so the embedding model stays loaded between the turns."""
+
+    keep_alive: float | str | None = Field(
+        default=None, description="Duration the model stays loaded after a request, eg. '30m'."
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedOllamaEmbedding"
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embeds a batch of texts with a single request."""
+        with scheduler.slot(), telemetry.span("embed", texts=len(texts)):
+            result = self._client.embed(
+                model=self.model_name, input=texts, options=self.ollama_additional_kwargs, keep_alive=self.keep_alive
+            )
+        return [list(embedding) for embedding in result["embeddings"]]
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embeds a batch of texts with a single request."""
+        async with scheduler.aslot():
+            with telemetry.span("embed", texts=len(texts)):
+                result = await self._async_client.embed(
+                    model=self.model_name, input=texts, options=self.ollama_additional_kwargs,
+                    keep_alive=self.keep_alive
+                )
+        return [list(embedding) for embedding in result["embeddings"]]
+
+    def get_general_text_embedding(self, texts: str) -> list[float]:
+        return self._get_text_embeddings([texts])[0]
+
+    async def aget_general_text_embedding(self, prompt: str) -> list[float]:
+        return (await self._aget_text_embeddings([prompt]))[0]
+
+
+class CachedEmbedding(BaseEmbedding):
+    """This class wraps an embedding model with the persistent Embedding Cache.
+
+    Chunk embeddings are served from the cache and only the cache misses are sent to the wrapped model,
+    query embeddings are kept in a small in-memory LRU for reuse within a turn."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _query_cache: OrderedDict = PrivateAttr()
+    _query_lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs) -> None:
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_model.embed_batch_size, **kwargs)
+        self._embed_model = embed_model
+        self._cache = cache
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def lookup_query(self, query: str) -> list[float] | None:
+        with self._query_lock:
+            embedding = self._query_cache.get(query)
+            if embedding is not None:
+                self._query_cache.move_to_end(query)
+            return embedding
+
+    def store_query(self, query: str, embedding: list[float]) -> None:
+        with self._query_lock:
+            self._query_cache[query] = embedding
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        embedding = self.lookup_query(query)
+        if embedding is None:
+            embedding = self._embed_model.get_query_embedding(query)
+            self.store_query(query, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        embedding = self.lookup_query(query)
+        if embedding is None:
+            embedding = await self._embed_model.aget_query_embedding(query)
+            self.store_query(query, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embeds a batch of texts, calling the wrapped model only for the cache misses."""
+        embeddings = self._cache.get_many(self.model_name, texts)
+        missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[idx] for idx in missing]
+            missing_embeddings = self._embed_model.get_text_embedding_batch(missing_texts)
+            self._cache.put_many(self.model_name, missing_texts, missing_embeddings)
+            for idx, embedding in zip(missing, missing_embeddings):
+                embeddings[idx] = embedding
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embeds a batch of texts, calling the wrapped model only for the cache misses."""
+        embeddings = self._cache.get_many(self.model_name, texts)
+        missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[idx] for idx in missing]
+            missing_embeddings = await self._embed_model.aget_text_embedding_batch(missing_texts)
+            self._cache.put_many(self.model_name, missing_texts, missing_embeddings)
+            for idx, embedding in zip(missing, missing_embeddings):
+                embeddings[idx] = embedding
+        return embeddings
@@ -0,0 +1,46 @@
+from src.config import settings
+
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, TypeVar
+import asyncio
+import contextvars
+import functools
+import threading
+
+
+T = TypeVar("T")
+
+
+class ExecutorKind(str, Enum):
+    """Enumeration of the bounded executors running the blocking work off the event loop."""
+    INDEXING = "indexing"
+    RETRIEVAL = "retrieval"
+    TRANSCRIPTION = "transcription"
+
+
+# Bounded thread pools shared by all the sessions, created on first use
+_executors: dict[ExecutorKind, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: ExecutorKind) -> ThreadPoolExecutor:
+    """Provides the shared executor of a kind of blocking work."""
+    max_workers = {
+        ExecutorKind.INDEXING: settings.indexing_workers,
+        ExecutorKind.RETRIEVAL: settings.retrieval_workers,
+        ExecutorKind.TRANSCRIPTION: settings.transcription_workers,
+    }
+    with _executors_lock:
+        if kind not in _executors:
+            _executors[kind] = ThreadPoolExecutor(max_workers=max_workers[kind], thread_name_prefix=kind.value)
+        return _executors[kind]
+
+
+async def run_blocking(kind: ExecutorKind, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking call in the bounded executor of its kind without blocking the event loop.
+
+    The call runs in a copy of the current context, so the trace tags of the turn follow it onto the executor."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(kind), functools.partial(context.run, fn, *args, **kwargs))
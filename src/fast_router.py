@@ -0,0 +1,174 @@
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from src.config import settings
+from src.executors import ExecutorKind, run_blocking
+from src.response_structures import ResponseTypes
+
+from collections import Counter
+from dataclasses import dataclass
+import re
+import threading
+import time
+import numpy as np
+
+
+# Keyword Rules for the unambiguous intents
+SUMMARY_PATTERN = re.compile(r"\b(summar(y|ise|ize)|recap)\b.*\b(conversation|chat)\b", re.IGNORECASE)
+# Standalone greetings and acknowledgements, only followed by punctuation or a closing word
+GREETING_PATTERN = re.compile(
+    r"^\W*(hi|hello|hey|hiya|greetings|good (morning|afternoon|evening)|thanks|thank you|thx|cheers|bye|goodbye|"
+    r"ok(ay)?|cool|great|nice|awesome)(\W+(thanks|thank you|there|so much|a lot|again|all|everyone))*\W*$",
+    re.IGNORECASE
+)
+# Filler words opening a prompt, stripped so "ok what is dropout" is routed as "what is dropout"
+FILLER_PATTERN = re.compile(
+    r"^\W*((ok(ay)?|alright|right|so|well|hmm+|um+|uh+|great|cool|nice|thanks|thank you)([\s,.!:;]+|$))+",
+    re.IGNORECASE
+)
+RESEARCH_PATTERN = re.compile(
+    r"\b(paper|document|pdf|section|figure|fig\.|table|equation|eq\.|page|appendix|abstract|author|authors|"
+    r"dataset|experiment|experiments|results|method|methodology|baseline|ablation|theorem|lemma|proof)\b",
+    re.IGNORECASE
+)
+
+# Example prompts defining the centroid of every intent
+EXEMPLARS: dict[ResponseTypes, list[str]] = {
+    ResponseTypes.SIMPLE: [
+        "Hello, how are you?", "Thanks, that was helpful!", "Who are you?", "What can you do?",
+        "Good morning", "That makes sense, thank you.", "Nice, let's continue.", "Goodbye!",
+    ],
+    ResponseTypes.RESEARCH: [
+        "What is the main contribution of this work?", "Explain equation 3 in simple terms.",
+        "How does the proposed method compare to the baselines?", "What datasets were used in the experiments?",
+        "Can you explain the architecture described in section 2?", "What are the limitations of this approach?",
+        "Summarise the results of the ablation study.", "Why does the model use attention here?",
+    ],
+    ResponseTypes.SUMMARY: [
+        "Generate a summary of our conversation.", "Summarise everything we discussed so far.",
+        "Give me a recap of this chat.", "Create study notes from our discussion.",
+    ],
+}
+
+
+@dataclass
+class RouteDecision:
+    """The outcome of the local routing, a response type of None defers the prompt to the ReAct agent."""
+    response_type: ResponseTypes | None
+    method: str
+    confidence: float
+    latency_ms: float
+
+
+class FastRouter:
+    """This class implements a tiered local router that skips the ReAct reasoning pass for obvious intents.
+
+    Keyword rules catch greetings, conversation summaries and explicit references to the document, a nearest-centroid
+    classifier over the query embedding handles the rest and only ambiguous prompts are left for the agent."""
+
+    # Centroids are shared across the routers, keyed by the embedding model name
+    _centroids: dict[str, dict[ResponseTypes, np.ndarray]] = {}
+    _centroids_lock = threading.Lock()
+
+    def __init__(self, embed_model: BaseEmbedding, min_similarity: float | None = None, margin: float | None = None) -> None:
+        """Class Constructor."""
+        self.embed_model = embed_model
+        self.min_similarity = min_similarity if min_similarity is not None else settings.router_min_similarity
+        self.margin = margin if margin is not None else settings.router_margin
+
+        # Routing decisions per method, every decision not made by the agent saves an LLM call
+        self.decisions: Counter[str] = Counter()
+        self.total_latency_ms: float = 0.0
+
+    @staticmethod
+    def normalise(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+    def centroids(self) -> dict[ResponseTypes, np.ndarray]:
+        """Embeds the exemplars once per embedding model and provides the normalised centroid of every intent."""
+        with self._centroids_lock:
+            if self.embed_model.model_name not in self._centroids:
+                self._centroids[self.embed_model.model_name] = {
+                    response_type: self.normalise(
+                        np.mean(self.normalise(np.array(self.embed_model.get_text_embedding_batch(prompts))), axis=0)
+                    )
+                    for response_type, prompts in EXEMPLARS.items()
+                }
+            return self._centroids[self.embed_model.model_name]
+
+    @staticmethod
+    def strip_filler(prompt: str) -> str:
+        """Strips the filler words opening a prompt, unless the prompt is only a greeting or made of them."""
+        if GREETING_PATTERN.match(prompt):
+            return prompt
+        stripped = FILLER_PATTERN.sub("", prompt, count=1)
+        return stripped if stripped.strip() else prompt
+
+    def classify_by_rules(self, prompt: str) -> ResponseTypes | None:
+        # A summary of the document, rather than of the conversation, is a research question
+        if SUMMARY_PATTERN.search(prompt) and not RESEARCH_PATTERN.search(prompt):
+            return ResponseTypes.SUMMARY
+        if GREETING_PATTERN.match(prompt):
+            return ResponseTypes.SIMPLE
+        if RESEARCH_PATTERN.search(prompt):
+            return ResponseTypes.RESEARCH
+        return None
+
+    def match_centroid(
+        self, query_embedding: list[float], centroids: dict[ResponseTypes, np.ndarray]
+    ) -> tuple[ResponseTypes | None, float]:
+        query = self.normalise(np.array(query_embedding))
+        similarities = sorted(
+            ((float(query @ centroid), response_type) for response_type, centroid in centroids.items()),
+            reverse=True
+        )
+        (best, best_type), (runner_up, _) = similarities[0], similarities[1]
+        if best >= self.min_similarity and best - runner_up >= self.margin:
+            return best_type, best
+        return None, best
+
+    def classify_by_centroid(self, prompt: str) -> tuple[ResponseTypes | None, float]:
+        return self.match_centroid(self.embed_model.get_query_embedding(prompt), self.centroids())
+
+    def record_decision(
+        self, response_type: ResponseTypes | None, method: str, confidence: float, start: float
+    ) -> RouteDecision:
+        decision = RouteDecision(
+            response_type=response_type, method=method, confidence=confidence,
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
+        self.decisions[method] += 1
+        self.total_latency_ms += decision.latency_ms
+        return decision
+
+    def classify(self, prompt: str) -> RouteDecision:
+        """Routes a prompt locally, falling back to the agent when the intent is ambiguous."""
+        start = time.perf_counter()
+        prompt = self.strip_filler(prompt)
+        response_type, method, confidence = self.classify_by_rules(prompt), "rule", 1.0
+        if response_type is None:
+            response_type, confidence = self.classify_by_centroid(prompt)
+            method = "centroid" if response_type is not None else "agent"
+        return self.record_decision(response_type, method, confidence, start)
+
+    async def aclassify(self, prompt: str) -> RouteDecision:
+        """Asynchronously routes a prompt locally, embedding the exemplars off the event loop on first use."""
+        start = time.perf_counter()
+        prompt = self.strip_filler(prompt)
+        response_type, method, confidence = self.classify_by_rules(prompt), "rule", 1.0
+        if response_type is None:
+            centroids = await run_blocking(ExecutorKind.RETRIEVAL, self.centroids)
+            query_embedding = await self.embed_model.aget_query_embedding(prompt)
+            response_type, confidence = self.match_centroid(query_embedding, centroids)
+            method = "centroid" if response_type is not None else "agent"
+        return self.record_decision(response_type, method, confidence, start)
+
+    def stats(self) -> dict[str, float]:
+        """Provides the routing counters, the LLM calls saved are the decisions made without the agent."""
+        total = sum(self.decisions.values())
+        return {
+            "rule": self.decisions["rule"],
+            "centroid": self.decisions["centroid"],
+            "agent": self.decisions["agent"],
+            "llm_calls_saved": self.decisions["rule"] + self.decisions["centroid"],
+            "mean_latency_ms": self.total_latency_ms / total if total else 0.0,
+        }
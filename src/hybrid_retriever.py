@@ -0,0 +1,136 @@
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever, VectorIndexRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+from src.config import settings
+from src.sparse_index import BM25Index, is_operator, tokenize
+from src.executors import ExecutorKind, run_blocking
+from src.telemetry import telemetry
+
+import re
+
+
+# Quoted phrases and LaTeX commands mark queries looking for an exact match in the document, apostrophes within
+# words aren't quotes
+EXACT_MATCH_PATTERN = re.compile(r"\"[^\"]+\"|(?<!\w)'[^']+'(?!\w)|\\[a-zA-Z]+")
+
+
+class HybridRetriever(BaseRetriever):
+    """This class implements the hybrid retrieval over the dense Chroma index and the sparse BM25 index.
+
+    Both result lists are min-max normalised and fused locally with `alpha` weighting the dense scores.
+    Queries for quoted phrases, LaTeX commands or math operators fully covered by the sparse index are answered
+    from it alone, skipping the embedding round trip. The async retrieval embeds the query asynchronously and runs the
+    blocking index lookups in the retrieval executor.
+
+    Across several documents of the corpus the scores are also normalised per document and blended with the
+    global scores, so the chunks of one long paper can't crowd out the best chunks of the other documents."""
+
+    def __init__(
+        self, dense_retriever: VectorIndexRetriever, sparse_index: BM25Index,
+        vector_store: BasePydanticVectorStore, embed_model: BaseEmbedding, similarity_top_k: int, alpha: float,
+        document_scope: list[str] | None = None, per_document: bool = False, document_weight: float | None = None
+    ) -> None:
+        """Class Constructor."""
+        super().__init__()
+        self.dense_retriever = dense_retriever
+        self.embed_model = embed_model
+        self.sparse_index = sparse_index
+        self.vector_store = vector_store
+        self.similarity_top_k = similarity_top_k
+        self.alpha = alpha
+
+        # Documents the sparse search is restricted to, None searches the entire index
+        self.document_scope = set(document_scope) if document_scope is not None else None
+        self.per_document = per_document
+        self.document_weight = document_weight if document_weight is not None else settings.corpus_document_weight
+
+    @staticmethod
+    def is_exact_match_query(query: str) -> bool:
+        """Checks if a query contains quoted phrases, LaTeX commands or math operators."""
+        return EXACT_MATCH_PATTERN.search(query) is not None or any(map(is_operator, tokenize(query)))
+
+    @staticmethod
+    def normalise(scores: dict[str, float]) -> dict[str, float]:
+        """Min-max scales the scores into [0, 1]."""
+        if not scores:
+            return {}
+        low, high = min(scores.values()), max(scores.values())
+        if high == low:
+            return {node_id: 1.0 for node_id in scores}
+        return {node_id: (score - low) / (high - low) for node_id, score in scores.items()}
+
+    def normalise_scores(self, scores: dict[str, float], nodes: dict[str, BaseNode]) -> dict[str, float]:
+        """Normalises the scores, blending in the scores normalised within every document when retrieving across documents."""
+        normalised = self.normalise(scores)
+        if not self.per_document:
+            return normalised
+
+        document_scores: dict[str, dict[str, float]] = {}
+        for node_id, score in scores.items():
+            document_scores.setdefault(nodes[node_id].metadata.get("doc_hash", ""), {})[node_id] = score
+        per_document = {}
+        for node_scores in document_scores.values():
+            per_document.update(self.normalise(node_scores))
+        return {
+            node_id: self.document_weight * per_document[node_id] + (1 - self.document_weight) * normalised[node_id]
+            for node_id in scores
+        }
+
+    def sparse_only(self, query: str, sparse_hits: list[tuple[str, float, float]]) -> list[NodeWithScore] | None:
+        """Provides the sparse results when they can answer the query without the dense index."""
+        if not sparse_hits or not self.is_exact_match_query(query) or sparse_hits[0][2] < 1.0:
+            return None
+
+        nodes = {node.node_id: node for node in self.vector_store.get_nodes(node_ids=[node_id for node_id, _, _ in sparse_hits])}
+        scores = self.normalise_scores({node_id: score for node_id, score, _ in sparse_hits if node_id in nodes}, nodes)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked]
+
+    def fuse(self, dense_results: list[NodeWithScore], sparse_hits: list[tuple[str, float, float]]) -> list[NodeWithScore]:
+        """Fuses the dense and the sparse results with relative score fusion."""
+        # Fetching the text of the chunks only found by the sparse index
+        nodes = {result.node.node_id: result.node for result in dense_results}
+        sparse_only_ids = [node_id for node_id, _, _ in sparse_hits if node_id not in nodes]
+        if sparse_only_ids:
+            nodes.update({node.node_id: node for node in self.vector_store.get_nodes(node_ids=sparse_only_ids)})
+
+        dense_scores = self.normalise_scores({result.node.node_id: result.score or 0.0 for result in dense_results}, nodes)
+        sparse_scores = self.normalise_scores(
+            {node_id: score for node_id, score, _ in sparse_hits if node_id in nodes}, nodes
+        )
+
+        fused = {
+            node_id: self.alpha * dense_scores.get(node_id, 0.0) + (1 - self.alpha) * sparse_scores.get(node_id, 0.0)
+            for node_id in nodes
+        }
+        ranked = sorted(fused, key=fused.get, reverse=True)[:self.similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id], score=fused[node_id]) for node_id in ranked]
+
+    def search_sparse(self, query: str) -> tuple[list[tuple[str, float, float]], list[NodeWithScore] | None]:
+        """Searches the sparse index, also providing the sparse results when they can answer the query alone."""
+        with telemetry.span("sparse_search"):
+            sparse_hits = self.sparse_index.search(query, self.similarity_top_k, self.document_scope)
+        return sparse_hits, self.sparse_only(query, sparse_hits)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        sparse_hits, sparse_results = self.search_sparse(query_bundle.query_str)
+        if sparse_results is not None:
+            return sparse_results
+        return self.retrieve_dense_and_fuse(query_bundle, sparse_hits)
+
+    def retrieve_dense_and_fuse(self, query_bundle: QueryBundle, sparse_hits: list[tuple[str, float, float]]) -> list[NodeWithScore]:
+        with telemetry.span("vector_search"):
+            dense_results = self.dense_retriever.retrieve(query_bundle)
+        return self.fuse(dense_results, sparse_hits)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        sparse_hits, sparse_results = await run_blocking(ExecutorKind.RETRIEVAL, self.search_sparse, query_bundle.query_str)
+        if sparse_results is not None:
+            return sparse_results
+
+        # Embedding the query on the event loop, the Chroma query itself is blocking
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self.embed_model.aget_agg_embedding_from_queries(query_bundle.embedding_strs)
+        return await run_blocking(ExecutorKind.RETRIEVAL, self.retrieve_dense_and_fuse, query_bundle, sparse_hits)
@@ -0,0 +1,293 @@
+from llama_index.core import Document
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode, NodeRelationship, TextNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+from src.config import settings
+from src.sparse_index import BM25Index
+from src.pdf_parsing import count_pages, parse_page_range, ping
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+import contextvars
+import hashlib
+import multiprocessing
+import threading
+import time
+
+
+# Callback receiving the stage name, the completed units and the total units of the stage
+ProgressCallback = Callable[[str, int, int], None]
+
+# Smallest number of pages worth handing to a separate worker process
+MIN_PAGES_PER_WORKER = 32
+
+# Persistent pool of parsing workers, started on first use since spawning a worker is far slower than parsing a page
+_parse_executor: ProcessPoolExecutor | None = None
+_parse_executor_lock = threading.Lock()
+
+
+def get_parse_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Provides the shared pool of parsing worker processes."""
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            # Spawning keeps the workers safe from the threads running in the parent process
+            _parse_executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_executor
+
+
+def warm_up_parse_workers(max_workers: int | None = None) -> None:
+    """Starts every parsing worker ahead of the first large document, blocking until they are ready."""
+    max_workers = max_workers or settings.parse_workers
+    executor = get_parse_executor(max_workers)
+    for future in [executor.submit(ping) for _ in range(max_workers)]:
+        future.result()
+
+
+@dataclass
+class IngestionReport:
+    """Timings and throughput of a single document ingestion.
+
+    The stages overlap, so each timing is measured from the start of the ingestion to the end of its stage."""
+    pages: int = 0
+    chunks: int = 0
+    # Pages whose chunks were reused from a previous version of the document, and the pages embedded
+    reused_pages: int = 0
+    embedded_pages: int = 0
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.total_seconds if self.total_seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        """Provides a one line summary of the ingestion."""
+        return (
+            f"Ingested {self.pages} pages into {self.chunks} chunks in {self.total_seconds:.2f}s "
+            f"({self.chunks_per_second:.1f} chunks/sec | parsed at {self.parse_seconds:.2f}s, "
+            f"embedded at {self.embed_seconds:.2f}s)"
+        ) + (
+            f" | {self.reused_pages} pages reused, {self.embedded_pages} re-embedded" if self.reused_pages else ""
+        )
+
+
+@dataclass
+class PreparedDocument:
+    """A document parsed and split ahead of its ingestion, the pages and the chunks of all its pages."""
+    file_path: str
+    total_pages: int
+    documents: list[Document]
+    nodes: list[BaseNode]
+    parse_seconds: float = 0.0
+
+
+def prepare_document(file_path: str, extra_info: dict, chunk_size: int, chunk_overlap: int) -> PreparedDocument:
+    """Parses and splits an entire document, run in a worker process while other documents are being embedded."""
+    start = time.perf_counter()
+    total_pages = count_pages(file_path)
+    documents = IngestionPipeline.build_documents(
+        parse_page_range(file_path, 0, total_pages), IngestionPipeline.document_info(file_path, extra_info, total_pages)
+    )
+    nodes = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)(documents)
+    return PreparedDocument(file_path, total_pages, documents, nodes, time.perf_counter() - start)
+
+
+class IngestionPipeline:
+    """This class implements the parallel ingestion stage of the RAG pipeline.
+
+    Pages are parsed in a pool of worker processes and every parsed range of pages is split and handed to the
+    embedding stage straight away. Chunks are embedded in batches with a bounded number of concurrent requests
+    to the embedding backend and the embedded chunks are written to the vector store and the sparse index in bulk.
+
+    Every chunk carries the content hash of its page, so when a revised version of a document is ingested the
+    chunks of its unchanged pages are copied from the previous version along with their embeddings and only the
+    changed pages are split and embedded."""
+
+    def __init__(
+        self, embed_model: BaseEmbedding, vector_store: BasePydanticVectorStore, splitter: SentenceSplitter,
+        sparse_index: BM25Index | None = None, parse_workers: int | None = None, batch_size: int | None = None,
+        concurrency: int | None = None, progress_callback: ProgressCallback | None = None
+    ) -> None:
+        """Class Constructor."""
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.splitter = splitter
+        self.sparse_index = sparse_index
+
+        # Parallelism Parameters
+        self.parse_workers = parse_workers or settings.parse_workers
+        self.batch_size = batch_size or settings.embed_batch_size
+        self.concurrency = concurrency or settings.embed_concurrency
+        self.progress_callback = progress_callback
+
+        # Documents and Chunks of the last ingestion
+        self.documents: list[Document] = []
+        self.nodes: list[BaseNode] = []
+
+    def report_progress(self, stage: str, completed: int, total: int) -> None:
+        """Forwards the progress of a stage to the progress callback."""
+        if self.progress_callback is not None:
+            self.progress_callback(stage, completed, total)
+
+    def iter_page_ranges(self, file_path: Path, total_pages: int) -> Iterator[list[tuple[int, str]]]:
+        """Parses the PDF in contiguous ranges of pages, in the worker pool for large documents."""
+        workers = max(1, min(self.parse_workers, total_pages // MIN_PAGES_PER_WORKER))
+        range_size = max(1, -(-total_pages // workers))
+        page_ranges = [(start, min(start + range_size, total_pages)) for start in range(0, total_pages, range_size)]
+
+        if workers == 1:
+            for start, stop in page_ranges:
+                yield parse_page_range(str(file_path), start, stop)
+            return
+
+        executor = get_parse_executor(self.parse_workers)
+        futures = [executor.submit(parse_page_range, str(file_path), start, stop) for start, stop in page_ranges]
+        for future in futures:
+            yield future.result()
+
+    def iter_documents(
+        self, file_path: Path, total_pages: int, extra_info: dict, prepared: PreparedDocument | None = None
+    ) -> Iterator[tuple[list[Document], list[BaseNode] | None]]:
+        """Provides the pages of the document range by range, along with their chunks when it was already split."""
+        if prepared is not None:
+            yield prepared.documents, prepared.nodes
+            return
+        for pages in self.iter_page_ranges(file_path, total_pages):
+            yield self.build_documents(pages, extra_info), None
+
+    @staticmethod
+    def document_info(file_path: str | Path, extra_info: dict | None, total_pages: int) -> dict:
+        """Provides the metadata shared by all the pages of a document."""
+        return dict(extra_info or {}, total_pages=total_pages, file_path=str(file_path))
+
+    @staticmethod
+    def build_documents(pages: list[tuple[int, str]], extra_info: dict) -> list[Document]:
+        """Creates one Document per page, mirroring the metadata produced by the PyMuPDFReader."""
+        documents = [
+            Document(text=text, extra_info=dict(
+                extra_info, source=str(page_number), page_number=page_number,
+                page_hash=hashlib.sha256(text.encode("utf-8")).hexdigest()
+            ))
+            for page_number, text in pages
+        ]
+
+        # Keeping the embeddings independent of the metadata and the bookkeeping keys out of the prompt
+        for document in documents:
+            document.excluded_embed_metadata_keys = list(document.metadata.keys())
+            document.excluded_llm_metadata_keys = [
+                key for key in document.metadata.keys() if key not in ("source", "page_number")
+            ]
+        return documents
+
+    @staticmethod
+    def group_previous_pages(previous_nodes: list[BaseNode]) -> dict[str, list[BaseNode]]:
+        """Groups the embedded chunks of a previous version of the document by the content hash of their page."""
+        previous_pages: dict[str, list[BaseNode]] = {}
+        for node in previous_nodes:
+            if node.metadata.get("page_hash") and node.embedding is not None:
+                previous_pages.setdefault(node.metadata["page_hash"], []).append(node)
+        for nodes in previous_pages.values():
+            nodes.sort(key=lambda node: node.start_char_idx or 0)
+        return previous_pages
+
+    @staticmethod
+    def reuse_nodes(previous_nodes: list[BaseNode], document: Document) -> list[BaseNode]:
+        """Copies the chunks of an unchanged page into the new version of the document, keeping their embeddings."""
+        return [
+            TextNode(
+                text=node.get_content(metadata_mode=MetadataMode.NONE), metadata=dict(document.metadata),
+                excluded_embed_metadata_keys=list(document.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(document.excluded_llm_metadata_keys),
+                start_char_idx=node.start_char_idx, end_char_idx=node.end_char_idx, embedding=node.embedding,
+                relationships={NodeRelationship.SOURCE: document.as_related_node_info()}
+            )
+            for node in previous_nodes
+        ]
+
+    def embed_batch(self, batch: list[BaseNode]) -> list[list[float]]:
+        """Embeds a single batch of nodes at the bulk priority of the scheduler."""
+        # Imported here so the PDF parsing workers never import the LLM setup
+        from src.scheduler import Priority, scheduler
+
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        with scheduler.priority(Priority.BULK):
+            return self.embed_model.get_text_embedding_batch(texts)
+
+    def run(
+        self, file_path: Path, extra_info: dict | None = None, previous_nodes: list[BaseNode] | None = None,
+        prepared: PreparedDocument | None = None
+    ) -> IngestionReport:
+        """Parses, splits, embeds and writes a document to the vector store.
+
+        The embedded chunks of a previous version of the document are reused for the pages left unchanged, and a
+        document already parsed and split by a worker only goes through the embedding and the write."""
+        report = IngestionReport()
+        start = time.perf_counter()
+        total_pages = prepared.total_pages if prepared is not None else count_pages(str(file_path))
+        extra_info = self.document_info(file_path, extra_info, total_pages)
+        self.documents, self.nodes = [], []
+        previous_pages = self.group_previous_pages(previous_nodes or [])
+
+        embed_futures: dict[Future, list[BaseNode]] = {}
+        self.report_progress("parse", 0, total_pages)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as embed_executor:
+            # Splitting and queueing the embeddings as soon as every range of pages is parsed
+            for documents, split_nodes in self.iter_documents(file_path, total_pages, extra_info, prepared):
+                changed_documents = []
+                for document in documents:
+                    if document.metadata["page_hash"] in previous_pages:
+                        self.nodes.extend(self.reuse_nodes(previous_pages[document.metadata["page_hash"]], document))
+                        report.reused_pages += 1
+                    else:
+                        changed_documents.append(document)
+                if split_nodes is None:
+                    nodes = self.splitter(changed_documents)
+                else:
+                    changed_ids = {document.doc_id for document in changed_documents}
+                    nodes = [node for node in split_nodes if node.ref_doc_id in changed_ids]
+                self.documents.extend(documents)
+                self.nodes.extend(nodes)
+                report.embedded_pages += len(changed_documents)
+                for batch_start in range(0, len(nodes), self.batch_size):
+                    batch = nodes[batch_start:batch_start + self.batch_size]
+                    # Every batch runs in a copy of the context, keeping the session of the ingestion for the scheduler
+                    embed_futures[embed_executor.submit(contextvars.copy_context().run, self.embed_batch, batch)] = batch
+                self.report_progress("parse", len(self.documents), total_pages)
+            report.parse_seconds = time.perf_counter() - start
+            if previous_pages:
+                self.report_progress("reuse", report.reused_pages, total_pages)
+
+            # Collecting the embeddings as the batches complete
+            completed = 0
+            embedded_chunks = sum(len(batch) for batch in embed_futures.values())
+            self.report_progress("embed", completed, embedded_chunks)
+            for future in as_completed(embed_futures):
+                batch = embed_futures[future]
+                for node, embedding in zip(batch, future.result()):
+                    node.embedding = embedding
+                completed += len(batch)
+                self.report_progress("embed", completed, embedded_chunks)
+        report.embed_seconds = time.perf_counter() - start
+
+        # Bulk write to the vector store
+        self.report_progress("write", 0, len(self.nodes))
+        self.vector_store.add(self.nodes)
+        if self.sparse_index is not None:
+            self.sparse_index.add(
+                [(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE)) for node in self.nodes],
+                group=extra_info.get("doc_hash")
+            )
+        self.report_progress("write", len(self.nodes), len(self.nodes))
+
+        report.pages = len(self.documents)
+        report.chunks = len(self.nodes)
+        report.total_seconds = time.perf_counter() - start
+        return report
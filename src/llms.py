@@ -0,0 +1,56 @@
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse
+from llama_index.llms.ollama import Ollama
+
+from src.scheduler import scheduler
+
+from typing import Any, Sequence
+
+
+class ScheduledOllama(Ollama):
+    """This class extends the Ollama LLM to hold a slot of the scheduler for every request.
+
+    Requests default to the interactive chat class unless a lower priority is set for the calling context, and a
+    streamed response holds its slot until the stream is exhausted or closed."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledOllama"
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        with scheduler.slot():
+            return super().chat(messages, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        async with scheduler.aslot():
+            return await super().achat(messages, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        ticket = scheduler.acquire()
+        try:
+            stream = super().stream_chat(messages, **kwargs)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+
+        def gen():
+            try:
+                yield from stream
+            finally:
+                scheduler.release(ticket)
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        ticket = await scheduler.aacquire()
+        try:
+            stream = await super().astream_chat(messages, **kwargs)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+
+        async def gen():
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                scheduler.release(ticket)
+        return gen()
@@ -0,0 +1,34 @@
+"""Size-tiered merge policy shared by the segmented on-disk indexes.
+
+Segments are grouped into tiers by their number of live rows, a tier spanning a factor of `MERGE_FACTOR` in size,
+and a merge is only scheduled once a tier holds `MERGE_FACTOR` segments. The merged segment lands in the next tier,
+so every row is rewritten once per tier, logarithmically many times, instead of on every merge of the whole index.
+"""
+
+
+# Number of segments of a similar size merged together, also the ratio of sizes between consecutive tiers
+MERGE_FACTOR = 8
+# Share of tombstoned rows past which a segment is rewritten on its own to drop them
+MAX_DELETED_RATIO = 0.5
+
+
+def size_tier(live_rows: int) -> int:
+    tier = 0
+    while live_rows >= MERGE_FACTOR ** (tier + 1):
+        tier += 1
+    return tier
+
+
+def select_merge(row_counts: list[int], deleted_counts: list[int]) -> list[int]:
+    """Provides the positions of the segments to merge next, given their total and tombstoned rows, if any."""
+    for position, (rows, deleted) in enumerate(zip(row_counts, deleted_counts)):
+        if deleted and deleted >= MAX_DELETED_RATIO * rows:
+            return [position]
+
+    tiers: dict[int, list[int]] = {}
+    for position, (rows, deleted) in enumerate(zip(row_counts, deleted_counts)):
+        tiers.setdefault(size_tier(rows - deleted), []).append(position)
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    return []
@@ -0,0 +1,135 @@
+from pydantic import BaseModel, ValidationError
+
+import json
+import re
+
+
+# A unicode escape cut off by the stream, preceded by its run of backslashes
+PARTIAL_UNICODE_ESCAPE = re.compile(r"(\\+)u[0-9a-fA-F]{0,3}$")
+
+
+class PartialJSONParser:
+    """This class implements an incremental parser for a JSON object streamed token by token.
+
+    The parser tracks the open strings, objects and arrays as the deltas arrive, so a snapshot closes them
+    and parses the text received so far. When the tail can't be closed (a dangling key, colon or literal)
+    the snapshot falls back to the last structural boundary. Top level members followed by a comma, or
+    by the end of the object, are reported as complete."""
+
+    def __init__(self) -> None:
+        """Class Constructor."""
+        self.text: str = ""
+
+        # Scanner state, the stack holds the closing characters of the open objects and arrays
+        self.stack: list[str] = []
+        self.in_string = False
+        self.escaped = False
+        self.closed = False
+
+        # Last position the text can be cut at along with the stack at that position
+        self.boundary: tuple[int, list[str]] | None = None
+        # Number of top level members completed
+        self.completed_members = 0
+
+    def feed(self, delta: str) -> None:
+        """Advances the scanner over the next delta of the stream."""
+        offset = len(self.text)
+        self.text += delta
+        for position, char in enumerate(delta, start=offset):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append("}" if char == "{" else "]")
+                self.boundary = (position + 1, list(self.stack))
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+                self.boundary = (position + 1, list(self.stack))
+                if not self.stack:
+                    self.closed = True
+            elif char == ",":
+                self.boundary = (position, list(self.stack))
+                if len(self.stack) == 1:
+                    self.completed_members += 1
+
+    def close_tail(self) -> str:
+        """Provides the text received so far with the open string, objects and arrays closed."""
+        tail = self.text
+        if self.in_string:
+            if self.escaped:
+                tail = tail[:-1]
+            partial_escape = PARTIAL_UNICODE_ESCAPE.search(tail)
+            if partial_escape and len(partial_escape.group(1)) % 2:
+                tail = tail[:partial_escape.start() + len(partial_escape.group(1)) - 1]
+            tail += '"'
+        return tail + "".join(reversed(self.stack))
+
+    def snapshot(self) -> tuple[dict, list[str]]:
+        """Parses the text received so far, providing the data and the keys of the complete top level members."""
+        try:
+            data = json.loads(self.close_tail())
+        except ValueError:
+            if self.boundary is None:
+                return {}, []
+            cut, stack = self.boundary
+            try:
+                data = json.loads(self.text[:cut] + "".join(reversed(stack)))
+            except ValueError:
+                return {}, []
+
+        if not isinstance(data, dict):
+            return {}, []
+        return data, list(data)[:self.completed_members + int(self.closed)]
+
+
+def parse_partial_json(text: str) -> tuple[dict, list[str]]:
+    """Parses a truncated JSON object, providing the data and the keys of its complete top level members."""
+    parser = PartialJSONParser()
+    parser.feed(text)
+    return parser.snapshot()
+
+
+def salvage_json(text: str, model: type[BaseModel]) -> tuple[dict, list[str]]:
+    """Parses a truncated or malformed structured response into the fields that are valid against its model.
+
+    The open strings, objects and arrays of a response cut off by the token limit are closed. The invalid items of
+    list fields are dropped, the other invalid fields are dropped whole, and the required fields missing from the
+    result are provided in the order of the model so that only they are asked for again."""
+    start = text.find("{")
+    data, _ = parse_partial_json(text[start:]) if start >= 0 else ({}, [])
+    data = {key: value for key, value in data.items() if key in model.model_fields}
+
+    while True:
+        try:
+            model.model_validate(data)
+            return data, []
+        except ValidationError as e:
+            errors = e.errors()
+
+        invalid_fields: set[str] = set()
+        invalid_items: dict[str, set[int]] = {}
+        for error in errors:
+            field, *path = error["loc"]
+            if field not in data:
+                continue
+            if path and isinstance(path[0], int) and isinstance(data[field], list):
+                invalid_items.setdefault(field, set()).add(path[0])
+            else:
+                invalid_fields.add(field)
+
+        # Only missing fields are left once nothing invalid remains
+        if not invalid_fields and not invalid_items:
+            missing = [field for field, info in model.model_fields.items() if info.is_required() and field not in data]
+            return data, missing
+
+        for field in invalid_fields:
+            del data[field]
+        for field, items in invalid_items.items():
+            if field in data:
+                data[field] = [item for idx, item in enumerate(data[field]) if idx not in items]
@@ -0,0 +1,28 @@
+"""Lightweight PDF parsing helpers executed inside the ingestion worker processes.
+
+This module deliberately imports nothing beyond PyMuPDF so freshly spawned workers start quickly."""
+import fitz
+import os
+
+
+def count_pages(file_path: str) -> int:
+    """Provides the number of pages in a PDF."""
+    with fitz.open(file_path) as pdf:
+        return len(pdf)
+
+
+def read_title(file_path: str) -> str:
+    """Provides the title from the metadata of a PDF, empty when it has none."""
+    with fitz.open(file_path) as pdf:
+        return (pdf.metadata or {}).get("title", "").strip()
+
+
+def parse_page_range(file_path: str, start: int, stop: int) -> list[tuple[int, str]]:
+    """Extracts the text for a range of pages as (page number, text) pairs with 1-based page numbers."""
+    with fitz.open(file_path) as pdf:
+        return [(page_number + 1, pdf[page_number].get_text()) for page_number in range(start, stop)]
+
+
+def ping() -> int:
+    """Provides the process id of the worker, used to start the workers ahead of time."""
+    return os.getpid()
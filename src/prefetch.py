@@ -0,0 +1,154 @@
+from llama_index.core.schema import NodeWithScore
+
+from src.config import settings
+from src.context_assembly import ContextReport
+from src.query_engine import QueryEngine
+from src.response_structures import ResponseTypes
+from src.scheduler import Priority, scheduler
+from src.telemetry import telemetry
+
+from dataclasses import dataclass
+import asyncio
+import json
+import re
+import threading
+import time
+
+
+# Interval at which a pending generation checks whether Ollama became idle
+IDLE_POLL_SECONDS = 0.25
+
+
+@dataclass
+class PrefetchedAnswer:
+    """The retrieved nodes of a follow-up question and, once generated, its validated response."""
+    question: str
+    scope_key: str
+    retrieved_nodes: list[NodeWithScore]
+    response_json: str | None = None
+    context_report: ContextReport | None = None
+    generation_seconds: float = 0.0
+
+
+class PrefetchStats:
+    """Counters of the follow-up prefetch shared by all the sessions."""
+
+    def __init__(self) -> None:
+        """Class Constructor."""
+        self._lock = threading.Lock()
+        self.counters: dict[str, float] = dict.fromkeys((
+            "scheduled", "retrieved", "generated", "failed", "cancelled", "hits", "retrieval_hits",
+            "wasted_retrievals", "wasted_generations", "wasted_generation_seconds"
+        ), 0)
+
+    def add(self, **counts: float) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self.counters[name] += value
+
+    def stats(self) -> dict[str, float]:
+        """Provides the counters along with the share of the generated follow-ups that were asked, or wasted."""
+        with self._lock:
+            stats = dict(self.counters)
+        generated = stats["generated"]
+        stats["hit_rate"] = stats["hits"] / generated if generated else 0.0
+        stats["waste_rate"] = stats["wasted_generations"] / generated if generated else 0.0
+        return stats
+
+
+# Counters of every session, exported with the metrics
+prefetch_stats = PrefetchStats()
+telemetry.register_collector("prefetch", prefetch_stats.stats)
+
+
+class FollowUpPrefetcher:
+    """This class implements the speculative prefetch of the follow-up questions suggested by a research answer.
+
+    While the user reads the answer, the follow-up questions are retrieved in the background at the lowest
+    priority of the scheduler, and their responses are generated one at a time whenever Ollama is otherwise idle.
+    A follow-up that is clicked or retyped is then answered straight from the prefetch, or at least skips its
+    retrieval. Anything else sent by the user cancels the prefetch, and the prefetched work never used is counted
+    as waste."""
+
+    def __init__(self, query_engine: QueryEngine, max_questions: int | None = None) -> None:
+        """Class Constructor."""
+        self.query_engine = query_engine
+        self.max_questions = max_questions or settings.prefetch_max_questions
+
+        # Prefetched follow-ups by their normalised question
+        self.entries: dict[str, PrefetchedAnswer] = {}
+        self.task: asyncio.Task | None = None
+
+    @staticmethod
+    def normalise(question: str) -> str:
+        return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+    def schedule(self, response_json: str) -> None:
+        """Starts prefetching the follow-up questions of a research response, replacing any earlier prefetch."""
+        self.cancel()
+        try:
+            questions = json.loads(response_json).get("follow_up_questions") or []
+        except (ValueError, AttributeError):
+            return
+        # Asking each distinct question once
+        unique_questions: dict[str, str] = {}
+        for question in questions:
+            if isinstance(question, str) and question.strip():
+                unique_questions.setdefault(self.normalise(question), question)
+        if not unique_questions:
+            return
+        questions = list(unique_questions.values())[:self.max_questions]
+        prefetch_stats.add(scheduled=len(questions))
+        self.task = asyncio.create_task(self.prefetch(questions, self.query_engine.scope_key))
+
+    async def prefetch(self, questions: list[str], scope_key: str) -> None:
+        """Retrieves every follow-up question first, as retrieval is cheap, then generates their responses while
+        Ollama has nothing else to serve."""
+        with scheduler.priority(Priority.PREFETCH), telemetry.span("prefetch", questions=len(questions)):
+            for question in questions:
+                try:
+                    retrieved_nodes = await self.query_engine.custom_retriever.aretrieve(question)
+                except Exception as e:
+                    print(f"Error during the prefetch of a follow-up: {e}")
+                    prefetch_stats.add(failed=1)
+                    continue
+                self.entries[self.normalise(question)] = PrefetchedAnswer(question, scope_key, retrieved_nodes)
+                prefetch_stats.add(retrieved=1)
+
+            for entry in list(self.entries.values()):
+                while not scheduler.idle():
+                    await asyncio.sleep(IDLE_POLL_SECONDS)
+                start = time.perf_counter()
+                try:
+                    entry.response_json, entry.context_report = await self.query_engine.agenerate(
+                        entry.question, ResponseTypes.RESEARCH, entry.retrieved_nodes
+                    )
+                except Exception as e:
+                    print(f"Error during the prefetch of a follow-up: {e}")
+                    prefetch_stats.add(failed=1)
+                    continue
+                entry.generation_seconds = time.perf_counter() - start
+                prefetch_stats.add(generated=1)
+
+    def take(self, user_prompt: str) -> PrefetchedAnswer | None:
+        """Provides the prefetch of a follow-up question being asked on the same scope, otherwise None."""
+        entry = self.entries.get(self.normalise(user_prompt))
+        if entry is None or entry.scope_key != self.query_engine.scope_key:
+            return None
+        del self.entries[self.normalise(user_prompt)]
+        prefetch_stats.add(**{"hits" if entry.response_json is not None else "retrieval_hits": 1})
+        return entry
+
+    def cancel(self) -> None:
+        """Cancels the running prefetch and drops the prefetched follow-ups, counting them as waste."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            prefetch_stats.add(cancelled=1)
+        self.task = None
+
+        generated = [entry for entry in self.entries.values() if entry.response_json is not None]
+        prefetch_stats.add(
+            wasted_retrievals=len(self.entries), wasted_generations=len(generated),
+            wasted_generation_seconds=sum(entry.generation_seconds for entry in generated)
+        )
+        self.entries.clear()
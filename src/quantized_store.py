@@ -0,0 +1,432 @@
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore, FilterOperator, MetadataFilters, VectorStoreQuery, VectorStoreQueryResult
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from pydantic import PrivateAttr
+
+from pathlib import Path
+from typing import Any
+import json
+import shutil
+import threading
+import numpy as np
+
+from src.merge_policy import select_merge
+
+
+# Quantizations of the stored vectors and the dtype of their codes
+QUANTIZATIONS = {"int8": np.int8, "float16": np.float16}
+# Rows of the codes dequantized at once while scanning a segment, small enough for the block to stay in the CPU cache
+SCAN_BLOCK_ROWS = 512
+# Metadata key the chunks are grouped by, the filters of the Query Engine only target it
+GROUP_KEY = "doc_hash"
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray]:
+    """Quantizes unit vectors into their codes and the per-vector scale restoring them."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class VectorSegment:
+    """An immutable, memory-mapped slice of the quantized vector store.
+
+    Every chunk owns a row of the quantized codes scanned by the searches, a row of the float16 vectors only read
+    for the rescored candidates, the codes themselves when they already are float16, and a range of the payload bytes holding the serialized node. Every chunk
+    belongs to a group, the document it was split from, so the searches can be restricted to a set of documents."""
+
+    def __init__(self, segment_path: Path) -> None:
+        self.segment_path = segment_path
+        self.name = segment_path.name
+        self.codes: np.ndarray = np.load(segment_path / "codes.npy", mmap_mode="r")
+        self.scales: np.ndarray = np.load(segment_path / "scales.npy", mmap_mode="r")
+        # The rescoring vectors are only mapped while they are read, keeping them out of the resident memory. Segments
+        # of float16 codes have none, and the segments written before the vectors were halved hold them as float32
+        self.vectors_offset: int | None = None
+        self.vectors_dtype: np.dtype = self.codes.dtype
+        if (segment_path / "vectors.npy").exists():
+            vectors = np.load(segment_path / "vectors.npy", mmap_mode="r")
+            self.vectors_offset, self.vectors_dtype = vectors.offset, vectors.dtype
+            del vectors
+        self.payload_offsets: np.ndarray = np.load(segment_path / "payload_offsets.npy", mmap_mode="r")
+        self.payloads: np.ndarray = np.memmap(segment_path / "payloads.bin", dtype=np.uint8, mode="r") \
+            if self.payload_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.node_ids: list[str] = json.loads((segment_path / "node_ids.json").read_text(encoding="utf-8"))
+        self.ref_doc_ids: list[str | None] = json.loads((segment_path / "ref_doc_ids.json").read_text(encoding="utf-8"))
+        self.group_names: list[str | None] = json.loads((segment_path / "group_names.json").read_text(encoding="utf-8"))
+        self.group_ids: np.ndarray = np.load(segment_path / "group_ids.npy", mmap_mode="r")
+
+    def group_mask(self, groups: set[str]) -> np.ndarray:
+        """Provides the mask of the chunks belonging to any of the groups."""
+        group_numbers = [number for number, name in enumerate(self.group_names) if name in groups]
+        return np.isin(self.group_ids, group_numbers)
+
+    def payload(self, row: int) -> dict:
+        start, stop = int(self.payload_offsets[row]), int(self.payload_offsets[row + 1])
+        return json.loads(self.payloads[start:stop].tobytes().decode("utf-8"))
+
+    def node(self, row: int) -> BaseNode:
+        node = metadata_dict_to_node(self.payload(row))
+        node.embedding = None
+        return node
+
+    def vectors(self, rows: list[int]) -> np.ndarray:
+        """Reads the rescoring vectors of the given rows.
+
+        The rows are gathered in their order on disk, so neighbouring rows are read together."""
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind="stable")
+        vectors = np.empty((len(rows), self.codes.shape[1]), dtype=np.float32)
+        if len(rows) and self.vectors_offset is None:
+            vectors[order] = self.codes[rows[order]]
+        elif len(rows):
+            mapped = np.memmap(
+                self.segment_path / "vectors.npy", dtype=self.vectors_dtype, mode="r", offset=self.vectors_offset,
+                shape=(len(self.node_ids), self.codes.shape[1])
+            )
+            vectors[order] = mapped[rows[order]]
+            del mapped
+        return vectors
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Scores all the chunks against a unit query vector with their quantized codes."""
+        scores = np.empty(len(self.node_ids), dtype=np.float32)
+        block = np.empty((min(SCAN_BLOCK_ROWS, len(scores)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(scores), SCAN_BLOCK_ROWS):
+            codes = self.codes[start:start + SCAN_BLOCK_ROWS]
+            np.copyto(block[:len(codes)], codes, casting="unsafe")
+            scores[start:start + len(codes)] = block[:len(codes)] @ query
+        return scores * self.scales
+
+    @staticmethod
+    def write(
+        segment_path: Path, node_ids: list[str], ref_doc_ids: list[str | None], groups: list[str | None],
+        vectors: np.ndarray, payloads: list[bytes], quantization: str
+    ) -> None:
+        """Writes a segment from the unit vectors and the serialized nodes of its chunks."""
+        segment_path.mkdir(parents=True, exist_ok=True)
+        codes, scales = quantize(vectors, quantization)
+        payload_offsets = np.zeros(len(payloads) + 1, dtype=np.int64)
+        payload_offsets[1:] = np.cumsum([len(payload) for payload in payloads])
+
+        np.save(segment_path / "codes.npy", codes)
+        np.save(segment_path / "scales.npy", scales)
+        # The rescoring vectors are kept in float16, their error of about 1e-3 in the cosine similarity is well below the
+        # differences between the candidates, and float16 codes already are those vectors
+        if codes.dtype != np.float16:
+            np.save(segment_path / "vectors.npy", vectors.astype(np.float16))
+        np.save(segment_path / "payload_offsets.npy", payload_offsets)
+        (segment_path / "payloads.bin").write_bytes(b"".join(payloads))
+        (segment_path / "node_ids.json").write_text(json.dumps(node_ids), encoding="utf-8")
+        (segment_path / "ref_doc_ids.json").write_text(json.dumps(ref_doc_ids), encoding="utf-8")
+
+        group_names = list(dict.fromkeys(groups))
+        group_numbers = {name: number for number, name in enumerate(group_names)}
+        np.save(segment_path / "group_ids.npy", np.array([group_numbers[group] for group in groups], dtype=np.int32))
+        (segment_path / "group_names.json").write_text(json.dumps(group_names), encoding="utf-8")
+
+
+class QuantizedVectorStore(BasePydanticVectorStore):
+    """This class implements a compact on-disk vector store of scalar quantized embeddings.
+
+    Chunks are added as append-only segments of memory-mapped NumPy arrays holding int8 or float16 codes of the
+    normalised embeddings, deleted chunks are tombstoned and segments of a similar size are merged by the
+    size-tiered merge policy, so a large corpus is never rewritten as a whole. A query scans the codes with vectorised NumPy and rescores the best candidates against their float16
+    vectors, which are only paged in for those candidates, so the recall stays close to that of an exact cosine search."""
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    store_path: Path
+    quantization: str = "int8"
+    rescore_multiplier: int = 4
+
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _next_segment: int = PrivateAttr(default=0)
+    _segments: list[VectorSegment] = PrivateAttr(default_factory=list)
+    # Tombstoned node ids per segment name
+    _deleted: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+    # Segment and row of every live chunk
+    _locations: dict[str, tuple[VectorSegment, int]] = PrivateAttr(default_factory=dict)
+    # Tombstoned rows per segment name, rebuilt after the tombstones of the segment change
+    _deleted_rows: dict[str, np.ndarray] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, store_path: Path, quantization: str = "int8", rescore_multiplier: int = 4, **kwargs: Any) -> None:
+        """Class Constructor."""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization {quantization}, expected one of {', '.join(QUANTIZATIONS)}.")
+        super().__init__(
+            store_path=Path(store_path), quantization=quantization, rescore_multiplier=rescore_multiplier, **kwargs
+        )
+        self.load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "QuantizedVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    # ==== Persistence ====
+    def load(self) -> None:
+        """Loads the tombstones and memory-maps the segments."""
+        with self._lock:
+            manifest_path = self.store_path / "manifest.json"
+            if not manifest_path.exists():
+                return
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            if manifest.get("quantization", self.quantization) != self.quantization:
+                raise ValueError(f"The vector store at {self.store_path} is quantized as {manifest['quantization']}.")
+            self._next_segment = manifest["next_segment"]
+            self._segments = [VectorSegment(self.store_path / name) for name in manifest["segments"]]
+            self._deleted = {name: set(node_ids) for name, node_ids in manifest["deleted"].items()}
+            self.index_locations()
+
+    def index_locations(self) -> None:
+        self._locations, self._deleted_rows = {}, {}
+        for segment in self._segments:
+            deleted = self._deleted.get(segment.name, set())
+            for row, node_id in enumerate(segment.node_ids):
+                if node_id not in deleted:
+                    self._locations[node_id] = (segment, row)
+
+    def persist(self, persist_path: str | None = None, fs: Any = None) -> None:
+        """Atomically writes the manifest, the segments are written when they are created."""
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "quantization": self.quantization,
+            "next_segment": self._next_segment,
+            "segments": [segment.name for segment in self._segments],
+            "deleted": {name: sorted(node_ids) for name, node_ids in self._deleted.items() if node_ids},
+        }
+        temp_path = self.store_path / "manifest.json.tmp"
+        temp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        temp_path.replace(self.store_path / "manifest.json")
+
+    def clear(self) -> None:
+        """Removes the entire store from disk."""
+        with self._lock:
+            shutil.rmtree(self.store_path, ignore_errors=True)
+            self._next_segment, self._segments, self._deleted = 0, [], {}
+            self._locations, self._deleted_rows = {}, {}
+
+    # ==== Indexing ====
+    @property
+    def count(self) -> int:
+        return len(self._locations)
+
+    @staticmethod
+    def normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        """Adds a batch of embedded nodes to the store as a new segment."""
+        if not nodes:
+            return []
+        with self._lock:
+            node_ids = [node.node_id for node in nodes]
+            vectors = self.normalise(np.array([node.get_embedding() for node in nodes], dtype=np.float32))
+            payloads = [
+                json.dumps(node_to_metadata_dict(node, remove_text=False, flat_metadata=False)).encode("utf-8")
+                for node in nodes
+            ]
+
+            # Re-adding a chunk replaces the previous version of it
+            self.tombstone(node_ids)
+            segment_path = self.store_path / f"segment_{self._next_segment:05d}"
+            self._next_segment += 1
+            VectorSegment.write(
+                segment_path, node_ids, [node.ref_doc_id for node in nodes],
+                [node.metadata.get(GROUP_KEY) for node in nodes], vectors, payloads, self.quantization
+            )
+            segment = VectorSegment(segment_path)
+            self._segments.append(segment)
+            for row, node_id in enumerate(segment.node_ids):
+                self._locations[node_id] = (segment, row)
+
+            self.merge_segments()
+            self.persist()
+            return node_ids
+
+    def tombstone(self, node_ids: list[str]) -> None:
+        for node_id in node_ids:
+            location = self._locations.pop(node_id, None)
+            if location is not None:
+                self._deleted.setdefault(location[0].name, set()).add(node_id)
+                self._deleted_rows.pop(location[0].name, None)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Tombstones the chunks of a source document."""
+        with self._lock:
+            self.tombstone([
+                node_id for node_id, (segment, row) in self._locations.items() if segment.ref_doc_ids[row] == ref_doc_id
+            ])
+            self.merge_segments()
+            self.persist()
+
+    def delete_nodes(
+        self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None, **delete_kwargs: Any
+    ) -> None:
+        """Tombstones the chunks by id and / or by document filters, they are dropped for good once their segment is
+        merged."""
+        with self._lock:
+            self.tombstone([node_id for node_id, _, _ in self.select(node_ids, filters)])
+            self.merge_segments()
+            self.persist()
+
+    def merge_segments(self) -> None:
+        """Merges the segments selected by the size-tiered merge policy until it selects none."""
+        while merge := select_merge(
+            [len(segment.node_ids) for segment in self._segments],
+            [len(self._deleted.get(segment.name, ())) for segment in self._segments]
+        ):
+            self.merge([self._segments[position] for position in merge])
+
+    def compact(self) -> None:
+        """Merges all the segments into one, dropping the tombstoned chunks."""
+        with self._lock:
+            if self._segments:
+                self.merge(list(self._segments))
+            self.persist()
+
+    def merge(self, segments: list[VectorSegment]) -> None:
+        """Merges segments into a single new segment, dropping their tombstoned chunks and leaving the other segments
+        untouched."""
+        node_ids, ref_doc_ids, groups, payloads = [], [], [], []
+        vectors = [np.zeros((0, segments[0].codes.shape[1]), dtype=np.float32)]
+        for segment in segments:
+            deleted = self._deleted.get(segment.name, set())
+            rows = [row for row, node_id in enumerate(segment.node_ids) if node_id not in deleted]
+            node_ids.extend(segment.node_ids[row] for row in rows)
+            ref_doc_ids.extend(segment.ref_doc_ids[row] for row in rows)
+            groups.extend(segment.group_names[int(segment.group_ids[row])] for row in rows)
+            payloads.extend(
+                segment.payloads[int(segment.payload_offsets[row]):int(segment.payload_offsets[row + 1])].tobytes()
+                for row in rows
+            )
+            vectors.append(segment.vectors(rows))
+
+        merged = {segment.name for segment in segments}
+        self._segments = [segment for segment in self._segments if segment.name not in merged]
+        for name in merged:
+            self._deleted.pop(name, None)
+            self._deleted_rows.pop(name, None)
+
+        if node_ids:
+            segment_path = self.store_path / f"segment_{self._next_segment:05d}"
+            self._next_segment += 1
+            VectorSegment.write(
+                segment_path, node_ids, ref_doc_ids, groups, np.concatenate(vectors), payloads, self.quantization
+            )
+            segment = VectorSegment(segment_path)
+            self._segments.append(segment)
+            for row, node_id in enumerate(segment.node_ids):
+                self._locations[node_id] = (segment, row)
+        self.persist()
+
+        for segment in segments:
+            shutil.rmtree(segment.segment_path, ignore_errors=True)
+
+    # ==== Lookup ====
+    @staticmethod
+    def filter_groups(filters: MetadataFilters | None) -> set[str] | None:
+        """Translates the document filters of the Query Engine into the groups they target, None targets all."""
+        if filters is None or not filters.filters:
+            return None
+        groups: set[str] | None = None
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters) or metadata_filter.key != GROUP_KEY:
+                raise ValueError(f"The quantized vector store only filters on {GROUP_KEY}.")
+            if metadata_filter.operator == FilterOperator.EQ:
+                values = {str(metadata_filter.value)}
+            elif metadata_filter.operator == FilterOperator.IN:
+                values = {str(value) for value in metadata_filter.value}
+            else:
+                raise ValueError(f"The quantized vector store doesn't support the {metadata_filter.operator} filter.")
+            groups = values if groups is None else groups.intersection(values)
+        return groups
+
+    def select(
+        self, node_ids: list[str] | None, filters: MetadataFilters | None
+    ) -> list[tuple[str, VectorSegment, int]]:
+        """Provides the live chunks with the given ids and within the filtered documents."""
+        groups = self.filter_groups(filters)
+        candidates = self._locations if node_ids is None else {
+            node_id: self._locations[node_id] for node_id in node_ids if node_id in self._locations
+        }
+        return [
+            (node_id, segment, row) for node_id, (segment, row) in candidates.items()
+            if groups is None or segment.group_names[int(segment.group_ids[row])] in groups
+        ]
+
+    def get_nodes(
+        self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None, embeddings: bool = False
+    ) -> list[BaseNode]:
+        """Provides the chunks by id and / or by document filters, optionally with their normalised embeddings."""
+        with self._lock:
+            nodes = []
+            for _, segment, row in self.select(node_ids, filters):
+                node = segment.node(row)
+                if embeddings:
+                    node.embedding = segment.vectors([row])[0].tolist()
+                nodes.append(node)
+            return nodes
+
+    # ==== Searching ====
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Scans the quantized codes of the chunks in scope and rescores the best candidates exactly."""
+        if query.query_embedding is None:
+            raise ValueError("The quantized vector store only supports queries by embedding.")
+        query_vector = self.normalise(np.asarray(query.query_embedding, dtype=np.float32))
+        top_k = query.similarity_top_k
+        candidate_count = top_k * max(self.rescore_multiplier, 1)
+        groups = self.filter_groups(query.filters)
+
+        with self._lock:
+            # Approximate scores of the best candidates of every segment
+            candidates: list[tuple[float, VectorSegment, int]] = []
+            for segment in self._segments:
+                if not segment.node_ids:
+                    continue
+                scores = segment.scores(query_vector)
+                if groups is not None:
+                    scores[~segment.group_mask(groups)] = -np.inf
+                deleted = self.deleted_rows(segment)
+                if len(deleted):
+                    scores[deleted] = -np.inf
+                rows = np.flatnonzero(np.isfinite(scores))
+                if len(rows) > candidate_count:
+                    rows = rows[np.argpartition(-scores[rows], candidate_count - 1)[:candidate_count]]
+                candidates.extend((float(scores[row]), segment, int(row)) for row in rows)
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            candidates = candidates[:candidate_count]
+
+            # Cosine similarity of the candidates against their float16 vectors
+            if self.rescore_multiplier > 1:
+                rescored = []
+                for segment in {id(segment): segment for _, segment, _ in candidates}.values():
+                    rows = [row for _, candidate_segment, row in candidates if candidate_segment is segment]
+                    rescored.extend(zip((segment.vectors(rows) @ query_vector).tolist(), [segment] * len(rows), rows))
+                candidates = sorted(rescored, key=lambda candidate: candidate[0], reverse=True)
+            candidates = candidates[:top_k]
+
+            return VectorStoreQueryResult(
+                nodes=[segment.node(row) for _, segment, row in candidates],
+                similarities=[score for score, _, _ in candidates],
+                ids=[segment.node_ids[row] for _, segment, row in candidates]
+            )
+
+    def deleted_rows(self, segment: VectorSegment) -> np.ndarray:
+        if segment.name not in self._deleted_rows:
+            deleted = self._deleted.get(segment.name, set())
+            self._deleted_rows[segment.name] = np.array(
+                [row for row, node_id in enumerate(segment.node_ids) if node_id in deleted], dtype=np.int64
+            )
+        return self._deleted_rows[segment.name]
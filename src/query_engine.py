@@ -1,41 +1,154 @@
 # Core Imports
 from llama_index.core import (
-    VectorStoreIndex, Document, StorageContext, Settings
+    VectorStoreIndex, Document, StorageContext
 )
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.readers.file import PyMuPDFReader
-from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.core.chat_engine import ContextChatEngine
-from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
-from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, ExactMatchFilter, FilterOperator
 from llama_index.core.base.llms.types import ChatMessage
-
-# Ollama Specific Imports
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.core.schema import BaseNode, NodeWithScore, MetadataMode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
 
 # Project Module Imports
 from src.config import settings
 from src.response_structures import (
-    SimpleResponse, ResearchResponse, SummaryResponse, ResponseTypes
+    SimpleResponse, ResearchResponse, CitedResearchResponse, SummaryResponse, ResponseTypes
 )
-from src.structured_prompt import RAG_PROMPT_TEMPLATE
+from src.structured_prompt import RAG_SYSTEM_PROMPT_TEMPLATE, RAG_CONTEXT_PROMPT_TEMPLATE
+from src.document_registry import DocumentRecord, DocumentRegistry
+from src.ingestion import IngestionPipeline, IngestionReport, PreparedDocument, ProgressCallback
+from src.pdf_parsing import read_title
+from src.sparse_index import BM25Index
+from src.quantized_store import QuantizedVectorStore
+from src.hybrid_retriever import HybridRetriever
+from src.answer_cache import SemanticAnswerCache
+from src.partial_json import PartialJSONParser
+from src.structured_output import repair_response, arepair_response
+from src.citations import CitationContext
+from src.context_assembly import ContextAssembler, ContextReport
+from src.telemetry import telemetry
+from src.scheduler import QueueFullError
+from src.application import get_application
 
 # Miscellaneous Imports
+from pydantic import BaseModel
 from pathlib import Path
+from dataclasses import asdict, dataclass
+from typing import AsyncGenerator, Any
+import functools
+import hashlib
 import json
-import chromadb
+import threading
+import time
 
 
-# Global Configuration of the Settings for Llama-Index
-Settings.llm = Ollama(
-    model=settings.llm_model_name, request_timeout=300.0, 
-    context_window=30000, additional_kwargs={"num_predict": 3072}
-)
-Settings.embed_model = OllamaEmbedding(settings.embedding_model_name)
-Settings.transformations = [SentenceSplitter(chunk_size=1024, chunk_overlap=120)]
+# Answer Cache shared by all the Query Engines
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.answer_cache_similarity, ttl_seconds=settings.answer_cache_ttl_seconds,
+    max_entries=settings.answer_cache_max_entries
+) if settings.answer_cache_enabled else None
+
+# Cache counters exported with the metrics
+if answer_cache is not None:
+    telemetry.register_collector("answer_cache", answer_cache.stats)
+
+
+# Chroma Client shared by all the Query Engines, created on first use
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+
+
+def get_chroma_client():
+    """Provides the Chroma Client of the vector store shared across the sessions."""
+    global _chroma_client
+    with _chroma_client_lock:
+        if _chroma_client is None:
+            # Imported here as Chroma is slow to import and unused by the quantized backend
+            import chromadb
+
+            _chroma_client = chromadb.PersistentClient(path=settings.vector_store_path)
+        return _chroma_client
+
+
+# Vector stores shared by all the Query Engines, one writer per collection
+_vector_stores: dict[str, BasePydanticVectorStore] = {}
+_vector_stores_lock = threading.Lock()
+
+
+def warm_up() -> None:
+    """Constructs the models and the client of the vector store ahead of the first document."""
+    get_application().warm_up()
+    if settings.vector_backend == "chroma":
+        get_chroma_client()
+
+
+def vector_backend_name() -> str:
+    """Provides the configured vector backend, the quantized backends are named by their quantization."""
+    if settings.vector_backend == "quantized":
+        return f"quantized_{settings.vector_quantization}"
+    return settings.vector_backend
+
+
+def get_vector_store(collection_name: str) -> BasePydanticVectorStore:
+    """Provides the vector store of a collection in the configured backend, Chroma or the quantized store."""
+    with _vector_stores_lock:
+        if collection_name not in _vector_stores:
+            if settings.vector_backend == "quantized":
+                _vector_stores[collection_name] = QuantizedVectorStore(
+                    settings.vector_store_path / "quantized" / collection_name,
+                    quantization=settings.vector_quantization, rescore_multiplier=settings.vector_rescore_multiplier
+                )
+            elif settings.vector_backend == "chroma":
+                from llama_index.vector_stores.chroma import ChromaVectorStore
+
+                chroma_collection = get_chroma_client().get_or_create_collection(collection_name)
+                _vector_stores[collection_name] = ChromaVectorStore(chroma_collection=chroma_collection)
+            else:
+                raise ValueError(f"Unsupported vector backend {settings.vector_backend}, expected chroma or quantized.")
+        return _vector_stores[collection_name]
+
+
+# Sparse indexes shared by all the Query Engines, one writer per index directory
+_sparse_indexes: dict[str, BM25Index] = {}
+_sparse_indexes_lock = threading.Lock()
+
+
+def get_sparse_index(collection_name: str) -> BM25Index:
+    """Provides the sparse BM25 Index stored next to a vector store collection."""
+    with _sparse_indexes_lock:
+        if collection_name not in _sparse_indexes:
+            _sparse_indexes[collection_name] = BM25Index(settings.vector_store_path / "sparse" / collection_name)
+        return _sparse_indexes[collection_name]
+
+
+@functools.cache
+def structured_system_message(response_model: type[BaseModel]) -> ChatMessage:
+    """Provides the system message with the schema of a response structure, rendered once per structure.
+
+    The message heads every prompt of its response type, so it must stay byte-identical across the turns
+    for Ollama to reuse the cached prefix."""
+    return ChatMessage(
+        role="system",
+        content=RAG_SYSTEM_PROMPT_TEMPLATE.format(schema=json.dumps(response_model.model_json_schema()))
+    )
+
+
+@dataclass
+class StreamUpdate:
+    """A partial structured response streamed from the LLM, the final update carries the validated response."""
+    data: dict
+    complete_keys: list[str]
+    response_json: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.response_json is not None
+
+    @classmethod
+    def final(cls, response_json: str) -> "StreamUpdate":
+        data = json.loads(response_json)
+        return cls(data=data, complete_keys=list(data), response_json=response_json)
 
 
 class QueryEngine:
@@ -44,12 +157,15 @@ class QueryEngine:
     It creates a vector index for the input files and constructs a Query Engine (soon extended to Chat Engine).
     The Query Engine encapsulates the end - to - end workflow executing the RAG pipeline with Gemma3n:e4b model."""
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(
+        self, filepath: str, progress_callback: ProgressCallback | None = None,
+        prepared_document: PreparedDocument | None = None, replace_previous_version: bool = False
+    ) -> None:
         """Class Constructor."""
         # List of all the documents loaded from VectorStores
         self.documents: list[Document] = []
         # VectorStore Object
-        self.vector_store: ChromaVectorStore
+        self.vector_store: BasePydanticVectorStore
         # Persist Storage
         self.storage_context: StorageContext
         # Calculated Indexes
@@ -59,67 +175,223 @@ class QueryEngine:
         self.index_registry: Path = settings.vector_store_path
         # PDF File Path
         self.file_path: Path = Path(filepath)
+        # Receives the page and chunk level progress of the ingestion
+        self.progress_callback = progress_callback
+        # Document already parsed and split by a bulk ingestion worker
+        self.prepared_document = prepared_document
+        # Whether the user confirmed that an older, explicitly versioned file of the document may be removed
+        self.replace_previous_version = replace_previous_version
+
+        # Content-Addressed Document Registry
+        self.document_registry = DocumentRegistry(self.index_registry / "document_registry.json")
+        self.doc_hash = DocumentRegistry.hash_file(self.file_path)
+        self.title = read_title(str(self.file_path)) or self.file_path.stem
+
+        # Vector Store of the corpus in the configured backend
+        self.collection_name = DocumentRegistry.collection_name_for(vector_backend_name())
+        self.vector_store = get_vector_store(self.collection_name)
+
+        # Sparse BM25 Index stored next to the vector store
+        self.sparse_index = get_sparse_index(self.collection_name)
 
-        # ChromaDB Client
-        self.chroma_client = chromadb.PersistentClient(path=self.index_registry)
-        self.collection_name = self.file_path.stem.lower()
-        self.chroma_collection = self.chroma_client.get_or_create_collection(self.collection_name)
+        # Documents targeted by the retrieval, the uploaded document unless widened, None targets the entire corpus
+        self.scope: list[str] | None = [self.doc_hash]
 
         # Chat Engine Parameters
         self.top_k = settings.top_k
         self.memory_buffer = ChatMemoryBuffer.from_defaults(token_limit=30000)
+
+        # Context Assembly packing the retrieved candidates and the history into the token budget
+        self.retrieval_candidates = max(settings.retrieval_candidates, self.top_k)
+        self.context_assembler = ContextAssembler(max_chunks=self.top_k)
+        # Oldest message of the history window, only moved once the window overflows to keep the prefix stable
+        self.history_start = 0
+        self.last_context_report: ContextReport | None = None
+        self.last_ingestion_report: IngestionReport | None = None
         self.query_engine = self.construct_chat_engine()
 
     def check_index_exists(self) -> bool:
-        """Checks if the index for a given file already exists."""
-        result = self.chroma_collection.get(
-            where={"file_path": str(self.file_path.resolve())},
-            limit=1
+        """Checks if a compatible index for the document content already exists in the corpus.
+
+        A registry entry created with a different embedding model or splitter settings, in a per-document collection
+        or in another vector backend, or whose chunks are no longer all in the corpus, is invalidated and its stale
+        vectors are dropped."""
+        record = self.document_registry.lookup(
+            self.doc_hash, settings.embedding_model_name, settings.chunk_size, settings.chunk_overlap
+        )
+        stored_node_ids = self.stored_node_ids(self.doc_hash)
+        if (
+            record is not None and record.collection_name == self.collection_name
+            and len(stored_node_ids) == record.chunk_count
+        ):
+            # Backfilling the sparse index for documents indexed before it existed
+            if not self.sparse_index.group_node_ids(self.doc_hash):
+                self.sparse_index.add(
+                    [
+                        (node.node_id, node.get_content(metadata_mode=MetadataMode.NONE))
+                        for node in self.stored_nodes(self.doc_hash)
+                    ],
+                    group=self.doc_hash
+                )
+            return True
+
+        # Dropping any stale vectors left behind for this document
+        if stored_node_ids:
+            self.vector_store.delete_nodes(node_ids=stored_node_ids)
+        self.sparse_index.delete_group(self.doc_hash)
+        if record is not None and record.collection_name == DocumentRegistry.legacy_collection_name_for(self.doc_hash):
+            self.drop_legacy_collection(record.collection_name)
+        self.document_registry.remove(self.doc_hash)
+        return False
+
+    def stored_node_ids(self, doc_hash: str) -> list[str]:
+        """Provides the ids of the chunks of a document stored in the vector store, without fetching the chunks."""
+        if not isinstance(self.vector_store, QuantizedVectorStore):
+            return self.vector_store.client.get(where={"doc_hash": doc_hash}, include=[])["ids"]
+        document_filter = MetadataFilters(filters=[ExactMatchFilter(key="doc_hash", value=doc_hash)])
+        return [node_id for node_id, _, _ in self.vector_store.select(None, document_filter)]
+
+    def stored_nodes(self, doc_hash: str, embeddings: bool = False) -> list[BaseNode]:
+        """Provides the chunks of a document stored in the vector store, optionally with their embeddings."""
+        if not isinstance(self.vector_store, QuantizedVectorStore):
+            stored = self.vector_store.client.get(
+                where={"doc_hash": doc_hash}, include=["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+            )
+            nodes = []
+            for idx, (text, metadata) in enumerate(zip(stored["documents"], stored["metadatas"])):
+                node = metadata_dict_to_node(metadata)
+                node.set_content(text)
+                if embeddings:
+                    node.embedding = [float(value) for value in stored["embeddings"][idx]]
+                nodes.append(node)
+            return nodes
+        document_filter = MetadataFilters(filters=[ExactMatchFilter(key="doc_hash", value=doc_hash)])
+        return self.vector_store.get_nodes(filters=document_filter, embeddings=embeddings)
+
+    def previous_version_nodes(self) -> tuple[DocumentRecord | None, list[BaseNode]]:
+        """Provides the record and the embedded chunks of the previous version of the document in the corpus."""
+        previous = self.document_registry.previous_version(
+            self.doc_hash, self.title, self.file_path.name, settings.embedding_model_name,
+            settings.chunk_size, settings.chunk_overlap
         )
-        return len(result["ids"]) > 0
+        if previous is None or previous.collection_name != self.collection_name:
+            return None, []
+        return previous, self.stored_nodes(previous.doc_hash, embeddings=True)
+
+    def drop_previous_version(self, previous_hash: str, previous_nodes: list[BaseNode]) -> None:
+        """Removes a previous version of the document superseded by this one from the corpus."""
+        if previous_nodes:
+            self.vector_store.delete_nodes(node_ids=[node.node_id for node in previous_nodes])
+        self.sparse_index.delete_group(previous_hash)
+        self.document_registry.remove(previous_hash)
+
+    def drop_legacy_collection(self, collection_name: str) -> None:
+        """Removes the collection and the sparse index of a document indexed before the shared corpus."""
+        try:
+            get_chroma_client().delete_collection(collection_name)
+        except Exception as e:
+            print(f"Legacy collection {collection_name} couldn't be removed: {e}")
+        BM25Index(self.index_registry / "sparse" / collection_name).clear()
 
     def construct_chat_engine(self) -> None:
         """Loads, Transforms and Indexes the input file / reloads them if exits and provides a query engine object."""
 
-        # Accessing the ChromaVectorStore and setting the storage
-        self.vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
+        # Validating the registry entry before attaching to the collection
+        index_exists = self.check_index_exists()
+
+        # Setting the storage on the vector store of the corpus
         self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
 
-        if not self.check_index_exists():
-            # Creating the Document from the specific file path
-            self.documents = PyMuPDFReader().load_data(file_path=self.file_path)
-            
-            # Uniquely storing the documents in the DB using Filepath
-            for doc in self.documents:
-                doc.metadata["file_path"] = str(self.file_path.resolve())
-
-            # Calculating the New Indexes for ChromaVectorStore
-            self.index = VectorStoreIndex.from_documents(
-                self.documents, embed_model=Settings.embed_model, 
-                show_progress=True, storage_context=self.storage_context, 
-                transformations=Settings.transformations
+        if not index_exists:
+            # Parsing, Embedding and Writing the document in parallel batches
+            ingestion_pipeline = IngestionPipeline(
+                embed_model=get_application().embed_model, vector_store=self.vector_store,
+                splitter=get_application().splitter, sparse_index=self.sparse_index,
+                progress_callback=self.progress_callback
             )
-        else:
-            # Loading the Indexes
-            self.index = VectorStoreIndex.from_vector_store(
-                vector_store=self.vector_store, storage_context=self.storage_context
+
+            # Reusing the embedded chunks of the pages unchanged since the previous version of the document
+            previous_record, previous_nodes = self.previous_version_nodes()
+
+            # Uniquely storing the documents in the DB using the content hash
+            with telemetry.span("ingest", doc=self.doc_hash) as span:
+                ingestion_report = ingestion_pipeline.run(
+                    self.file_path.resolve(), extra_info={"doc_hash": self.doc_hash, "title": self.title},
+                    previous_nodes=previous_nodes, prepared=self.prepared_document
+                )
+                if span is not None:
+                    span.update(pages=ingestion_report.pages, chunks=ingestion_report.chunks)
+            self.prepared_document = None
+            self.documents = ingestion_pipeline.documents
+            self.last_ingestion_report = ingestion_report
+            print(ingestion_report.summary())
+            # Only removing the previous version when it is explicitly superseded and the user confirmed it
+            if (
+                previous_record is not None and self.replace_previous_version
+                and self.document_registry.supersedes(self.file_path.name, previous_record)
+            ):
+                self.drop_previous_version(previous_record.doc_hash, previous_nodes)
+
+            # Registering the document content for reattaching on repeat uploads
+            self.document_registry.register(
+                doc_hash=self.doc_hash, collection_name=self.collection_name, file_name=self.file_path.name,
+                chunk_count=ingestion_report.chunks, embedding_model=settings.embedding_model_name,
+                chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap,
+                title=self.title, pages=ingestion_report.pages
             )
 
-        # Loading the Calculated Indexes for the correct document
-        filepath_filters = MetadataFilters(
-            filters=[
-                ExactMatchFilter(key="file_path", value=str(self.file_path.resolve()))
-            ]
+        # Loading the Indexes
+        self.index = VectorStoreIndex.from_vector_store(
+            vector_store=self.vector_store, storage_context=self.storage_context, embed_model=get_application().embed_model
         )
 
-        # Creating the Custom Retriever
-        self.custom_retriever = VectorIndexRetriever(
-            index=self.index, similarity_top_k=self.top_k, embed_model=Settings.embed_model,
-            vector_store_query_mode=VectorStoreQueryMode.SEMANTIC_HYBRID, alpha=0.5, filters=filepath_filters
+        self.custom_retriever = self.construct_retriever()
+
+    def document_filters(self) -> MetadataFilters | None:
+        """Provides the metadata filters restricting the retrieval to the documents in scope."""
+        if self.scope is None:
+            return None
+        if len(self.scope) == 1:
+            return MetadataFilters(filters=[ExactMatchFilter(key="doc_hash", value=self.scope[0])])
+        return MetadataFilters(filters=[MetadataFilter(key="doc_hash", value=self.scope, operator=FilterOperator.IN)])
+
+    def construct_retriever(self) -> HybridRetriever:
+        """Constructs the Custom Retriever fusing the dense and the sparse scores of the documents in scope.
+
+        Retrieving across documents widens the candidates and normalises the scores per document."""
+        across_documents = self.scope is None or len(self.scope) > 1
+        candidates = self.retrieval_candidates * (settings.corpus_candidate_multiplier if across_documents else 1)
+
+        # Loading the Calculated Indexes for the documents in scope
+        dense_retriever = VectorIndexRetriever(
+            index=self.index, similarity_top_k=candidates, embed_model=get_application().embed_model,
+            filters=self.document_filters()
         )
+        return HybridRetriever(
+            dense_retriever=dense_retriever, sparse_index=self.sparse_index, vector_store=self.vector_store,
+            embed_model=get_application().embed_model, similarity_top_k=candidates, alpha=settings.hybrid_alpha,
+            document_scope=self.scope, per_document=across_documents
+        )
+
+    def set_scope(self, doc_hashes: list[str] | None) -> None:
+        """Targets the retrieval at the given indexed documents, None targets the entire corpus."""
+        scope = None if doc_hashes is None else list(dict.fromkeys(doc_hashes)) or [self.doc_hash]
+        if scope != self.scope:
+            self.scope = scope
+            self.custom_retriever = self.construct_retriever()
+
+    @property
+    def scope_key(self) -> str:
+        """Provides the key of the documents in scope for the Answer Cache."""
+        if self.scope == [self.doc_hash]:
+            return self.doc_hash
+        if self.scope is None:
+            return "corpus"
+        return hashlib.sha256(",".join(sorted(self.scope)).encode("utf-8")).hexdigest()
     
-    def run_query(self, user_prompt: str, response_type: ResponseTypes) -> str:
-        """Runs a user prompt for query on the Query Engine."""
+    @staticmethod
+    def response_model(response_type: ResponseTypes) -> type[BaseModel]:
+        """Provides the structured response class for a response type."""
         map_response_types = {
             ResponseTypes.RESEARCH: ResearchResponse,
             ResponseTypes.SUMMARY: SummaryResponse,
@@ -129,28 +401,245 @@ class QueryEngine:
         query_response_type = map_response_types.get(response_type)
         if not query_response_type:
             raise ValueError("The chosen response type by the agent is invalid.")
+        return query_response_type
+
+    def generation_model(self, response_type: ResponseTypes) -> type[BaseModel]:
+        """Provides the structured class generated by the LLM, research responses cite the context chunks by ID."""
+        if response_type == ResponseTypes.RESEARCH:
+            return CitedResearchResponse
+        return self.response_model(response_type)
+
+    @staticmethod
+    def busy_response() -> str:
+        """Provides the response shown when a query is turned away by the full queue of the scheduler."""
+        busy_response = SimpleResponse(
+            answer="The Research Companion is busy with other requests right now. Please try again shortly."
+        )
+        return busy_response.model_dump_json(indent=4)
+
+    @staticmethod
+    def error_response(error: Exception | None = None) -> str:
+        """Provides the response shown when a query fails."""
+        if isinstance(error, QueueFullError):
+            return QueryEngine.busy_response()
+        error_response = SimpleResponse(
+            answer="""Sorry, I have encountered an issue processing your request.
+            This can happen sometimes when a document is loaded for the first time or 
+            the first query on a new document.
+            Could you please try asking the question again."""
+        )
+        return error_response.model_dump_json(indent=4)
+
+    def record_turn(self, user_prompt: str, response_json: str, context_report: ContextReport | None = None) -> None:
+        """Records a turn in the chat memory, committing the history window and the report of the context it was
+        answered with."""
+        if context_report is not None:
+            self.history_start = context_report.history_start
+            self.last_context_report = context_report
+        self.memory_buffer.put(ChatMessage(role="user", content=user_prompt))
+        self.memory_buffer.put(ChatMessage(role="assistant", content=response_json))
+
+    @staticmethod
+    def cacheable(response_type: ResponseTypes) -> bool:
+        """Checks if the answers of a response type are shared through the Answer Cache. Only the research answers
+        are, the simple answers and the summaries come from the chat history of the session rather than from the
+        documents."""
+        return answer_cache is not None and response_type == ResponseTypes.RESEARCH
+
+    def lookup_answer(self, user_prompt: str, response_type: ResponseTypes, query_embedding: list[float]) -> str | None:
+        """Looks up the answer of a previously asked, similar question on the same document."""
+        with telemetry.span("answer_cache", response_type=response_type.value) as span:
+            cached_response = answer_cache.lookup(self.scope_key, response_type, query_embedding)
+            if span is not None:
+                span["hit"] = cached_response is not None
+        if cached_response is not None:
+            self.record_turn(user_prompt, cached_response)
+        return cached_response
+
+    async def astore_answer(self, user_prompt: str, response_type: ResponseTypes, response_json: str) -> None:
+        """Shares an answer generated outside of the queries, such as a prefetched follow-up, through the Answer Cache."""
+        if not self.cacheable(response_type):
+            return
+        query_embedding = await get_application().embed_model.aget_query_embedding(user_prompt)
+        answer_cache.store(self.scope_key, response_type, user_prompt, query_embedding, response_json)
+
+    def build_messages(
+        self, user_prompt: str, response_type: ResponseTypes, retrieved_nodes: list[NodeWithScore]
+    ) -> tuple[list[ChatMessage], CitationContext, ContextReport]:
+        """Builds the messages of a turn: the instructions with the schema, the chat history and the question along
+        with its tagged chunks.
+
+        The instructions and the history form a prefix shared by consecutive turns, so Ollama only prefills the
+        new context and question. The history keeps the bare questions and the retrieved candidates and the
+        history are assembled into the token budget of the response type. Building the messages leaves the engine
+        untouched, the history window of the report is only committed once the turn is recorded, so a speculative
+        build can't move the window of the conversation."""
+        with telemetry.span("assemble", response_type=response_type.value) as span:
+            system_message = structured_system_message(self.generation_model(response_type))
+            fixed_tokens = self.context_assembler.count_tokens(system_message.content) + self.context_assembler.count_tokens(
+                RAG_CONTEXT_PROMPT_TEMPLATE.format(context_str="", question=user_prompt)
+            )
+            packed_nodes, packed_history, context_report = self.context_assembler.assemble(
+                user_prompt, response_type, retrieved_nodes, self.memory_buffer.get_all(), fixed_tokens, self.history_start
+            )
+
+            citation_context = CitationContext(packed_nodes)
+            messages = [
+                system_message,
+                *packed_history,
+                ChatMessage(
+                    role="user",
+                    content=RAG_CONTEXT_PROMPT_TEMPLATE.format(context_str=citation_context.context_str(), question=user_prompt)
+                )
+            ]
+
+            context_report.tokens_after = self.context_assembler.count_message_tokens(messages)
+            if span is not None:
+                span.update(asdict(context_report), prompt_tokens=context_report.tokens_after)
+        return messages, citation_context, context_report
+
+    def finalize_response(self, response_type: ResponseTypes, generated_output: BaseModel, citation_context: CitationContext) -> str:
+        """Resolves the citations by chunk ID of the validated response into the response structure."""
+        response_data = citation_context.resolve_response(generated_output.model_dump())
+        response_output = self.response_model(response_type).model_validate(response_data)
+        return response_output.model_dump_json(indent=4)
+
+    def run_query(self, user_prompt: str, response_type: ResponseTypes, use_cache: bool = True) -> str:
+        """Runs a user prompt for query on the Query Engine, serving repeated questions from the Answer Cache."""
+        query_response_type = self.generation_model(response_type)
+
+        # Looking up the answer of a previously asked, similar question on the same document
+        use_cache = use_cache and self.cacheable(response_type)
+        if use_cache:
+            query_embedding = get_application().embed_model.get_query_embedding(user_prompt)
+            cached_response = self.lookup_answer(user_prompt, response_type, query_embedding)
+            if cached_response is not None:
+                return cached_response
         
         try:
-            structured_llm = Settings.llm.as_structured_llm(query_response_type)
-            
-            chat_engine = ContextChatEngine.from_defaults(
-                retriever=self.custom_retriever, llm=structured_llm, 
-                memory=self.memory_buffer, context_template=RAG_PROMPT_TEMPLATE
+            retrieved_nodes = self.custom_retriever.retrieve(user_prompt)
+            messages, citation_context, context_report = self.build_messages(
+                user_prompt, response_type, retrieved_nodes
+            )
+            with telemetry.span("generate", response_type=response_type.value):
+                response_obj = get_application().llm().chat(messages, format=query_response_type.model_json_schema())
+            telemetry.record_tokens(response_obj.raw, response_type)
+
+            # Salvaging a truncated or malformed response, re-asking only for the fields it misses
+            generated_output = repair_response(
+                query_response_type, messages, response_obj.message.content, response_type.value
             )
-            
-            response_obj = chat_engine.chat(user_prompt)
-            response_json = json.loads(str(response_obj))
-            response_output = query_response_type.model_validate(response_json)
-            return response_output.model_dump_json(indent=4)
+            response_output_json = self.finalize_response(response_type, generated_output, citation_context)
+        except Exception as e:
+            print(f"Error during query: {e}")
+            return self.error_response(e)
+
+        self.record_turn(user_prompt, response_output_json, context_report)
+        if use_cache:
+            answer_cache.store(self.scope_key, response_type, user_prompt, query_embedding, response_output_json)
+        return response_output_json
+
+    async def agenerate(
+        self, user_prompt: str, response_type: ResponseTypes, retrieved_nodes: list[NodeWithScore]
+    ) -> tuple[str, ContextReport]:
+        """Asynchronously generates the validated response to a prompt over its retrieved nodes, without recording
+        the turn, along with the report of its context to commit once it is recorded."""
+        query_response_type = self.generation_model(response_type)
+        messages, citation_context, context_report = self.build_messages(user_prompt, response_type, retrieved_nodes)
+        with telemetry.span("generate", response_type=response_type.value):
+            response_obj = await get_application().llm().achat(messages, format=query_response_type.model_json_schema())
+        telemetry.record_tokens(response_obj.raw, response_type)
+
+        # Salvaging a truncated or malformed response, re-asking only for the fields it misses
+        generated_output = await arepair_response(
+            query_response_type, messages, response_obj.message.content, response_type.value
+        )
+        return self.finalize_response(response_type, generated_output, citation_context), context_report
+
+    async def arun_query(self, user_prompt: str, response_type: ResponseTypes, use_cache: bool = True) -> str:
+        """Asynchronously runs a user prompt for query on the Query Engine without blocking the event loop."""
+        # Looking up the answer of a previously asked, similar question on the same document
+        use_cache = use_cache and self.cacheable(response_type)
+        if use_cache:
+            query_embedding = await get_application().embed_model.aget_query_embedding(user_prompt)
+            cached_response = self.lookup_answer(user_prompt, response_type, query_embedding)
+            if cached_response is not None:
+                return cached_response
+
+        try:
+            retrieved_nodes = await self.custom_retriever.aretrieve(user_prompt)
+            response_output_json, context_report = await self.agenerate(user_prompt, response_type, retrieved_nodes)
         except Exception as e:
             print(f"Error during query: {e}")
-            error_response = SimpleResponse(
-                answer="""Sorry, I have encountered an issue processing your request.
-                This can happen sometimes when a document is loaded for the first time or 
-                the first query on a new document.
-                Could you please try asking the question again."""
+            return self.error_response(e)
+
+        self.record_turn(user_prompt, response_output_json, context_report)
+        if use_cache:
+            answer_cache.store(self.scope_key, response_type, user_prompt, query_embedding, response_output_json)
+        return response_output_json
+
+    async def astream_query(
+        self, user_prompt: str, response_type: ResponseTypes, use_cache: bool = True,
+        retrieved_nodes: list[NodeWithScore] | None = None
+    ) -> AsyncGenerator[StreamUpdate, Any]:
+        """Streams the structured response to a user prompt as the tokens arrive from the LLM.
+
+        Every delta updates an incremental JSON parse of the response, so the partially generated fields can be
+        rendered live. The final update carries the validated response, answers served from the Answer Cache
+        are yielded at once. Nodes already retrieved for the prompt, such as by the follow-up prefetch, skip the
+        retrieval."""
+        query_response_type = self.generation_model(response_type)
+
+        # Looking up the answer of a previously asked, similar question on the same document
+        use_cache = use_cache and self.cacheable(response_type)
+        if use_cache:
+            query_embedding = await get_application().embed_model.aget_query_embedding(user_prompt)
+            cached_response = self.lookup_answer(user_prompt, response_type, query_embedding)
+            if cached_response is not None:
+                yield StreamUpdate.final(cached_response)
+                return
+
+        try:
+            if retrieved_nodes is None:
+                retrieved_nodes = await self.custom_retriever.aretrieve(user_prompt)
+            messages, citation_context, context_report = self.build_messages(
+                user_prompt, response_type, retrieved_nodes
             )
-            return error_response.model_dump_json(indent=4)
+
+            # Constraining the generation to the JSON schema of the response
+            response_parser = PartialJSONParser()
+            stream_start = time.perf_counter()
+            with telemetry.span("generate", response_type=response_type.value) as span:
+                response_stream = await get_application().llm().astream_chat(
+                    messages, format=query_response_type.model_json_schema()
+                )
+                response_chunk = None
+                async for response_chunk in response_stream:
+                    if not response_chunk.delta:
+                        continue
+                    if span is not None and "ttft_ms" not in span:
+                        span["ttft_ms"] = round((time.perf_counter() - stream_start) * 1000, 3)
+                    response_parser.feed(response_chunk.delta)
+                    data, complete_keys = response_parser.snapshot()
+                    if "citations" in complete_keys:
+                        data = citation_context.resolve_response(data)
+                    yield StreamUpdate(data=data, complete_keys=complete_keys)
+            # The last chunk of the stream carries the token counts of the generation
+            telemetry.record_tokens(getattr(response_chunk, "raw", None), response_type)
+
+            generated_output = await arepair_response(
+                query_response_type, messages, response_parser.text, response_type.value
+            )
+            response_output_json = self.finalize_response(response_type, generated_output, citation_context)
+        except Exception as e:
+            print(f"Error during query: {e}")
+            yield StreamUpdate.final(self.error_response(e))
+            return
+
+        self.record_turn(user_prompt, response_output_json, context_report)
+        if use_cache:
+            answer_cache.store(self.scope_key, response_type, user_prompt, query_embedding, response_output_json)
+        yield StreamUpdate.final(response_output_json)
         
     def retrieve_memory(self) -> list[ChatMessage]:
         """Providing the necessary chat history for summary generation."""
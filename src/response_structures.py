@@ -14,6 +14,20 @@ class Citation(BaseModel):
         description="""A brief simplification of the verbatim text chunk from the source 
         document that supports the answer for better understanding."""
     )
+    document_title: str = Field(
+        default="", description="The title of the cited document when answering across several documents."
+    )
+
+
+class ChunkCitation(BaseModel):
+    """Class implements the Expected Structured response for the LLM when citing a chunk of the context by its ID."""
+    chunk_id: str = Field(
+        description="The ID of the context chunk that supports the answer, eg. C2."
+    )
+    simplification: str = Field(
+        description="""A brief simplification of the cited context chunk 
+        that supports the answer for better understanding."""
+    )
 
 
 class ResearchResponse(BaseModel):
@@ -31,6 +45,22 @@ class ResearchResponse(BaseModel):
     )
 
 
+class CitedResearchResponse(BaseModel):
+    """Class implements the Expected Structured response from the LLM's citing the context chunks by their IDs.
+    The citations are resolved into a ResearchResponse with the verbatim source text by the application."""
+    answer: str = Field(
+        description="""The primary, comprehensive answer to the user's query.
+        This text should be fully formatted in Markdown, including any equations using LaTeX syntax (eg. $ h=6.64 * 10 ^ {-34} $)."""
+    )
+    follow_up_questions: list[str] = Field(
+        description="""A maximum of three follow-up questions that the user's query relates to
+        as chain of thought prompts."""
+    )
+    citations: list[ChunkCitation] = Field(
+        description="A list of all the context chunks, cited by their IDs, that were used to formulate the answer."
+    )
+
+
 class SummaryResponse(BaseModel):
     """Class implements the expected structured response for a Summary from the LLM."""
     title: str = Field(
@@ -42,6 +72,30 @@ class SummaryResponse(BaseModel):
     )
 
 
+class ConceptSummary(BaseModel):
+    """Class implements the expected structured explanation of a single concept discussed in the conversation."""
+    concept: str = Field(
+        description="The name of the concept, reusing the exact name of an existing concept when updating it."
+    )
+    explanation: str = Field(
+        description="""A detailed, standalone explanation of the concept to study from, going beyond the conversation.
+        This text should be formatted in Markdown, including any equations using LaTeX syntax (eg. $E=mc^2$)."""
+    )
+
+
+class SummaryUpdateResponse(BaseModel):
+    """Class implements the expected structured update of the rolling conversation summary from the LLM."""
+    title: str = Field(
+        description="An academic title for the entire conversation so far."
+    )
+    abstract: str = Field(
+        description="A short narrative paragraph describing the overall topic and the user's objective so far."
+    )
+    concepts: list[ConceptSummary] = Field(
+        description="The concepts of the new exchanges, both the updated existing ones and the new ones."
+    )
+
+
 class SimpleResponse(BaseModel):
     """Class implements the expected structured response for a Simple Query to the LLM."""
     answer: str = Field(
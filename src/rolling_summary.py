@@ -0,0 +1,170 @@
+from llama_index.core.base.llms.types import ChatMessage
+
+from src.application import get_application
+from src.config import settings
+from src.executors import ExecutorKind, run_blocking
+from src.response_structures import SummaryResponse, SummaryUpdateResponse
+from src.scheduler import Priority, scheduler
+from src.structured_output import repair_response, arepair_response
+from src.structured_prompt import CONCEPT_DRIVEN_SUMMARY_PROMPT_TEMPLATE, CONCEPT_SUMMARY_UPDATE_TEMPLATE
+
+from pathlib import Path
+import asyncio
+import json
+import threading
+
+
+class RollingSummary:
+    """This class implements the running concept-driven summary of a conversation.
+
+    The research exchanges are queued as the turns complete and summarised in the background in small batches,
+    every update only sending the new exchanges along with the current concepts. Generating the summary of the
+    conversation is then a merge of the summarised concepts without replaying the chat history. The concepts
+    and the queued exchanges are persisted after every update and with the chat memory of the session, so a
+    rehydrated session can still export its summary."""
+
+    def __init__(self, path: Path | None = None, batch_exchanges: int | None = None, exchange_chars: int | None = None) -> None:
+        """Class Constructor."""
+        self.path = Path(path) if path else None
+        self.batch_exchanges = batch_exchanges or settings.summary_batch_exchanges
+        self.exchange_chars = exchange_chars or settings.summary_exchange_chars
+
+        # Summary State
+        self.title: str = ""
+        self.abstract: str = ""
+        self.concepts: dict[str, str] = {}
+        self.pending: list[tuple[str, str]] = []
+        self.summarized_exchanges = 0
+
+        # Background update draining the pending exchanges
+        self.task: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+        # Guards the summary file, written by the background update and by the checkpoints of the session
+        self.persist_lock = threading.Lock()
+
+        if self.path is not None and self.path.exists():
+            self.load()
+
+    # ==== Persistence ====
+    def export_state(self) -> dict:
+        return {
+            "title": self.title, "abstract": self.abstract, "concepts": self.concepts,
+            "pending": [list(exchange) for exchange in self.pending], "summarized_exchanges": self.summarized_exchanges
+        }
+
+    def load(self) -> None:
+        state = json.loads(self.path.read_text(encoding="utf-8"))
+        self.title = state.get("title", "")
+        self.abstract = state.get("abstract", "")
+        self.concepts = dict(state.get("concepts", {}))
+        self.pending = [tuple(exchange) for exchange in state.get("pending", [])]
+        self.summarized_exchanges = state.get("summarized_exchanges", 0)
+
+    def persist(self) -> None:
+        """Atomically writes the summary state."""
+        if self.path is None:
+            return
+        with self.persist_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.path.with_suffix(".tmp")
+            temp_file.write_text(json.dumps(self.export_state()), encoding="utf-8")
+            temp_file.replace(self.path)
+
+    # ==== Updates ====
+    @property
+    def is_empty(self) -> bool:
+        return not self.concepts and not self.pending
+
+    def queue(self, user_prompt: str, answer: str) -> None:
+        self.pending.append((user_prompt, answer[:self.exchange_chars]))
+
+    def schedule(self, user_prompt: str, answer: str) -> None:
+        """Queues an exchange and starts the background update unless it is already running."""
+        self.queue(user_prompt, answer)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.drain())
+
+    def update_messages(self, exchanges: list[tuple[str, str]]) -> list[ChatMessage]:
+        """Builds the messages updating the summary with a batch of exchanges."""
+        concepts = "\n".join(
+            f"- {concept}: {explanation[:200]}" for concept, explanation in self.concepts.items()
+        ) or "None"
+        exchanges_str = "\n\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in exchanges)
+        return [
+            ChatMessage(role="system", content=CONCEPT_DRIVEN_SUMMARY_PROMPT_TEMPLATE),
+            ChatMessage(role="user", content=CONCEPT_SUMMARY_UPDATE_TEMPLATE.format(
+                title=self.title or "None", abstract=self.abstract or "None", concepts=concepts, exchanges=exchanges_str
+            ))
+        ]
+
+    def apply_update(self, exchange_count: int, update: SummaryUpdateResponse) -> None:
+        """Merges the concepts of an update into the summary and dequeues its exchanges."""
+        self.title = update.title or self.title
+        self.abstract = update.abstract or self.abstract
+
+        existing = {concept.lower(): concept for concept in self.concepts}
+        for concept_summary in update.concepts:
+            concept = existing.get(concept_summary.concept.lower(), concept_summary.concept)
+            self.concepts[concept] = concept_summary.explanation
+
+        del self.pending[:exchange_count]
+        self.summarized_exchanges += exchange_count
+
+    async def drain(self) -> None:
+        """Summarises the pending exchanges batch by batch, keeping them queued when an update fails."""
+        async with self.lock:
+            while self.pending:
+                exchanges = self.pending[:self.batch_exchanges]
+                try:
+                    messages = self.update_messages(exchanges)
+                    with scheduler.priority(Priority.SUMMARY):
+                        response_obj = await get_application().llm().achat(messages, format=SummaryUpdateResponse.model_json_schema())
+                        update = await arepair_response(
+                            SummaryUpdateResponse, messages, response_obj.message.content, "summary_update"
+                        )
+                    self.apply_update(len(exchanges), update)
+                except Exception as e:
+                    print(f"Error during summary update: {e}")
+                    break
+                finally:
+                    await run_blocking(ExecutorKind.RETRIEVAL, self.persist)
+
+    def drain_sync(self) -> None:
+        """Summarises the pending exchanges without an event loop."""
+        while self.pending:
+            exchanges = self.pending[:self.batch_exchanges]
+            try:
+                messages = self.update_messages(exchanges)
+                with scheduler.priority(Priority.SUMMARY):
+                    response_obj = get_application().llm().chat(messages, format=SummaryUpdateResponse.model_json_schema())
+                    update = repair_response(SummaryUpdateResponse, messages, response_obj.message.content, "summary_update")
+                self.apply_update(len(exchanges), update)
+            except Exception as e:
+                print(f"Error during summary update: {e}")
+                break
+            finally:
+                self.persist()
+
+    async def stop(self) -> None:
+        """Cancels the background update, its exchanges stay pending until they are summarised."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.wait([self.task])
+
+    async def flush(self) -> None:
+        """Waits on the background update and summarises the exchanges still pending."""
+        if self.task is not None and not self.task.done():
+            await asyncio.wait([self.task])
+        await self.drain()
+
+    # ==== Merge ====
+    def merged(self) -> SummaryResponse:
+        """Merges the summarised concepts into the concept-driven summary of the conversation."""
+        if not self.concepts:
+            return SummaryResponse(
+                title="Sorry the summary title couldn't be processed.", summary="Sorry there is nothing to summarise yet."
+            )
+        sections = [f"**Conversation Abstract:**\n{self.abstract}", "**Key Concepts Revisited:**"]
+        for concept, explanation in self.concepts.items():
+            sections.append(f"---\n\n**Concept:** {concept}\n\n**In-Depth Explanation:** {explanation}")
+        return SummaryResponse(title=self.title, summary="\n\n".join(sections) + "\n\n---")
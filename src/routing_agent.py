@@ -1,50 +1,143 @@
-from llama_index.core import Settings
 from llama_index.core.tools import FunctionTool
 from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.core.chat_engine import SimpleChatEngine
-from llama_index.llms.ollama import Ollama
 from llama_index.core.agent.workflow import ReActAgent, AgentStream, ToolCallResult
+from llama_index.core.base.llms.types import ChatMessage
 
 from src.config import settings
-from src.query_engine import QueryEngine
-from src.structured_prompt import CONCEPT_DRIVEN_SUMMARY_PROMPT_TEMPLATE
+from src.query_engine import QueryEngine, StreamUpdate
+from src.ingestion import ProgressCallback
+from src.fast_router import FastRouter
+from src.rolling_summary import RollingSummary
+from src.prefetch import FollowUpPrefetcher
+from src.telemetry import telemetry
+from src.scheduler import Priority, scheduler
+from src.application import LLMRole, get_application
 from src.response_structures import (
-    ResponseTypes, ToolInput, SimpleResponse, SummaryResponse
+    ResponseTypes, ToolInput, SimpleResponse
 )
 
+from pathlib import Path
+from typing import AsyncGenerator, Any
 import json
 
 
-# Global Configurations
-Settings.llm = Ollama(
-    model=settings.llm_model_name, request_timeout=600.0,
-    context_window=30000, additional_kwargs={"num_predict": 4096}
-)
-
-
 class RoutingAgent:
     """Class that implements the Response Routing Agent."""
     
-    def __init__(self, file_path: str) -> None:
-        self.query_engine = QueryEngine(file_path)
-        self.agent_memory = ChatMemoryBuffer.from_defaults(token_limit=30000)
+    def __init__(
+        self, file_path: str, progress_callback: ProgressCallback | None = None, summary_path: Path | None = None
+    ) -> None:
+        self.query_engine = QueryEngine(file_path, progress_callback=progress_callback)
+        self.agent_memory = ChatMemoryBuffer.from_defaults(token_limit=settings.agent_memory_token_limit)
         self.routing_agent = self.construct_routing_agent()
+        self.fast_router = FastRouter(get_application().embed_model) if settings.fast_router_enabled else None
+        # Concept-driven summary updated in the background after every research turn
+        self.rolling_summary = RollingSummary(summary_path)
+        # Responses to the follow-up questions of the last research answer, prepared while the user reads it
+        self.prefetcher = FollowUpPrefetcher(self.query_engine) if settings.prefetch_follow_ups else None
+
+        # Whether the tools of the current turn may answer from the Answer Cache
+        self.use_answer_cache = True
 
     def construct_routing_agent(self) -> ReActAgent:
         """Constructs the routing agent by wrapping the tools into FunctionTools."""
         
         # Wrapping FunctionTools
-        research_tool = FunctionTool.from_defaults(fn=self.execute_research_query, fn_schema=ToolInput)
-        summary_tool = FunctionTool.from_defaults(fn=self.execute_summary_query, fn_schema=ToolInput)
-        simple_tool = FunctionTool.from_defaults(fn=self.execute_simple_query, fn_schema=ToolInput)
+        research_tool = FunctionTool.from_defaults(
+            fn=self.execute_research_query, async_fn=self.aexecute_research_query, fn_schema=ToolInput
+        )
+        summary_tool = FunctionTool.from_defaults(
+            fn=self.execute_summary_query, async_fn=self.aexecute_summary_query, fn_schema=ToolInput
+        )
+        simple_tool = FunctionTool.from_defaults(
+            fn=self.execute_simple_query, async_fn=self.aexecute_simple_query, fn_schema=ToolInput
+        )
 
         return ReActAgent(
             tools=[research_tool, summary_tool, simple_tool],
-            llm=Settings.llm, verbose=True, memory=self.agent_memory
+            llm=get_application().llm(LLMRole.ROUTING), verbose=True, memory=self.agent_memory
         )
 
-    async def resolve_route(self, user_prompt: str):
+    async def route_locally(self, user_prompt: str) -> ResponseTypes | None:
+        """Routes the obvious intents locally without the ReAct reasoning pass, None defers to the agent."""
+        if self.fast_router is None:
+            return None
+
+        with telemetry.span("route") as span, scheduler.priority(Priority.ROUTING):
+            decision = await self.fast_router.aclassify(user_prompt)
+            if span is not None:
+                span.update(
+                    method=decision.method, routed_to=getattr(decision.response_type, "value", "agent"),
+                    confidence=round(decision.confidence, 3), router_latency_ms=round(decision.latency_ms, 3)
+                )
+        telemetry.count("route_decisions_total", method=decision.method)
+        return decision.response_type
+
+    async def resolve_route(self, user_prompt: str, use_cache: bool = True):
         """Resolve the route to be used by for generating a response."""
+        self.use_answer_cache = use_cache
+        self.cancel_prefetch()
+
+        response_type = await self.route_locally(user_prompt)
+        with telemetry.tagged(response_type=response_type.value if response_type is not None else "agent"):
+            if response_type is not None:
+                response_json = await self.execute_route(user_prompt, response_type)
+            else:
+                response_json, response_type = await self.run_agent(user_prompt)
+        self.complete_turn(user_prompt, response_json, response_type)
+        return response_json, response_type
+
+    async def stream_route(
+        self, user_prompt: str, use_cache: bool = True
+    ) -> AsyncGenerator[tuple[StreamUpdate, ResponseTypes], Any]:
+        """Resolves the route for a prompt and streams the response as it is generated.
+
+        Locally routed research and simple prompts are streamed token by token, summaries and the prompts
+        left to the agent are yielded once complete. A prefetched follow-up question is answered at once, or
+        routed to research reusing its retrieval."""
+        self.use_answer_cache = use_cache
+
+        # Answering a prefetched follow-up, the prefetch of the other follow-ups is dropped either way
+        prefetched = self.prefetcher.take(user_prompt) if self.prefetcher is not None and use_cache else None
+        self.cancel_prefetch()
+        if prefetched is not None and prefetched.response_json is not None:
+            self.query_engine.record_turn(user_prompt, prefetched.response_json, prefetched.context_report)
+            self.record_turn(user_prompt, prefetched.response_json)
+            self.complete_turn(user_prompt, prefetched.response_json, ResponseTypes.RESEARCH)
+            yield StreamUpdate.final(prefetched.response_json), ResponseTypes.RESEARCH
+            # Caching the served answer as a generated one is, once it is rendered
+            await self.query_engine.astore_answer(user_prompt, ResponseTypes.RESEARCH, prefetched.response_json)
+            return
+
+        response_type = ResponseTypes.RESEARCH if prefetched is not None else await self.route_locally(user_prompt)
+        if response_type in (ResponseTypes.RESEARCH, ResponseTypes.SIMPLE):
+            retrieved_nodes = prefetched.retrieved_nodes if prefetched is not None else None
+            with telemetry.tagged(response_type=response_type.value):
+                async for update in self.query_engine.astream_query(
+                    user_prompt, response_type, use_cache, retrieved_nodes=retrieved_nodes
+                ):
+                    if update.done:
+                        self.record_turn(user_prompt, update.response_json)
+                        self.complete_turn(user_prompt, update.response_json, response_type)
+                    yield update, response_type
+            return
+
+        with telemetry.tagged(response_type=response_type.value if response_type is not None else "agent"):
+            if response_type is not None:
+                response_json = await self.execute_route(user_prompt, response_type)
+            else:
+                response_json, response_type = await self.run_agent(user_prompt)
+        self.complete_turn(user_prompt, response_json, response_type)
+        yield StreamUpdate.final(response_json), response_type
+
+    async def run_agent(self, user_prompt: str) -> tuple[str, ResponseTypes]:
+        """Runs the ReAct agent to pick and call the tool for a prompt, timed as a whole since the agent also runs
+        the tool it picks."""
+        with telemetry.span("agent"), scheduler.priority(Priority.ROUTING):
+            return await self.stream_agent(user_prompt)
+
+    async def stream_agent(self, user_prompt: str) -> tuple[str, ResponseTypes]:
+        """Streams the events of the ReAct agent until the tool it called returns."""
         response_json = None
         response_type = None
 
@@ -70,6 +163,76 @@ class RoutingAgent:
         final_response = SimpleResponse(answer=str(final_answer))
         return final_response.model_dump_json(indent=4), ResponseTypes.SIMPLE
     
+    async def execute_route(self, user_prompt: str, response_type: ResponseTypes) -> str:
+        """Runs the tool for a locally routed prompt and records the turn in the agent's memory."""
+        tools = {
+            ResponseTypes.RESEARCH: self.aexecute_research_query,
+            ResponseTypes.SUMMARY: self.aexecute_summary_query,
+            ResponseTypes.SIMPLE: self.aexecute_simple_query,
+        }
+        response_json = await tools[response_type](query=user_prompt)
+        self.record_turn(user_prompt, response_json)
+        return response_json
+
+    def record_turn(self, user_prompt: str, response_json: str) -> None:
+        """Keeps the agent's memory consistent for the prompts that still reach it."""
+        self.agent_memory.put(ChatMessage(role="user", content=user_prompt))
+        self.agent_memory.put(ChatMessage(role="assistant", content=response_json))
+
+    def complete_turn(self, user_prompt: str, response_json: str, response_type: ResponseTypes) -> None:
+        """Starts the background work following a turn, the summary update and the follow-up prefetch."""
+        self.summarize_turn(user_prompt, response_json, response_type)
+        if self.prefetcher is not None and response_type == ResponseTypes.RESEARCH:
+            self.prefetcher.schedule(response_json)
+
+    def cancel_prefetch(self) -> None:
+        """Cancels the follow-up prefetch once the user moves on."""
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+
+    def summarize_turn(self, user_prompt: str, response_json: str, response_type: ResponseTypes) -> None:
+        """Queues a research turn for the background update of the rolling summary."""
+        if response_type != ResponseTypes.RESEARCH or response_json in (
+            self.query_engine.error_response(), self.query_engine.busy_response()
+        ):
+            return
+        try:
+            answer = json.loads(response_json).get("answer", "")
+        except (ValueError, AttributeError):
+            return
+        if answer:
+            self.rolling_summary.schedule(user_prompt, answer)
+
+    def catch_up_summary(self) -> None:
+        """Queues the exchanges of the chat history for a session without a rolling summary yet."""
+        history = self.query_engine.retrieve_memory()
+        for user_message, assistant_message in zip(history, history[1:]):
+            if user_message.role != "user" or assistant_message.role != "assistant":
+                continue
+            try:
+                answer = json.loads(assistant_message.content or "").get("answer", "")
+            except (ValueError, AttributeError):
+                answer = assistant_message.content or ""
+            if answer:
+                self.rolling_summary.queue(user_message.content or "", answer)
+
+    def export_memory(self) -> dict[str, list[dict]]:
+        """Provides the chat memories of the Query Engine and the agent for persisting."""
+        return {
+            "query_engine": [message.model_dump(mode="json") for message in self.query_engine.memory_buffer.get_all()],
+            "agent": [message.model_dump(mode="json") for message in self.agent_memory.get_all()],
+        }
+
+    def restore_memory(self, memory: dict[str, list[dict]]) -> None:
+        """Rehydrates the chat memories from a persisted export."""
+        self.query_engine.memory_buffer.set([ChatMessage.model_validate(message) for message in memory.get("query_engine", [])])
+        self.agent_memory.set([ChatMessage.model_validate(message) for message in memory.get("agent", [])])
+
+    def memory_footprint(self) -> int:
+        """Estimates the bytes held by the chat memories."""
+        messages = self.query_engine.memory_buffer.get_all() + self.agent_memory.get_all()
+        return sum(len(message.content or "") for message in messages)
+
     def extract_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
         if query:
             return query
@@ -84,32 +247,51 @@ class RoutingAgent:
         It provides a detailed answer with citations."""
         
         extracted_query = self.extract_query(query, properties, **kwargs)
-        research_response = self.query_engine.run_query(extracted_query, ResponseTypes.RESEARCH)
+        with scheduler.priority(Priority.CHAT):
+            research_response = self.query_engine.run_query(extracted_query, ResponseTypes.RESEARCH, self.use_answer_cache)
         return research_response
+
+    async def aexecute_research_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
+        """Use this tool for questions that require looking up information in the document.
+        It provides a detailed answer with citations."""
+
+        extracted_query = self.extract_query(query, properties, **kwargs)
+        with scheduler.priority(Priority.CHAT):
+            return await self.query_engine.arun_query(extracted_query, ResponseTypes.RESEARCH, self.use_answer_cache)
     
     def execute_summary_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
         """Use this tool when the user asks for a summary of the conversation history.
         This query will specifically state 'Generate a summary'."""
 
-        extracted_query = self.extract_query(query, properties, **kwargs)
-
-        chat_history = self.query_engine.retrieve_memory()
-        summary_llm = Settings.llm.as_structured_llm(SummaryResponse)
-        summary_chat_engine = SimpleChatEngine.from_defaults(
-            llm=summary_llm, chat_history=chat_history,
-            system_prompt=CONCEPT_DRIVEN_SUMMARY_PROMPT_TEMPLATE
-        )
-        
-        summary_obj = summary_chat_engine.chat(extracted_query)
-        summary_json = json.loads(str(summary_obj))
-        summary_output = SummaryResponse.model_validate(summary_json)
-        summary_response = summary_output.model_dump_json(indent=4)
+        if self.rolling_summary.is_empty:
+            self.catch_up_summary()
+        self.rolling_summary.drain_sync()
+        summary_response = self.rolling_summary.merged().model_dump_json(indent=4)
         return summary_response
+
+    async def aexecute_summary_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
+        """Use this tool when the user asks for a summary of the conversation history.
+        This query will specifically state 'Generate a summary'."""
+
+        # Merging the concepts summarised after every turn, only the exchanges still pending are summarised now
+        if self.rolling_summary.is_empty:
+            self.catch_up_summary()
+        await self.rolling_summary.flush()
+        return self.rolling_summary.merged().model_dump_json(indent=4)
         
     def execute_simple_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
         """Use this tool for simple greetings, conversation fillers or questions that 
         do not require explicitly looking up the document."""
 
         extracted_query = self.extract_query(query, properties, **kwargs)
-        simple_response = self.query_engine.run_query(extracted_query, ResponseTypes.SIMPLE)
-        return simple_response
\ No newline at end of file
+        with scheduler.priority(Priority.CHAT):
+            simple_response = self.query_engine.run_query(extracted_query, ResponseTypes.SIMPLE, self.use_answer_cache)
+        return simple_response
+
+    async def aexecute_simple_query(self, query: str | None = None, properties: dict | None = None, **kwargs) -> str:
+        """Use this tool for simple greetings, conversation fillers or questions that 
+        do not require explicitly looking up the document."""
+
+        extracted_query = self.extract_query(query, properties, **kwargs)
+        with scheduler.priority(Priority.CHAT):
+            return await self.query_engine.arun_query(extracted_query, ResponseTypes.SIMPLE, self.use_answer_cache)
\ No newline at end of file
@@ -0,0 +1,291 @@
+from src.config import settings
+from src.telemetry import telemetry
+
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Iterator
+import asyncio
+import threading
+import time
+
+
+class Priority(IntEnum):
+    """Priority classes of the requests to Ollama, lower values are served first."""
+    CHAT = 0
+    ROUTING = 1
+    SUMMARY = 2
+    BULK = 3
+    PREFETCH = 4
+
+
+# Classes that may not take the slots reserved for the interactive requests
+BACKGROUND_PRIORITIES = (Priority.SUMMARY, Priority.BULK, Priority.PREFETCH)
+
+# Priority and session of the requests made within the current context
+_request_priority: ContextVar[Priority | None] = ContextVar("request_priority", default=None)
+_request_session: ContextVar[str] = ContextVar("request_session", default="")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a request is turned away because the queue of the scheduler is full."""
+
+
+class RequestCancelledError(RuntimeError):
+    """Raised in a caller whose queued request was cancelled."""
+
+
+@dataclass
+class Ticket:
+    """A request waiting for, or holding, a slot of the scheduler."""
+    priority: Priority
+    session: str
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    granted: bool = False
+    cancelled: bool = False
+    event: threading.Event | None = None
+    future: asyncio.Future | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+
+    def wake(self) -> None:
+        """Wakes the waiting caller once the ticket is granted or cancelled."""
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.resolve)
+
+    def resolve(self) -> None:
+        if self.future.done():
+            return
+        if self.cancelled:
+            self.future.set_exception(RequestCancelledError(f"The request of session {self.session} was cancelled"))
+        else:
+            self.future.set_result(None)
+
+
+class OllamaScheduler:
+    """This class implements the scheduler every request to the local Ollama goes through.
+
+    A fixed number of slots, matching the parallel requests Ollama serves, is granted to the waiting requests by
+    priority class, interactive chat first then routing, summaries, bulk embedding and speculative prefetch. Within a class the
+    sessions take turns, so a session with many queued requests can't hold back the others, and the background
+    classes never take the slots reserved for the interactive ones. The queue is bounded: once full, new
+    interactive requests are turned away with a QueueFullError while the bulk embeddings, already bounded by the
+    ingestion concurrency, keep queueing. Both threads and coroutines can wait on the scheduler, and the queued
+    requests of a session are cancelled when it leaves."""
+
+    def __init__(self, slots: int, max_queue: int, reserved_slots: int = 1) -> None:
+        """Class Constructor."""
+        self.slots = slots
+        self.max_queue = max_queue
+        self.reserved_slots = min(reserved_slots, slots - 1)
+
+        self._lock = threading.Lock()
+        self.running = 0
+        self.running_background = 0
+        # Queued tickets of every priority class, by session in turn order
+        self.queues: dict[Priority, OrderedDict[str, deque[Ticket]]] = {priority: OrderedDict() for priority in Priority}
+        self.queued = 0
+
+        # Counters
+        self.granted = {priority: 0 for priority in Priority}
+        self.wait_seconds = {priority: 0.0 for priority in Priority}
+        self.max_wait_seconds = {priority: 0.0 for priority in Priority}
+        self.rejected = 0
+        self.cancelled = 0
+
+    # ==== Request Context ====
+    @contextmanager
+    def priority(self, priority: Priority) -> Iterator[None]:
+        """Sets the priority of the requests made within the block."""
+        previous_priority = _request_priority.get()
+        _request_priority.set(priority)
+        try:
+            yield
+        finally:
+            _request_priority.set(previous_priority)
+
+    @contextmanager
+    def session(self, session_id: str) -> Iterator[None]:
+        """Attributes the requests made within the block to a session."""
+        previous_session = _request_session.get()
+        _request_session.set(session_id)
+        try:
+            yield
+        finally:
+            _request_session.set(previous_session)
+
+    # ==== Queue ====
+    def idle(self) -> bool:
+        """Whether nothing is waiting and a background request would get a slot straight away."""
+        with self._lock:
+            return self.queued == 0 and self.can_run(Priority.PREFETCH)
+
+    def can_run(self, priority: Priority) -> bool:
+        if self.running >= self.slots:
+            return False
+        return priority not in BACKGROUND_PRIORITIES or self.running_background < self.slots - self.reserved_slots
+
+    def start(self, ticket: Ticket) -> None:
+        """Marks a ticket as holding a slot, recording its wait."""
+        ticket.granted = True
+        self.running += 1
+        if ticket.priority in BACKGROUND_PRIORITIES:
+            self.running_background += 1
+        wait_seconds = time.perf_counter() - ticket.enqueued_at
+        self.granted[ticket.priority] += 1
+        self.wait_seconds[ticket.priority] += wait_seconds
+        self.max_wait_seconds[ticket.priority] = max(self.max_wait_seconds[ticket.priority], wait_seconds)
+
+    def enqueue(self, ticket: Ticket) -> None:
+        """Grants a slot straight away when one is free and nothing is waiting ahead, otherwise queues the ticket."""
+        with self._lock:
+            if self.can_run(ticket.priority) and not any(
+                self.queues[priority] for priority in Priority if priority <= ticket.priority
+            ):
+                self.start(ticket)
+                return
+            if self.queued >= self.max_queue and ticket.priority != Priority.BULK:
+                self.rejected += 1
+                raise QueueFullError(f"The Ollama queue is full with {self.queued} waiting requests")
+            self.queues[ticket.priority].setdefault(ticket.session, deque()).append(ticket)
+            self.queued += 1
+
+    def release(self, ticket: Ticket) -> None:
+        """Frees the slot of a ticket and grants the freed slots to the next tickets in turn."""
+        with self._lock:
+            if not ticket.granted:
+                return
+            ticket.granted = False
+            self.running -= 1
+            if ticket.priority in BACKGROUND_PRIORITIES:
+                self.running_background -= 1
+            woken = self.grant_next()
+        for next_ticket in woken:
+            next_ticket.wake()
+
+    def grant_next(self) -> list[Ticket]:
+        """Grants the free slots to the queued tickets by priority, taking the sessions of a class in turns."""
+        woken = []
+        for priority in Priority:
+            sessions = self.queues[priority]
+            while sessions and self.can_run(priority):
+                session, tickets = next(iter(sessions.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                self.queued -= 1
+                self.start(ticket)
+                woken.append(ticket)
+            if sessions and self.running >= self.slots:
+                break
+        return woken
+
+    def remove(self, ticket: Ticket) -> bool:
+        """Takes a ticket out of the queue, provides whether it was still queued."""
+        tickets = self.queues[ticket.priority].get(ticket.session)
+        if tickets is None or ticket not in tickets:
+            return False
+        tickets.remove(ticket)
+        if not tickets:
+            del self.queues[ticket.priority][ticket.session]
+        self.queued -= 1
+        return True
+
+    def abandon(self, ticket: Ticket) -> None:
+        """Withdraws the ticket of a caller that stopped waiting, freeing its slot if it was granted meanwhile."""
+        with self._lock:
+            if self.remove(ticket):
+                self.cancelled += 1
+                return
+        self.release(ticket)
+
+    def cancel_session(self, session_id: str) -> int:
+        """Cancels the queued requests of a session that left, provides the number cancelled."""
+        cancelled = []
+        with self._lock:
+            for sessions in self.queues.values():
+                for ticket in list(sessions.get(session_id, ())):
+                    self.remove(ticket)
+                    ticket.cancelled = True
+                    cancelled.append(ticket)
+            self.cancelled += len(cancelled)
+        for ticket in cancelled:
+            ticket.wake()
+        return len(cancelled)
+
+    # ==== Slots ====
+    def new_ticket(self, default_priority: Priority) -> Ticket:
+        priority = _request_priority.get()
+        return Ticket(priority=default_priority if priority is None else priority, session=_request_session.get())
+
+    def acquire(self, default_priority: Priority = Priority.CHAT) -> Ticket:
+        """Waits for a slot in a blocking caller."""
+        ticket = self.new_ticket(default_priority)
+        ticket.event = threading.Event()
+        with telemetry.span("queue_wait", priority=ticket.priority.name.lower()):
+            self.enqueue(ticket)
+            if not ticket.granted:
+                ticket.event.wait()
+        if ticket.cancelled:
+            raise RequestCancelledError(f"The request of session {ticket.session} was cancelled")
+        return ticket
+
+    async def aacquire(self, default_priority: Priority = Priority.CHAT) -> Ticket:
+        """Waits for a slot in a coroutine."""
+        ticket = self.new_ticket(default_priority)
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        with telemetry.span("queue_wait", priority=ticket.priority.name.lower()):
+            self.enqueue(ticket)
+            if not ticket.granted:
+                try:
+                    await ticket.future
+                except asyncio.CancelledError:
+                    self.abandon(ticket)
+                    raise
+        return ticket
+
+    @contextmanager
+    def slot(self, default_priority: Priority = Priority.CHAT) -> Iterator[Ticket]:
+        """Holds a slot for the block in a blocking caller."""
+        ticket = self.acquire(default_priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, default_priority: Priority = Priority.CHAT) -> AsyncIterator[Ticket]:
+        """Holds a slot for the block in a coroutine."""
+        ticket = await self.aacquire(default_priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict[str, float]:
+        """Provides the queue depth, the slots in use and the waits of every priority class for exporting."""
+        with self._lock:
+            stats = {"slots": self.slots, "running": self.running, "queued": self.queued,
+                     "rejected": self.rejected, "cancelled": self.cancelled}
+            for priority in Priority:
+                name = priority.name.lower()
+                stats[f"queued_{name}"] = sum(len(tickets) for tickets in self.queues[priority].values())
+                stats[f"mean_wait_ms_{name}"] = (
+                    self.wait_seconds[priority] / self.granted[priority] * 1000 if self.granted[priority] else 0.0
+                )
+                stats[f"max_wait_ms_{name}"] = self.max_wait_seconds[priority] * 1000
+        return stats
+
+
+# Scheduler shared by all the sessions and the ingestion
+scheduler = OllamaScheduler(
+    slots=settings.ollama_parallel_requests, max_queue=settings.ollama_max_queue,
+    reserved_slots=settings.ollama_reserved_slots
+)
+telemetry.register_collector("scheduler", scheduler.stats)
@@ -0,0 +1,209 @@
+from src.config import settings
+from src.document_registry import DocumentRegistry
+from src.executors import ExecutorKind, run_blocking
+from src.routing_agent import RoutingAgent
+from src.scheduler import scheduler
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import time
+
+
+# Estimated bytes held by an engine besides its chat memory
+SESSION_BASE_BYTES = 8 * 1024 * 1024
+
+# Human readable names of the ingestion stages
+STAGE_MESSAGES = {
+    "parse": "Parsing pages", "reuse": "Pages reused from the previous version", "embed": "Embedding chunks",
+    "write": "Storing chunks"
+}
+
+
+@dataclass
+class PooledSession:
+    """A Routing Agent of a browser session for a document, along with its construction task and progress."""
+    session_id: str
+    doc_hash: str
+    task: asyncio.Task | None = None
+    progress: str = "Preparing the document"
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    @property
+    def error(self) -> BaseException | None:
+        if not self.done:
+            return None
+        return asyncio.CancelledError() if self.task.cancelled() else self.task.exception()
+
+    @property
+    def agent(self) -> RoutingAgent | None:
+        """Provides the Routing Agent once it is constructed."""
+        if not self.done or self.failed:
+            return None
+        return self.task.result()
+
+    def footprint(self) -> int:
+        agent = self.agent
+        return SESSION_BASE_BYTES + (agent.memory_footprint() if agent is not None else 0)
+
+
+class SessionPool:
+    """This class implements the pool of per-session Routing Agents keyed by the session and the document.
+
+    The engines share the Chroma client and the model handles, the least recently used sessions are evicted
+    beyond the session and memory bounds and after an idle timeout. The chat memory of every session is
+    persisted after each turn and on eviction, so an evicted session is rehydrated on its next query."""
+
+    def __init__(
+        self, max_sessions: int | None = None, max_memory_mb: int | None = None,
+        idle_timeout_seconds: float | None = None, memory_path: Path | None = None
+    ) -> None:
+        """Class Constructor."""
+        self.max_sessions = max_sessions or settings.session_pool_max_sessions
+        self.max_memory_bytes = (max_memory_mb or settings.session_pool_max_memory_mb) * 1024 * 1024
+        self.idle_timeout_seconds = idle_timeout_seconds or settings.session_idle_timeout_seconds
+        self.memory_path = Path(memory_path or settings.vector_store_path / "sessions")
+
+        self.sessions: OrderedDict[tuple[str, str], PooledSession] = OrderedDict()
+
+        # Counters
+        self.created = 0
+        self.reused = 0
+        self.rehydrated = 0
+        self.evictions = 0
+
+    # ==== Persistence ====
+    def memory_file(self, session_id: str, doc_hash: str) -> Path:
+        session_key = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16]
+        return self.memory_path / f"{session_key}_{doc_hash[:16]}.json"
+
+    def summary_file(self, session_id: str, doc_hash: str) -> Path:
+        return self.memory_file(session_id, doc_hash).with_suffix(".summary.json")
+
+    def persist_memory(self, session_id: str, doc_hash: str, agent: RoutingAgent) -> None:
+        """Atomically writes the chat memory of a session."""
+        self.memory_path.mkdir(parents=True, exist_ok=True)
+        memory_file = self.memory_file(session_id, doc_hash)
+        temp_file = memory_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(agent.export_memory()), encoding="utf-8")
+        temp_file.replace(memory_file)
+        # Along with the exchanges still waiting for the background update of the summary
+        agent.rolling_summary.persist()
+
+    def build_agent(self, session_id: str, doc_hash: str, pdf_path: str, pooled_session: PooledSession) -> RoutingAgent:
+        """Constructs the Routing Agent of a session, rehydrating its persisted chat memory and rolling summary."""
+        def report_progress(stage: str, completed: int, total: int) -> None:
+            pooled_session.progress = f"{STAGE_MESSAGES.get(stage, stage)} {completed}/{total}"
+
+        agent = RoutingAgent(
+            pdf_path, progress_callback=report_progress, summary_path=self.summary_file(session_id, doc_hash)
+        )
+
+        memory_file = self.memory_file(session_id, doc_hash)
+        if memory_file.exists():
+            agent.restore_memory(json.loads(memory_file.read_text(encoding="utf-8")))
+            self.rehydrated += 1
+        return agent
+
+    # ==== Pool ====
+    async def ensure(self, session_id: str, pdf_path: str) -> PooledSession:
+        """Provides the pooled session of a document, constructing its engine in the background unless it exists."""
+        doc_hash = await run_blocking(ExecutorKind.RETRIEVAL, DocumentRegistry.hash_file, pdf_path)
+        key = (session_id, doc_hash)
+
+        pooled_session = self.sessions.get(key)
+        if pooled_session is not None and not pooled_session.failed:
+            self.reused += 1
+        else:
+            # Waiting on the engines being built for the same document, so it is only indexed once
+            pending_builds = [
+                pending.task for (_, pending_hash), pending in self.sessions.items()
+                if pending_hash == doc_hash and not pending.done
+            ]
+            pooled_session = PooledSession(session_id=session_id, doc_hash=doc_hash)
+            pooled_session.task = asyncio.create_task(self.construct(pooled_session, pdf_path, pending_builds))
+            self.sessions[key] = pooled_session
+            self.created += 1
+
+        pooled_session.last_used = time.monotonic()
+        self.sessions.move_to_end(key)
+        await self.evict(keep=key)
+        return pooled_session
+
+    async def construct(self, pooled_session: PooledSession, pdf_path: str, pending_builds: list[asyncio.Task]) -> RoutingAgent:
+        if pending_builds:
+            await asyncio.wait(pending_builds)
+        with scheduler.session(pooled_session.session_id):
+            return await run_blocking(
+                ExecutorKind.INDEXING, self.build_agent, pooled_session.session_id, pooled_session.doc_hash,
+                pdf_path, pooled_session
+            )
+
+    def latest(self, session_id: str) -> RoutingAgent | None:
+        """Provides the most recently used ready Routing Agent of a session."""
+        for (pooled_session_id, _), pooled_session in reversed(self.sessions.items()):
+            if pooled_session_id == session_id and pooled_session.agent is not None:
+                return pooled_session.agent
+        return None
+
+    async def checkpoint(self, pooled_session: PooledSession) -> None:
+        """Persists the chat memory of a session after a turn."""
+        agent = pooled_session.agent
+        if agent is not None:
+            pooled_session.last_used = time.monotonic()
+            key = (pooled_session.session_id, pooled_session.doc_hash)
+            if self.sessions.get(key) is pooled_session:
+                self.sessions.move_to_end(key)
+            await run_blocking(
+                ExecutorKind.RETRIEVAL, self.persist_memory, pooled_session.session_id, pooled_session.doc_hash, agent
+            )
+
+    async def evict(self, keep: tuple[str, str] | None = None) -> None:
+        """Evicts the idle sessions and the least recently used ones beyond the session and memory bounds.
+
+        Engines still being constructed are never evicted."""
+        now = time.monotonic()
+        evictable = [
+            key for key, pooled_session in self.sessions.items()
+            if key != keep and pooled_session.done
+        ]
+
+        evicted: list[PooledSession] = []
+        total_bytes = sum(pooled_session.footprint() for pooled_session in self.sessions.values())
+        for key in evictable:
+            pooled_session = self.sessions[key]
+            over_bounds = len(self.sessions) > self.max_sessions or total_bytes > self.max_memory_bytes
+            if not over_bounds and now - pooled_session.last_used <= self.idle_timeout_seconds:
+                continue
+            total_bytes -= pooled_session.footprint()
+            evicted.append(self.sessions.pop(key))
+
+        for pooled_session in evicted:
+            self.evictions += 1
+            if pooled_session.agent is not None:
+                pooled_session.agent.cancel_prefetch()
+                await pooled_session.agent.rolling_summary.stop()
+            await self.checkpoint(pooled_session)
+
+    def stats(self) -> dict[str, float]:
+        """Provides the counters of the pool for exporting."""
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "memory_bytes": sum(pooled_session.footprint() for pooled_session in self.sessions.values()),
+            "created": self.created,
+            "reused": self.reused,
+            "rehydrated": self.rehydrated,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,404 @@
+from pathlib import Path
+from collections import Counter
+import json
+import math
+import re
+import shutil
+import threading
+import unicodedata
+import numpy as np
+
+from src.merge_policy import select_merge
+
+
+# Words, LaTeX commands and the individual symbols, of which only the math operators are kept as terms
+TOKEN_PATTERN = re.compile(r"\\[a-zA-Z]+|\w+|[^\w\s]", re.UNICODE)
+# Operators outside of the Unicode math symbols
+OPERATOR_SYMBOLS = frozenset("*^")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which with".split()
+)
+
+
+def is_operator(token: str) -> bool:
+    """Checks if a token is a math operator, like `=`, `+` or `∑`, rather than punctuation."""
+    return len(token) == 1 and (unicodedata.category(token) == "Sm" or token in OPERATOR_SYMBOLS)
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits a text into lower cased terms, keeping LaTeX commands and math operators as terms."""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isalnum() or token == "_" or is_operator(token))
+    ]
+
+
+class Segment:
+    """An immutable, memory-mapped slice of the inverted index.
+
+    Every term in the segment owns the range `offsets[i]:offsets[i + 1]` of the posting arrays,
+    postings hold the segment-local document number and the term frequency. Every chunk belongs to a group,
+    the document it was split from, so the searches can be restricted to a set of documents."""
+
+    def __init__(self, segment_path: Path) -> None:
+        self.segment_path = segment_path
+        self.name = segment_path.name
+        self.term_ids: np.ndarray = np.load(segment_path / "term_ids.npy", mmap_mode="r")
+        self.offsets: np.ndarray = np.load(segment_path / "offsets.npy", mmap_mode="r")
+        self.postings_doc: np.ndarray = np.load(segment_path / "postings_doc.npy", mmap_mode="r")
+        self.postings_tf: np.ndarray = np.load(segment_path / "postings_tf.npy", mmap_mode="r")
+        self.doc_lengths: np.ndarray = np.load(segment_path / "doc_lengths.npy", mmap_mode="r")
+        self.node_ids: list[str] = json.loads((segment_path / "node_ids.json").read_text(encoding="utf-8"))
+
+        # Group names of the segment and the group number of every chunk, segments written before the groups have none
+        self.group_names: list[str | None] = [None]
+        self.group_ids: np.ndarray = np.zeros(len(self.node_ids), dtype=np.int32)
+        if (segment_path / "group_ids.npy").exists():
+            self.group_names = json.loads((segment_path / "group_names.json").read_text(encoding="utf-8"))
+            self.group_ids = np.load(segment_path / "group_ids.npy", mmap_mode="r")
+
+    def group_mask(self, groups: set[str]) -> np.ndarray:
+        """Provides the mask of the chunks belonging to any of the groups."""
+        group_numbers = [number for number, name in enumerate(self.group_names) if name in groups]
+        return np.isin(self.group_ids, group_numbers)
+
+    def postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """Provides the documents and term frequencies of a term in this segment."""
+        position = int(np.searchsorted(self.term_ids, term_id))
+        if position >= len(self.term_ids) or self.term_ids[position] != term_id:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+        start, stop = int(self.offsets[position]), int(self.offsets[position + 1])
+        return self.postings_doc[start:stop], self.postings_tf[start:stop]
+
+    @staticmethod
+    def write(
+        segment_path: Path, node_ids: list[str], doc_lengths: list[int], postings: dict[int, list[tuple[int, int]]],
+        groups: list[str | None] | None = None
+    ) -> None:
+        """Writes a segment from a mapping of term ids to (document number, term frequency) postings."""
+        term_ids = np.array(sorted(postings), dtype=np.int32)
+        lengths = [len(postings[int(term_id)]) for term_id in term_ids]
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        postings_doc = np.empty(int(offsets[-1]), dtype=np.int32)
+        postings_tf = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for position, term_id in enumerate(term_ids):
+            entries = postings[int(term_id)]
+            start = int(offsets[position])
+            postings_doc[start:start + len(entries)] = [doc for doc, _ in entries]
+            postings_tf[start:start + len(entries)] = [min(tf, np.iinfo(np.uint16).max) for _, tf in entries]
+        Segment.write_arrays(
+            segment_path, node_ids, np.array(doc_lengths, dtype=np.int32), term_ids, offsets, postings_doc, postings_tf,
+            groups
+        )
+
+    @staticmethod
+    def write_arrays(
+        segment_path: Path, node_ids: list[str], doc_lengths: np.ndarray, term_ids: np.ndarray, offsets: np.ndarray,
+        postings_doc: np.ndarray, postings_tf: np.ndarray, groups: list[str | None] | None = None
+    ) -> None:
+        """Writes a segment from its posting arrays, sorted by term id."""
+        segment_path.mkdir(parents=True, exist_ok=True)
+        np.save(segment_path / "term_ids.npy", term_ids.astype(np.int32))
+        np.save(segment_path / "offsets.npy", offsets.astype(np.int64))
+        np.save(segment_path / "postings_doc.npy", postings_doc.astype(np.int32))
+        np.save(segment_path / "postings_tf.npy", postings_tf.astype(np.uint16))
+        np.save(segment_path / "doc_lengths.npy", doc_lengths.astype(np.int32))
+        (segment_path / "node_ids.json").write_text(json.dumps(node_ids), encoding="utf-8")
+
+        groups = groups or [None] * len(node_ids)
+        group_names = list(dict.fromkeys(groups))
+        group_numbers = {name: number for number, name in enumerate(group_names)}
+        np.save(segment_path / "group_ids.npy", np.array([group_numbers[group] for group in groups], dtype=np.int32))
+        (segment_path / "group_names.json").write_text(json.dumps(group_names), encoding="utf-8")
+
+
+class BM25Index:
+    """This class implements a compact on-disk BM25 inverted index stored next to the Chroma collection.
+
+    Chunks are added incrementally as append-only segments of memory-mapped NumPy arrays, deleted chunks are
+    tombstoned and segments of a similar size are merged by the size-tiered merge policy, so searching only pages
+    in the posting lists of the query terms and a large corpus is never rewritten as a whole. The vocabulary is an
+    append-only log of the terms, of which the manifest records the committed length."""
+
+    def __init__(self, index_path: Path, k1: float = 1.5, b: float = 0.75) -> None:
+        """Class Constructor."""
+        self.index_path: Path = Path(index_path)
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self.vocabulary: dict[str, int] = {}
+        self.terms: list[str] = []
+        # Number of the terms already appended to the vocabulary log
+        self.persisted_terms: int = 0
+        self.next_segment: int = 0
+        self.segments: list[Segment] = []
+        # Tombstoned node ids per segment name
+        self.deleted: dict[str, set[str]] = {}
+        # Segment name of every live chunk
+        self.locations: dict[str, str] = {}
+        # Mask and total length of the live chunks per segment name, rebuilt after the tombstones of the segment change
+        self.live: dict[str, tuple[np.ndarray, int]] = {}
+        self.load()
+
+    # ==== Persistence ====
+    def load(self) -> None:
+        """Loads the vocabulary, the tombstones and memory-maps the segments."""
+        with self._lock:
+            manifest_path = self.index_path / "manifest.json"
+            if not manifest_path.exists():
+                return
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            if "vocabulary_size" in manifest:
+                self.terms = self.load_terms(manifest["vocabulary_size"])
+                self.persisted_terms = len(self.terms)
+            else:
+                # Vocabulary written as a whole before the log, moved into the log on the next persist
+                vocabulary = json.loads((self.index_path / "vocabulary.json").read_text(encoding="utf-8"))
+                self.terms = sorted(vocabulary, key=vocabulary.get)
+            self.vocabulary = {term: term_id for term_id, term in enumerate(self.terms)}
+            self.next_segment = manifest["next_segment"]
+            self.segments = [Segment(self.index_path / name) for name in manifest["segments"]]
+            self.deleted = {name: set(node_ids) for name, node_ids in manifest["deleted"].items()}
+            self.index_locations()
+
+    def load_terms(self, vocabulary_size: int) -> list[str]:
+        """Reads the committed terms of the vocabulary log, dropping any appended by an interrupted write."""
+        log_path = self.index_path / "vocabulary.jsonl"
+        lines = log_path.read_text(encoding="utf-8").splitlines() if log_path.exists() else []
+        if len(lines) > vocabulary_size:
+            temp_path = self.index_path / "vocabulary.jsonl.tmp"
+            temp_path.write_text("".join(f"{line}\n" for line in lines[:vocabulary_size]), encoding="utf-8")
+            temp_path.replace(log_path)
+        return [json.loads(line) for line in lines[:vocabulary_size]]
+
+    def index_locations(self) -> None:
+        self.locations, self.live = {}, {}
+        for segment in self.segments:
+            deleted = self.deleted.get(segment.name, set())
+            for node_id in segment.node_ids:
+                if node_id not in deleted:
+                    self.locations[node_id] = segment.name
+
+    def persist(self) -> None:
+        """Appends the new terms to the vocabulary log and atomically writes the manifest committing them, the
+        segments are written when they are created."""
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        if self.persisted_terms < len(self.terms):
+            with open(self.index_path / "vocabulary.jsonl", "a", encoding="utf-8") as log:
+                log.writelines(f"{json.dumps(term)}\n" for term in self.terms[self.persisted_terms:])
+            self.persisted_terms = len(self.terms)
+
+        manifest = {
+            "vocabulary_size": self.persisted_terms,
+            "next_segment": self.next_segment,
+            "segments": [segment.name for segment in self.segments],
+            "deleted": {name: sorted(node_ids) for name, node_ids in self.deleted.items() if node_ids},
+        }
+        temp_path = self.index_path / "manifest.json.tmp"
+        temp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        temp_path.replace(self.index_path / "manifest.json")
+        (self.index_path / "vocabulary.json").unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """Removes the entire index from disk."""
+        with self._lock:
+            shutil.rmtree(self.index_path, ignore_errors=True)
+            self.vocabulary, self.terms, self.persisted_terms = {}, [], 0
+            self.next_segment, self.segments, self.deleted = 0, [], {}
+            self.locations, self.live = {}, {}
+
+    # ==== Indexing ====
+    @property
+    def doc_count(self) -> int:
+        return len(self.locations)
+
+    def is_empty(self) -> bool:
+        return self.doc_count <= 0
+
+    def live_chunks(self, segment: Segment) -> tuple[np.ndarray, int]:
+        """Provides the mask of the chunks of a segment not tombstoned and their total length."""
+        if segment.name not in self.live:
+            deleted = self.deleted.get(segment.name, set())
+            mask = np.array([node_id not in deleted for node_id in segment.node_ids], dtype=bool)
+            self.live[segment.name] = (mask, int(np.sum(segment.doc_lengths[mask], dtype=np.int64)))
+        return self.live[segment.name]
+
+    def group_node_ids(self, group: str) -> list[str]:
+        """Provides the live chunks of a group."""
+        with self._lock:
+            node_ids = []
+            for segment in self.segments:
+                live_mask, _ = self.live_chunks(segment)
+                for local_doc in np.flatnonzero(segment.group_mask({group}) & live_mask):
+                    node_ids.append(segment.node_ids[local_doc])
+            return node_ids
+
+    def delete_group(self, group: str) -> None:
+        """Tombstones all the chunks of a group."""
+        with self._lock:
+            self.delete(self.group_node_ids(group))
+
+    def add(self, chunks: list[tuple[str, str]], group: str | None = None) -> None:
+        """Adds a batch of (node id, text) chunks of a group to the index as a new segment."""
+        if not chunks:
+            return
+        with self._lock:
+            node_ids: list[str] = []
+            doc_lengths: list[int] = []
+            postings: dict[int, list[tuple[int, int]]] = {}
+            for doc_number, (node_id, text) in enumerate(chunks):
+                terms = tokenize(text)
+                node_ids.append(node_id)
+                doc_lengths.append(len(terms))
+                for term, frequency in Counter(terms).items():
+                    term_id = self.vocabulary.get(term)
+                    if term_id is None:
+                        term_id = self.vocabulary[term] = len(self.terms)
+                        self.terms.append(term)
+                    postings.setdefault(term_id, []).append((doc_number, frequency))
+
+            # Re-adding a chunk replaces the previous version of it
+            self.delete(node_ids, persist=False)
+            segment_path = self.next_segment_path()
+            Segment.write(segment_path, node_ids, doc_lengths, postings, [group] * len(node_ids))
+            self.append_segment(Segment(segment_path))
+
+            self.merge_segments()
+            self.persist()
+
+    def next_segment_path(self) -> Path:
+        segment_path = self.index_path / f"segment_{self.next_segment:05d}"
+        self.next_segment += 1
+        return segment_path
+
+    def append_segment(self, segment: Segment) -> None:
+        self.segments.append(segment)
+        for node_id in segment.node_ids:
+            self.locations[node_id] = segment.name
+
+    def delete(self, node_ids: list[str], persist: bool = True) -> None:
+        """Tombstones chunks, they are dropped for good once their segment is merged."""
+        with self._lock:
+            for node_id in node_ids:
+                segment_name = self.locations.pop(node_id, None)
+                if segment_name is not None:
+                    self.deleted.setdefault(segment_name, set()).add(node_id)
+                    self.live.pop(segment_name, None)
+            if persist:
+                self.merge_segments()
+                self.persist()
+
+    def merge_segments(self) -> None:
+        """Merges the segments selected by the size-tiered merge policy until it selects none."""
+        while merge := select_merge(
+            [len(segment.node_ids) for segment in self.segments],
+            [len(self.deleted.get(segment.name, ())) for segment in self.segments]
+        ):
+            self.merge([self.segments[position] for position in merge])
+
+    def compact(self) -> None:
+        """Merges all the segments into one, dropping the tombstoned chunks."""
+        with self._lock:
+            if self.segments:
+                self.merge(list(self.segments))
+            self.persist()
+
+    def merge(self, segments: list[Segment]) -> None:
+        """Merges segments into a single new segment, dropping their tombstoned chunks. The postings are renumbered
+        and regrouped by term with array operations, leaving the other segments untouched."""
+        node_ids: list[str] = []
+        groups: list[str | None] = []
+        doc_lengths, term_ids, postings_doc, postings_tf = [], [], [], []
+        for segment in segments:
+            live_mask, _ = self.live_chunks(segment)
+            live_docs = np.flatnonzero(live_mask)
+            # Renumbering the live documents of the segment after those of the previous segments
+            renumbered = np.cumsum(live_mask, dtype=np.int64) - 1 + len(node_ids)
+            node_ids.extend(segment.node_ids[local_doc] for local_doc in live_docs)
+            groups.extend(segment.group_names[int(group_id)] for group_id in segment.group_ids[live_docs])
+            doc_lengths.append(np.asarray(segment.doc_lengths)[live_docs])
+
+            posting_terms = np.repeat(np.asarray(segment.term_ids), np.diff(segment.offsets))
+            kept = live_mask[segment.postings_doc]
+            term_ids.append(posting_terms[kept])
+            postings_doc.append(renumbered[segment.postings_doc[kept]])
+            postings_tf.append(np.asarray(segment.postings_tf)[kept])
+
+        merged = {segment.name for segment in segments}
+        self.segments = [segment for segment in self.segments if segment.name not in merged]
+        for name in merged:
+            self.deleted.pop(name, None)
+            self.live.pop(name, None)
+
+        if node_ids:
+            term_ids, postings_doc = np.concatenate(term_ids), np.concatenate(postings_doc)
+            order = np.lexsort((postings_doc, term_ids))
+            unique_terms, counts = np.unique(term_ids[order], return_counts=True)
+            offsets = np.zeros(len(unique_terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(counts)
+            segment_path = self.next_segment_path()
+            Segment.write_arrays(
+                segment_path, node_ids, np.concatenate(doc_lengths), unique_terms, offsets, postings_doc[order],
+                np.concatenate(postings_tf)[order], groups
+            )
+            self.append_segment(Segment(segment_path))
+        self.persist()
+
+        for segment in segments:
+            shutil.rmtree(segment.segment_path, ignore_errors=True)
+
+    # ==== Searching ====
+    def search(self, query: str, top_k: int, groups: set[str] | None = None) -> list[tuple[str, float, float]]:
+        """Scores the chunks against the query with BM25, optionally only the chunks of the given groups.
+
+        Provides the top (node id, score, coverage) triples, coverage being the fraction of the distinct
+        query terms contained in the chunk. The statistics are shared by all the groups."""
+        with self._lock:
+            query_terms = list(dict.fromkeys(tokenize(query)))
+            term_ids = [self.vocabulary[term] for term in query_terms if term in self.vocabulary]
+            doc_count = self.doc_count
+            if not term_ids or doc_count <= 0:
+                return []
+
+            # Statistics of the live chunks only
+            live = [self.live_chunks(segment) for segment in self.segments]
+            average_length = max(sum(length for _, length in live) / doc_count, 1.0)
+
+            # Document frequencies across all the segments
+            segment_postings = [[segment.postings(term_id) for term_id in term_ids] for segment in self.segments]
+            document_frequencies = [
+                sum(
+                    int(np.count_nonzero(live_mask[postings[idx][0]]))
+                    for postings, (live_mask, _) in zip(segment_postings, live)
+                )
+                for idx in range(len(term_ids))
+            ]
+
+            results: list[tuple[str, float, float]] = []
+            for segment, postings, (live_mask, _) in zip(self.segments, segment_postings, live):
+                scores = np.zeros(len(segment.node_ids), dtype=np.float32)
+                matched = np.zeros(len(segment.node_ids), dtype=np.int32)
+                lengths = np.asarray(segment.doc_lengths, dtype=np.float32)
+                for (docs, frequencies), document_frequency in zip(postings, document_frequencies):
+                    if len(docs) == 0:
+                        continue
+                    idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                    frequencies = np.asarray(frequencies, dtype=np.float32)
+                    normaliser = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                    scores[docs] += idf * frequencies * (self.k1 + 1) / (frequencies + normaliser)
+                    matched[docs] += 1
+
+                scores[~live_mask] = 0.0
+                if groups is not None:
+                    scores[~segment.group_mask(groups)] = 0.0
+
+                candidates = np.flatnonzero(scores)
+                for local_doc in candidates[np.argsort(-scores[candidates])][:top_k]:
+                    coverage = int(matched[local_doc]) / len(query_terms)
+                    results.append((segment.node_ids[local_doc], float(scores[local_doc]), coverage))
+
+            results.sort(key=lambda result: result[1], reverse=True)
+            return results[:top_k]
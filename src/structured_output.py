@@ -0,0 +1,91 @@
+from llama_index.core.base.llms.types import ChatMessage
+
+from src.application import get_application
+from src.partial_json import salvage_json
+from src.structured_prompt import REPAIR_PROMPT_TEMPLATE
+from src.telemetry import telemetry
+
+from pydantic import BaseModel, create_model
+
+
+def salvage_response(model: type[BaseModel], response_text: str, label: str) -> tuple[dict, list[str]]:
+    """Validates a structured response, salvaging the valid fields of a truncated or malformed one.
+
+    Provides the data of the response and the required fields still missing from it."""
+    with telemetry.span("validate", response_type=label) as span:
+        try:
+            data, missing_fields = model.model_validate_json(response_text).model_dump(), []
+            outcome = "valid"
+        except ValueError:
+            data, missing_fields = salvage_json(response_text, model)
+            outcome = "retry" if missing_fields else "salvaged"
+            print(f"Salvaged the {label} response, missing fields: {missing_fields or 'none'}")
+        if span is not None:
+            span["outcome"] = outcome
+
+    # Responses needing a retry are counted once its outcome is known
+    if outcome != "retry":
+        telemetry.count("structured_responses_total", response_type=label, outcome=outcome)
+    return data, missing_fields
+
+
+def repair_request(
+    model: type[BaseModel], messages: list[ChatMessage], response_text: str, missing_fields: list[str]
+) -> tuple[list[ChatMessage], type[BaseModel]]:
+    """Builds the messages and the model asking only for the missing fields of a response.
+
+    The messages of the turn are kept as the prefix so Ollama reuses their cached prompt, followed by the
+    response so far and the request for its missing fields."""
+    completion_model = create_model(
+        f"{model.__name__}Completion",
+        **{field: (model.model_fields[field].annotation, model.model_fields[field]) for field in missing_fields}
+    )
+    repair_messages = [
+        *messages,
+        ChatMessage(role="assistant", content=response_text),
+        ChatMessage(role="user", content=REPAIR_PROMPT_TEMPLATE.format(fields=", ".join(missing_fields)))
+    ]
+    return repair_messages, completion_model
+
+
+def complete_response(
+    model: type[BaseModel], data: dict, completion_model: type[BaseModel], completion_text: str, label: str
+) -> BaseModel:
+    """Merges the fields asked for again into the salvaged response, counting the outcome of the retry."""
+    completion_data, _ = salvage_json(completion_text, completion_model)
+    try:
+        response = model.model_validate({**data, **completion_data})
+    except ValueError:
+        telemetry.count("structured_responses_total", response_type=label, outcome="failed")
+        raise
+    telemetry.count("structured_responses_total", response_type=label, outcome="retried")
+    return response
+
+
+def repair_response(model: type[BaseModel], messages: list[ChatMessage], response_text: str, label: str) -> BaseModel:
+    """Validates a structured response, re-asking the LLM for the fields that could not be salvaged."""
+    data, missing_fields = salvage_response(model, response_text, label)
+    if not missing_fields:
+        return model.model_validate(data)
+
+    repair_messages, completion_model = repair_request(model, messages, response_text, missing_fields)
+    with telemetry.span("repair", response_type=label):
+        response_obj = get_application().llm().chat(repair_messages, format=completion_model.model_json_schema())
+    telemetry.record_tokens(response_obj.raw, label)
+    return complete_response(model, data, completion_model, response_obj.message.content, label)
+
+
+async def arepair_response(
+    model: type[BaseModel], messages: list[ChatMessage], response_text: str, label: str
+) -> BaseModel:
+    """Asynchronously validates a structured response, re-asking the LLM for the fields that could not be salvaged."""
+    data, missing_fields = salvage_response(model, response_text, label)
+    if not missing_fields:
+        return model.model_validate(data)
+
+    repair_messages, completion_model = repair_request(model, messages, response_text, missing_fields)
+    with telemetry.span("repair", response_type=label):
+        response_obj = await get_application().llm().achat(repair_messages, format=completion_model.model_json_schema())
+    telemetry.record_tokens(response_obj.raw, label)
+    return complete_response(model, data, completion_model, response_obj.message.content, label)
+
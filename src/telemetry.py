@@ -0,0 +1,230 @@
+from src.config import settings
+
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Iterator
+import bisect
+import json
+import queue
+import threading
+import time
+
+
+# Prefix of the exported metrics
+METRIC_PREFIX = "research_companion"
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Tags of the spans that also label the metrics, the session and the document only go to the trace
+METRIC_TAGS = ("response_type",)
+
+# Tags of the turn being served, inherited by every span of the turn including the ones run on the executors
+_trace_tags: ContextVar[dict[str, str]] = ContextVar("trace_tags", default={})
+
+# Shared no-op span, so a disabled span costs a single attribute lookup
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    """Cumulative latency histogram of a stage in the Prometheus layout."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Telemetry:
+    """This class implements the timing spans, counters and exports of the stages of a turn.
+
+    Every span records the latency of a stage tagged with the session, the document and the response type of the
+    turn. The latencies are aggregated into histograms and the token counts and cache lookups into counters, which
+    are served in the Prometheus text format by a local HTTP endpoint, while the spans are appended to a JSONL
+    trace by a background writer. When disabled, the spans are a shared no-op context manager."""
+
+    def __init__(self, enabled: bool = False, trace_path: Path | None = None) -> None:
+        """Class Constructor."""
+        self.enabled = enabled
+        self.trace_path = Path(trace_path) if trace_path else None
+
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple, Histogram] = {}
+        self.counters: dict[tuple, float] = {}
+        # Stats providers sampled at every scrape, such as the counters kept by the caches
+        self.collectors: dict[str, Callable[[], dict[str, float]]] = {}
+
+        self._trace_queue: queue.SimpleQueue[dict | None] = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+
+    # ==== Tags ====
+    @contextmanager
+    def tagged(self, **tags: Any) -> Iterator[None]:
+        """Tags the spans within the block, on top of the tags already set.
+
+        The previous tags are restored by value, so a streaming generator closed from another context never fails
+        to untag."""
+        previous_tags = _trace_tags.get()
+        _trace_tags.set({**previous_tags, **{key: str(value) for key, value in tags.items() if value is not None}})
+        try:
+            yield
+        finally:
+            _trace_tags.set(previous_tags)
+
+    # ==== Recording ====
+    def span(self, stage: str, **tags: Any):
+        """Times a stage of a turn, a no-op when the telemetry is disabled."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(stage, tags)
+
+    @contextmanager
+    def _span(self, stage: str, tags: dict[str, Any]) -> Iterator[dict]:
+        span_tags = {**_trace_tags.get(), **{key: str(value) for key, value in tags.items() if value is not None}}
+        attributes: dict[str, Any] = {}
+        status = "ok"
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            yield attributes
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(stage, started_at, time.perf_counter() - start, span_tags, status, attributes)
+
+    def record(
+        self, stage: str, started_at: float, seconds: float, tags: dict[str, str], status: str = "ok",
+        attributes: dict[str, Any] | None = None
+    ) -> None:
+        """Records a completed span in the histograms and the trace."""
+        key = (stage, *(tags.get(tag, "") for tag in METRIC_TAGS))
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(seconds)
+            if status != "ok":
+                self.counters[("span_errors_total", ("stage", stage))] = \
+                    self.counters.get(("span_errors_total", ("stage", stage)), 0) + 1
+        # Spans are only queued for the trace once its writer runs
+        if self._writer is not None:
+            self._trace_queue.put({
+                "stage": stage, "start": started_at, "duration_ms": round(seconds * 1000, 3), "status": status,
+                **tags, **(attributes or {})
+            })
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Adds to a counter, a no-op when the telemetry is disabled."""
+        if not self.enabled:
+            return
+        key = (name, *sorted((label, str(label_value)) for label, label_value in labels.items()))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_tokens(self, raw: Any, response_type: Any = None) -> None:
+        """Counts the prompt and completion tokens reported by Ollama in the raw response of a generation."""
+        if not self.enabled or not isinstance(raw, dict):
+            return
+        response_type = getattr(response_type, "value", response_type) or _trace_tags.get().get("response_type", "")
+        self.count("prompt_tokens_total", raw.get("prompt_eval_count") or 0, response_type=response_type)
+        self.count("completion_tokens_total", raw.get("eval_count") or 0, response_type=response_type)
+
+    def register_collector(self, name: str, collector: Callable[[], dict[str, float]]) -> None:
+        """Registers the stats of a component, sampled as gauges at every scrape."""
+        self.collectors[name] = collector
+
+    # ==== Exports ====
+    def render_metrics(self) -> str:
+        """Renders the histograms, the counters and the collected stats in the Prometheus text format."""
+        lines = [f"# TYPE {METRIC_PREFIX}_stage_duration_seconds histogram"]
+        with self._lock:
+            histograms = {key: (list(h.buckets), h.total, h.count) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        for (stage, *metric_tags), (buckets, total, count) in sorted(histograms.items()):
+            labels = [f'stage="{stage}"'] + [f'{tag}="{value}"' for tag, value in zip(METRIC_TAGS, metric_tags)]
+            cumulative = 0
+            for bound, bucket in zip((*LATENCY_BUCKETS, "+Inf"), buckets):
+                cumulative += bucket
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_bucket{{{",".join(labels)},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_sum{{{",".join(labels)}}} {total:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_count{{{",".join(labels)}}} {count}')
+
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for (counter_name, *labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    label_str = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{label_str}}} {value:g}")
+
+        for component, collector in sorted(self.collectors.items()):
+            try:
+                stats = collector()
+            except Exception:
+                continue
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {METRIC_PREFIX}_{component}_{stat} gauge")
+                    lines.append(f"{METRIC_PREFIX}_{component}_{stat} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_trace(self) -> None:
+        """Appends the queued spans to the JSONL trace, flushing whenever the queue runs empty."""
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.trace_path, "a", encoding="utf-8") as trace_file:
+            while (span := self._trace_queue.get()) is not None:
+                trace_file.write(json.dumps(span) + "\n")
+                if self._trace_queue.empty():
+                    trace_file.flush()
+
+    def start(self, port: int | None = None) -> None:
+        """Starts the trace writer and the metrics endpoint, when the telemetry is enabled."""
+        if not self.enabled:
+            return
+        if self.trace_path is not None and self._writer is None:
+            self._writer = threading.Thread(target=self.write_trace, name="trace-writer", daemon=True)
+            self._writer.start()
+        if port and self._server is None:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+            self._server.telemetry = self
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"Serving the metrics on http://127.0.0.1:{self._server.server_address[1]}/metrics")
+
+    def stop(self) -> None:
+        """Stops the metrics endpoint and flushes the trace."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._trace_queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the metrics in the Prometheus text format."""
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.telemetry.render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Telemetry shared by the whole application
+telemetry = Telemetry(
+    enabled=settings.telemetry_enabled,
+    trace_path=settings.trace_path or settings.vector_store_path / "trace.jsonl"
+)
@@ -0,0 +1,77 @@
+from src.document_registry import DocumentRegistry
+
+from pathlib import Path
+import tempfile
+import unittest
+
+
+class DocumentRegistryVersionTest(unittest.TestCase):
+    """Tests the detection of the versions of a paper, which decides when a document may be removed."""
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.registry = DocumentRegistry(Path(self.temp_dir.name) / "document_registry.json")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def register(self, doc_hash: str, file_name: str, title: str = "") -> None:
+        self.registry.register(
+            doc_hash, "corpus", file_name, chunk_count=1, embedding_model="nomic-embed-text",
+            chunk_size=512, chunk_overlap=64, title=title
+        )
+
+    def previous_version(self, doc_hash: str, file_name: str, title: str = ""):
+        return self.registry.previous_version(doc_hash, title, file_name, "nomic-embed-text", 512, 64)
+
+    def test_file_version(self) -> None:
+        self.assertEqual(DocumentRegistry.file_version("2401.01234v2.pdf"), ("2401.01234", 2))
+        self.assertEqual(DocumentRegistry.file_version("Paper_v3.pdf"), ("paper", 3))
+        self.assertEqual(DocumentRegistry.file_version("resnet-v1.pdf"), ("resnet", 1))
+        self.assertIsNone(DocumentRegistry.file_version("mobilenetv2.pdf"))
+        self.assertIsNone(DocumentRegistry.file_version("paper.pdf"))
+
+    def test_model_names_are_not_versions(self) -> None:
+        self.register("a", "mobilenetv2.pdf")
+        self.assertIsNone(self.previous_version("b", "mobilenetv3.pdf"))
+
+    def test_generic_titles_are_ignored(self) -> None:
+        for title in ("Untitled", "Microsoft Word - paper.docx", "Document1", "main.tex", "  "):
+            with self.subTest(title=title):
+                self.assertTrue(DocumentRegistry.is_generic_title(title, "paper.pdf"))
+        self.assertFalse(DocumentRegistry.is_generic_title("Attention Is All You Need", "paper.pdf"))
+
+        self.register("a", "first.pdf", title="Untitled")
+        self.assertIsNone(self.previous_version("b", "second.pdf", title="Untitled"))
+        self.register("c", "third.pdf", title="Microsoft Word - paper")
+        self.assertIsNone(self.previous_version("d", "fourth.pdf", title="Microsoft Word - paper"))
+
+    def test_shared_title_is_a_previous_version(self) -> None:
+        self.register("a", "attention.pdf", title="Attention Is All You Need")
+        previous = self.previous_version("b", "1706.03762v5.pdf", title="Attention  is all you need")
+        self.assertEqual(previous.doc_hash, "a")
+        # A shared title only allows reusing the embeddings, the files don't name explicit versions
+        self.assertFalse(DocumentRegistry.supersedes("1706.03762v5.pdf", previous))
+
+    def test_supersedes_only_older_explicit_versions(self) -> None:
+        self.register("a", "resnet-v1.pdf")
+        previous = self.previous_version("b", "resnet-v2.pdf")
+        self.assertEqual(previous.doc_hash, "a")
+        self.assertTrue(DocumentRegistry.supersedes("resnet-v2.pdf", previous))
+
+        # Indexing the older version after the newer one, as a restarted bulk ingestion does, removes nothing
+        self.register("b", "resnet-v2.pdf")
+        previous = self.previous_version("a", "resnet-v1.pdf")
+        self.assertEqual(previous.doc_hash, "b")
+        self.assertFalse(DocumentRegistry.supersedes("resnet-v1.pdf", previous))
+
+    def test_supersedes_requires_the_same_name(self) -> None:
+        self.register("a", "2401.01234v1.pdf")
+        record = self.registry.records["a"]
+        self.assertTrue(DocumentRegistry.supersedes("2401.01234v2.pdf", record))
+        self.assertFalse(DocumentRegistry.supersedes("2401.05678v2.pdf", record))
+        self.assertFalse(DocumentRegistry.supersedes("2401.01234.pdf", record))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+from src.fast_router import FastRouter
+from src.response_structures import ResponseTypes
+
+import unittest
+
+
+class FastRouterRulesTest(unittest.TestCase):
+    """Tests the keyword rules of the Fast Router, which answer without the agent or the embedding model."""
+
+    def setUp(self) -> None:
+        # The rules don't need the embedding model
+        self.router = FastRouter.__new__(FastRouter)
+
+    def classify(self, prompt: str) -> ResponseTypes | None:
+        return self.router.classify_by_rules(FastRouter.strip_filler(prompt))
+
+    def test_strip_filler(self) -> None:
+        self.assertEqual(FastRouter.strip_filler("ok what is BERT"), "what is BERT")
+        self.assertEqual(FastRouter.strip_filler("Great, so what is dropout?"), "what is dropout?")
+        self.assertEqual(FastRouter.strip_filler("hmm... okay, explain table 2"), "explain table 2")
+        self.assertEqual(FastRouter.strip_filler("well-known baselines"), "well-known baselines")
+        # Greetings and prompts only made of filler words are kept whole
+        self.assertEqual(FastRouter.strip_filler("ok thanks!"), "ok thanks!")
+        self.assertEqual(FastRouter.strip_filler("Thanks a lot"), "Thanks a lot")
+        self.assertEqual(FastRouter.strip_filler("so, hmm"), "so, hmm")
+
+    def test_greetings(self) -> None:
+        for prompt in ("Hi", "hello there!", "Thanks a lot", "ok", "ok thanks!", "Good morning, everyone"):
+            with self.subTest(prompt=prompt):
+                self.assertEqual(self.classify(prompt), ResponseTypes.SIMPLE)
+
+    def test_filler_before_a_question_is_not_a_greeting(self) -> None:
+        self.assertIsNone(self.classify("ok what is BERT"))
+        self.assertIsNone(self.classify("great what is dropout"))
+        self.assertEqual(self.classify("ok so what does table 2 show?"), ResponseTypes.RESEARCH)
+
+    def test_summaries(self) -> None:
+        self.assertEqual(self.classify("Can you summarize our conversation?"), ResponseTypes.SUMMARY)
+        self.assertEqual(self.classify("ok, give me a recap of this chat"), ResponseTypes.SUMMARY)
+        # A summary of the document is a research question
+        self.assertEqual(self.classify("Summarize the discussion section"), ResponseTypes.RESEARCH)
+        self.assertEqual(
+            self.classify("Can you summarize the discussion of the results in this paper?"), ResponseTypes.RESEARCH
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+from src.merge_policy import MERGE_FACTOR, select_merge, size_tier
+
+import unittest
+
+
+class MergePolicyTest(unittest.TestCase):
+    """Tests the size-tiered merge policy of the segmented indexes."""
+
+    def test_size_tier(self) -> None:
+        self.assertEqual(size_tier(0), 0)
+        self.assertEqual(size_tier(MERGE_FACTOR - 1), 0)
+        self.assertEqual(size_tier(MERGE_FACTOR), 1)
+        self.assertEqual(size_tier(MERGE_FACTOR ** 2), 2)
+
+    def test_merges_a_full_tier_only(self) -> None:
+        self.assertEqual(select_merge([1] * (MERGE_FACTOR - 1), [0] * (MERGE_FACTOR - 1)), [])
+        rows = [1000] + [1] * MERGE_FACTOR
+        self.assertEqual(select_merge(rows, [0] * len(rows)), list(range(1, MERGE_FACTOR + 1)))
+
+    def test_rewrites_a_mostly_deleted_segment(self) -> None:
+        self.assertEqual(select_merge([100, 100], [10, 60]), [1])
+
+    def test_tiers_use_the_live_rows(self) -> None:
+        # A segment of the next tier with some of its rows deleted falls into the tier of the small ones
+        rows = [MERGE_FACTOR + 1] + [1] * (MERGE_FACTOR - 1)
+        deleted = [MERGE_FACTOR // 2] + [0] * (MERGE_FACTOR - 1)
+        self.assertEqual(size_tier(rows[0]), 1)
+        self.assertEqual(select_merge(rows, deleted), list(range(MERGE_FACTOR)))
+
+    def test_repeated_merges_terminate(self) -> None:
+        rows = [1] * MERGE_FACTOR ** 3
+        merges = 0
+        while merge := select_merge(rows, [0] * len(rows)):
+            rows = [count for position, count in enumerate(rows) if position not in merge] + [
+                sum(rows[position] for position in merge)
+            ]
+            merges += 1
+        self.assertEqual(sorted(rows), [MERGE_FACTOR ** 3])
+        self.assertEqual(merges, MERGE_FACTOR ** 2 + MERGE_FACTOR + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+from src.partial_json import PartialJSONParser, parse_partial_json
+
+import json
+import unittest
+
+
+class PartialJSONParserTest(unittest.TestCase):
+    """Tests the incremental parse of the structured responses streamed to the chatbot."""
+
+    RESPONSE = json.dumps({
+        "answer": "Attention weighs the tokens \"softly\" — see eq. 1.",
+        "follow_up_questions": ["Why softmax?", "What is a head?"],
+        "citations": [{"page_number": 3, "source_text": "We propose"}],
+    })
+
+    def test_every_prefix_parses(self) -> None:
+        parser = PartialJSONParser()
+        previous_keys: list[str] = []
+        for char in self.RESPONSE:
+            parser.feed(char)
+            data, complete_keys = parser.snapshot()
+            self.assertIsInstance(data, dict)
+            # The complete members only ever grow, in the order of the response
+            self.assertEqual(complete_keys[:len(previous_keys)], previous_keys)
+            previous_keys = complete_keys
+        self.assertEqual(parser.snapshot(), (json.loads(self.RESPONSE), list(json.loads(self.RESPONSE))))
+
+    def test_open_string_is_closed(self) -> None:
+        data, complete_keys = parse_partial_json('{"answer": "Attention wei')
+        self.assertEqual(data, {"answer": "Attention wei"})
+        self.assertEqual(complete_keys, [])
+
+    def test_completed_members(self) -> None:
+        data, complete_keys = parse_partial_json('{"answer": "done", "follow_up_questions": ["Why')
+        self.assertEqual(data, {"answer": "done", "follow_up_questions": ["Why"]})
+        self.assertEqual(complete_keys, ["answer"])
+
+    def test_dangling_key_falls_back_to_the_boundary(self) -> None:
+        for text in ('{"answer": "done", "cita', '{"answer": "done", "citations":', '{"answer": "done", "n": tr'):
+            with self.subTest(text=text):
+                self.assertEqual(parse_partial_json(text)[0], {"answer": "done"})
+
+    def test_partial_escapes_are_dropped(self) -> None:
+        self.assertEqual(parse_partial_json('{"answer": "a\\')[0], {"answer": "a"})
+        self.assertEqual(parse_partial_json('{"answer": "a\\u20')[0], {"answer": "a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
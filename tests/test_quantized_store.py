@@ -0,0 +1,83 @@
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from src.quantized_store import QuantizedVectorStore
+
+from pathlib import Path
+import tempfile
+import unittest
+import numpy as np
+
+
+class QuantizedVectorStoreTest(unittest.TestCase):
+    """Tests the lookups and the deletions of the quantized vector store."""
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_path = Path(self.temp_dir.name) / "store"
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(40, 32)).astype(np.float32)
+        self.nodes = [
+            TextNode(id_=f"node-{number}", text=f"chunk {number}", embedding=vector.tolist(),
+                     metadata={"doc_hash": "a" if number < 20 else "b"})
+            for number, vector in enumerate(self.vectors)
+        ]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def make_store(self, quantization: str = "int8") -> QuantizedVectorStore:
+        store = QuantizedVectorStore(self.store_path, quantization=quantization)
+        store.add(self.nodes)
+        return store
+
+    @staticmethod
+    def document_filter(doc_hash: str) -> MetadataFilters:
+        return MetadataFilters(filters=[MetadataFilter(key="doc_hash", value=doc_hash, operator=FilterOperator.EQ)])
+
+    def test_empty_ids_select_nothing(self) -> None:
+        store = self.make_store()
+        self.assertEqual(store.get_nodes(node_ids=[]), [])
+        store.delete_nodes(node_ids=[])
+        self.assertEqual(store.count, len(self.nodes))
+        store.delete_nodes(node_ids=[], filters=self.document_filter("a"))
+        self.assertEqual(store.count, len(self.nodes))
+
+    def test_delete_nodes(self) -> None:
+        store = self.make_store()
+        store.delete_nodes(node_ids=["node-0", "node-1", "missing"])
+        self.assertEqual(store.count, len(self.nodes) - 2)
+        self.assertEqual(store.get_nodes(node_ids=["node-0", "node-2"])[0].node_id, "node-2")
+
+        store.delete_nodes(filters=self.document_filter("b"))
+        self.assertEqual({node.node_id for node in store.get_nodes()}, {f"node-{number}" for number in range(2, 20)})
+
+        # The tombstones survive reopening the store
+        reopened = QuantizedVectorStore(self.store_path)
+        self.assertEqual(reopened.count, 18)
+
+    def test_query_skips_deleted_nodes(self) -> None:
+        store = self.make_store()
+        query = VectorStoreQuery(query_embedding=self.vectors[5].tolist(), similarity_top_k=1)
+        self.assertEqual(store.query(query).ids, ["node-5"])
+        store.delete_nodes(node_ids=["node-5"])
+        self.assertNotIn("node-5", store.query(query).ids)
+
+    def test_rescoring_vectors(self) -> None:
+        for quantization in ("int8", "float16"):
+            with self.subTest(quantization=quantization):
+                store = self.make_store(quantization)
+                segment = store._segments[0]
+                unit_vectors = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+                np.testing.assert_allclose(segment.vectors([3, 1]), unit_vectors[[3, 1]], atol=1e-3)
+                # The rescoring vectors are stored in float16, and not at all next to float16 codes
+                vectors_path = segment.segment_path / "vectors.npy"
+                if quantization == "int8":
+                    self.assertEqual(np.load(vectors_path, mmap_mode="r").dtype, np.float16)
+                else:
+                    self.assertFalse(vectors_path.exists())
+                store.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+from src.response_structures import ConceptSummary, SummaryUpdateResponse
+from src.rolling_summary import RollingSummary
+
+from pathlib import Path
+import asyncio
+import tempfile
+import unittest
+
+
+class RollingSummaryTest(unittest.TestCase):
+    """Tests that the exchanges queued for the rolling summary survive the eviction of the session."""
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "session.summary.json"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_pending_exchanges_are_persisted(self) -> None:
+        summary = RollingSummary(self.path, batch_exchanges=2, exchange_chars=10)
+        summary.queue("What is attention?", "A weighting of the tokens")
+        summary.persist()
+
+        restored = RollingSummary(self.path)
+        self.assertEqual(restored.pending, [("What is attention?", "A weightin")])
+        self.assertFalse(restored.is_empty)
+
+    def test_apply_update_merges_concepts(self) -> None:
+        summary = RollingSummary(self.path, batch_exchanges=2, exchange_chars=100)
+        summary.concepts = {"Attention": "old"}
+        summary.queue("first", "answer")
+        summary.queue("second", "answer")
+        summary.apply_update(1, SummaryUpdateResponse(
+            title="Transformers", abstract="", concepts=[ConceptSummary(concept="attention", explanation="new")]
+        ))
+        self.assertEqual(summary.concepts, {"Attention": "new"})
+        self.assertEqual(summary.pending, [("second", "answer")])
+        self.assertEqual(summary.summarized_exchanges, 1)
+
+    def test_stop_keeps_the_pending_exchanges(self) -> None:
+        async def run() -> RollingSummary:
+            summary = RollingSummary(self.path)
+            summary.queue("What is attention?", "A weighting of the tokens")
+            summary.task = asyncio.create_task(asyncio.sleep(60))
+            await summary.stop()
+            self.assertTrue(summary.task.cancelled())
+            return summary
+
+        summary = asyncio.run(run())
+        self.assertEqual(len(summary.pending), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()